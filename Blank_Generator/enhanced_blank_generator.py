@@ -7,21 +7,35 @@ Developer: RAJKUMAR SINGH CHAUHAN
 
 import pandas as pd
 import openpyxl
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.drawing.image import Image
-from openpyxl.worksheet.hyperlink import Hyperlink
+import io
 import os
 import sys
 from datetime import datetime, timedelta
 
+# Shared work-order model lives in the repository root
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(SCRIPT_DIR))
+from division_profiles import DEFAULT_PROFILE, sheet_styles, signature_rows
+from parallel_workbook import assemble_workbook
+from sd_logging import get_logger, setup_logging
+from work_order_snapshot import load_fresh_snapshot
+from work_orders import WorkOrder, canonical_column_map, extract_fiscal_years, iter_work_orders, normalize_columns
+
+logger = get_logger('blank_generator')
+
 class BlankSecurityRefundGenerator:
     """Class to handle blank security refund sheet generation"""
     
-    def __init__(self, input_file=None):
-        """Initialize with optional input file path"""
-        self.input_file = input_file or self.find_input_file()
+    def __init__(self, input_file=None, profile=DEFAULT_PROFILE):
+        """Initialize with optional input file path and division profile
+        
+        The master is only looked for when a mode that reads it runs, so
+        count-driven blank stock works without any input file.
+        """
+        self.input_file = input_file
+        self.profile = profile
         self.output_dir = None
+        self._blank_package = None
         
     def find_input_file(self):
         """Find the work order master file in current directory or parent directories"""
@@ -34,27 +48,57 @@ class BlankSecurityRefundGenerator:
         
         for file_path in possible_files:
             if os.path.exists(file_path):
-                print(f"Found input file: {os.path.abspath(file_path)}")
+                logger.info("Found input file: %s", os.path.abspath(file_path))
                 return os.path.abspath(file_path)
         
         # If not found, prompt user
-        print("Work order master file not found in standard locations.")
-        print("Please ensure 'work_order_master.xlsx' is in one of these locations:")
+        logger.error("Work order master file not found in standard locations.")
+        logger.error("Please ensure 'work_order_master.xlsx' is in one of these locations:")
         for path in possible_files:
-            print(f"  - {os.path.abspath(path)}")
+            logger.error("  - %s", os.path.abspath(path))
         return None
 
     def read_excel_data(self, file_path, sheet_name='Work Orders'):
-        """Read data from Excel file Work Orders sheet"""
+        """Read data from Excel file Work Orders sheet (or its up-to-date snapshot)"""
         try:
+            snapshot = load_fresh_snapshot(file_path, sheet_name)
+            if snapshot is not None:
+                logger.info("Using snapshot %s of %s", snapshot.version, file_path)
+                return snapshot.frame()
             xl_file = pd.ExcelFile(file_path)
-            print(f"Available sheets: {xl_file.sheet_names}")
-            df = pd.read_excel(file_path, sheet_name=sheet_name)
-            print(f"Successfully read {len(df)} rows from {sheet_name} sheet")
-            print(f"Columns: {list(df.columns)}")
+            logger.debug("Available sheets: %s", xl_file.sheet_names)
+            df = normalize_columns(pd.read_excel(xl_file, sheet_name=sheet_name))
+            logger.info("Successfully read %d rows from %s sheet", len(df), sheet_name)
+            logger.debug("Columns: %s", list(df.columns))
             return df
         except Exception as e:
-            print(f"Error reading Excel file: {e}")
+            logger.error("Error reading Excel file: %s", e)
+            return None
+
+    def read_name_columns(self, file_path, sheet_name='Work Orders'):
+        """Only (contractor, agreement no.) pairs, streamed in read-only mode
+        
+        Sheet names are all the blank forms need, so the other columns are
+        never parsed.
+        """
+        try:
+            wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+            try:
+                rows = wb[sheet_name].iter_rows(values_only=True)
+                header = next(rows, ())
+                positions = {canonical: header.index(column)
+                             for column, canonical in canonical_column_map(header).items()}
+                contractor_col = positions['Name of Contractor']
+                agreement_col = positions['Agreement No.']
+                names = [(row[contractor_col], row[agreement_col]) for row in rows
+                         if len(row) > max(contractor_col, agreement_col)
+                         and (row[contractor_col] is not None or row[agreement_col] is not None)]
+            finally:
+                wb.close()
+            logger.info("Read %d contractor/agreement pairs from %s sheet", len(names), sheet_name)
+            return names
+        except Exception as e:
+            logger.error("Error reading name columns: %s", e)
             return None
 
     def create_sheet_name(self, vendor, agreement_no):
@@ -77,40 +121,35 @@ class BlankSecurityRefundGenerator:
             sheet_name = sheet_name.strip()
             return sheet_name
         except Exception as e:
-            print(f"Error creating sheet name: {e}")
+            logger.warning("Error creating sheet name: %s", e)
             return f"Work_{str(agreement_no).split('/')[0] if '/' in str(agreement_no) else str(agreement_no)}"
 
-    def create_single_work_sheet(self, wb, row, work_idx):
+    def create_single_work_sheet(self, wb, work, work_idx):
         """Create a single work sheet with enhanced formatting"""
-        # Get vendor name, agreement number, and work name from row
-        vendor_name = row.get('Name of Contractor', '')
-        agreement_no = row.get('Agreement No.', '')
-        name_of_work = row.get('Name of Work', '')
+        # Get vendor name and agreement number from the work order record
+        vendor_name = work.contractor
+        agreement_no = work.agreement_no
         
         sheet_name = self.create_sheet_name(vendor_name, agreement_no or 'NoAgreement')
         ws = wb.create_sheet(title=sheet_name)
 
-        # Define enhanced styles
-        title_font = Font(bold=True, size=16, color='000080')
-        header_font = Font(bold=True, size=12, color='000000')
-        normal_font = Font(size=11, color='000000')
-        small_font = Font(size=10, color='000000')
-        value_font = Font(size=11, bold=True, color='000000')
-        center_alignment = Alignment(horizontal='center', vertical='center')
-        left_alignment = Alignment(horizontal='left', vertical='center')
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        header_fill = PatternFill(start_color='E6E6FA', end_color='E6E6FA', fill_type='solid')
+        # Shared styles for this division (built once per profile)
+        styles = sheet_styles(self.profile)
+        title_font = styles['title_font']
+        header_font = styles['header_font']
+        normal_font = styles['normal_font']
+        small_font = styles['small_font']
+        center_alignment = styles['center_alignment']
+        left_alignment = styles['left_alignment']
+        wrap_alignment = styles['wrap_alignment']
+        thin_border = styles['thin_border']
+        header_fill = styles['header_fill']
 
         current_row = 1
 
         # Main title
         ws.merge_cells(f'A{current_row}:E{current_row}')
-        ws[f'A{current_row}'] = "ORDER FOR REFUND OF SECURITY DEPOSIT [RWMF 119]"
+        ws[f'A{current_row}'] = self.profile.form_title
         ws[f'A{current_row}'].font = title_font
         ws[f'A{current_row}'].alignment = center_alignment
         ws[f'A{current_row}'].fill = header_fill
@@ -145,7 +184,7 @@ class BlankSecurityRefundGenerator:
                 ws.merge_cells(f'A{current_row}:E{current_row}')
                 ws[f'A{current_row}'] = field_label
                 ws[f'A{current_row}'].font = normal_font
-                ws[f'A{current_row}'].alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
+                ws[f'A{current_row}'].alignment = wrap_alignment
             # Special handling for Name of Contractor (field 1)
             elif field_num == 1:
                 ws[f'A{current_row}'] = field_label
@@ -230,7 +269,7 @@ class BlankSecurityRefundGenerator:
                 ws.merge_cells(f'A{current_row}:E{current_row}')
                 ws[f'A{current_row}'] = cert_item
                 ws[f'A{current_row}'].font = small_font
-                ws[f'A{current_row}'].alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
+                ws[f'A{current_row}'].alignment = wrap_alignment
                 ws.row_dimensions[current_row].height = 40
             else:
                 ws[f'A{current_row}'] = cert_item
@@ -240,10 +279,7 @@ class BlankSecurityRefundGenerator:
 
         current_row += 1
         # Signature section
-        signature_items = [
-            ("Divisional Accountant", "Assistant Engineer", "Executive Engineer"),
-            ("", "", "PWD Electric Div.- Udaipur")
-        ]
+        signature_items = signature_rows(self.profile)
         
         for sig_row in signature_items:
             for col_idx, sig_text in enumerate(sig_row):
@@ -277,13 +313,29 @@ class BlankSecurityRefundGenerator:
         ws.page_setup.fitToHeight = 1
         ws.print_options.horizontalCentered = True
 
+    def blank_package(self):
+        """One rendered blank form as xlsx bytes, built once and stamped for every copy"""
+        if self._blank_package is None:
+            wb = openpyxl.Workbook()
+            wb.remove(wb.active)
+            self.create_single_work_sheet(wb, WorkOrder(), 1)
+            buffer = io.BytesIO()
+            wb.save(buffer)
+            self._blank_package = buffer.getvalue()
+        return self._blank_package
+
+    def stamp_workbook(self, sheet_names):
+        """Workbook with one copy of the prebuilt blank form per sheet name"""
+        package = self.blank_package()
+        return assemble_workbook([package] * len(sheet_names), sheet_names=sheet_names)
+
     def create_security_refund_sheet(self, data_batch, batch_number, agreement_year=None):
         """Create security refund sheet for a batch of data"""
         wb = openpyxl.Workbook()
         wb.remove(wb.active)  # Remove default sheet
         
-        for work_idx, (_, row) in enumerate(data_batch.iterrows(), 1):
-            self.create_single_work_sheet(wb, row, work_idx)
+        for work_idx, work in enumerate(iter_work_orders(data_batch), 1):
+            self.create_single_work_sheet(wb, work, work_idx)
         
         return wb
 
@@ -292,79 +344,112 @@ class BlankSecurityRefundGenerator:
         batches = []
         total_rows = len(df)
         for i in range(0, total_rows, batch_size):
-            batch = df.iloc[i:i+batch_size].copy()
+            batch = df.iloc[i:i+batch_size]
             batches.append((batch, (i // batch_size) + 1))
         return batches
 
     def get_agreement_year_from_data(self, df):
         """Extract agreement year from data"""
         try:
-            if 'Agreement No' in df.columns:
-                sample_agreement = str(df['Agreement No'].iloc[0]) if not df.empty else ''
-                if len(sample_agreement) >= 4:
-                    for i in range(len(sample_agreement) - 3):
-                        year_candidate = sample_agreement[i:i+4]
-                        if year_candidate.isdigit() and 2000 <= int(year_candidate) <= 2030:
-                            return year_candidate
+            if 'Agreement No.' in df.columns and not df.empty:
+                fiscal_years = extract_fiscal_years(df['Agreement No.'])
+                known_years = fiscal_years[fiscal_years != 'Unknown']
+                if not known_years.empty:
+                    return known_years.mode().iloc[0][:4]
             return datetime.now().strftime('%Y')
         except Exception:
             return datetime.now().strftime('%Y')
 
+    def make_output_dir(self):
+        self.output_dir = f"BLANK_SD_SHEETS_{datetime.now().strftime('%d-%m-%Y_%H-%M')}"
+        os.makedirs(self.output_dir, exist_ok=True)
+        return self.output_dir
+
+    def generate_blank_stock(self, count, per_workbook=25):
+        """Count-driven mode: N blank forms in workbooks of per_workbook sheets, no input needed"""
+        if count < 1 or per_workbook < 1:
+            logger.error("Count and per-workbook must be at least 1.")
+            return False
+        self.make_output_dir()
+        workbook_count = 0
+        for start in range(0, count, per_workbook):
+            workbook_count += 1
+            sheet_names = [f"Blank {number:03d}" for number in range(start + 1, min(start + per_workbook, count) + 1)]
+            filepath = os.path.join(self.output_dir, f"Blank_Security_Refund_Stock_{workbook_count:02d}.xlsx")
+            self.stamp_workbook(sheet_names).save(filepath)
+            logger.info("Saved: %s (%d forms)", filepath, len(sheet_names))
+        logger.info("Generated %d blank forms in %d workbooks in '%s' directory.", count, workbook_count,
+                    self.output_dir)
+        return True
+
+    def generate_named_blank_sheets(self, per_workbook=25):
+        """Fast path: sheet names from the two name columns, forms stamped from the prebuilt blank"""
+        if not self.input_file:
+            self.input_file = self.find_input_file()
+        if not self.input_file or not os.path.exists(self.input_file):
+            logger.error("Input file '%s' not found.", self.input_file)
+            return False
+        names = self.read_name_columns(self.input_file, 'Work Orders')
+        if names is None:
+            return False
+
+        agreement_year = self.get_agreement_year_from_data(pd.DataFrame({'Agreement No.': [a for _, a in names]}))
+        self.make_output_dir()
+        batch_count = 0
+        for start in range(0, len(names), per_workbook):
+            batch_count += 1
+            sheet_names = [self.create_sheet_name(vendor, agreement_no or 'NoAgreement')
+                           for vendor, agreement_no in names[start:start + per_workbook]]
+            filename = f"Blank_Security_Refund_Batch_{batch_count:02d}_{agreement_year}.xlsx"
+            filepath = os.path.join(self.output_dir, filename)
+            self.stamp_workbook(sheet_names).save(filepath)
+            logger.info("Saved: %s", filepath)
+        logger.info("Generated %d blank workbooks in '%s' directory.", batch_count, self.output_dir)
+        return True
+
     def generate_blank_sheets(self):
         """Main method to generate blank security refund sheets"""
+        if not self.input_file:
+            self.input_file = self.find_input_file()
         if not self.input_file or not os.path.exists(self.input_file):
-            print(f"Error: Input file '{self.input_file}' not found.")
-            print("Please ensure work_order_master.xlsx is available.")
+            logger.error("Input file '%s' not found.", self.input_file)
+            logger.error("Please ensure work_order_master.xlsx is available.")
             return False
 
-        print(f"Reading Excel file from: {self.input_file}")
+        logger.info("Reading Excel file from: %s", self.input_file)
         df = self.read_excel_data(self.input_file, 'Work Orders')
         
         if df is None:
-            print("Failed to read Excel file. Please check the file path and sheet name.")
+            logger.error("Failed to read Excel file. Please check the file path and sheet name.")
             return False
 
-        print(f"Total works found: {len(df)}")
+        logger.info("Total works found: %d", len(df))
         agreement_year = self.get_agreement_year_from_data(df)
-        print(f"Using agreement year: {agreement_year}")
+        logger.info("Using agreement year: %s", agreement_year)
 
         batches = self.split_data_into_batches(df, 25)
-        print(f"Created {len(batches)} batches")
+        logger.info("Created %d batches", len(batches))
 
         # Create output directory
-        self.output_dir = f"BLANK_SD_SHEETS_{datetime.now().strftime('%d-%m-%Y_%H-%M')}"
-        os.makedirs(self.output_dir, exist_ok=True)
+        self.make_output_dir()
 
         for batch_idx, (batch_data, batch_number) in enumerate(batches, 1):
-            print(f"Processing batch {batch_idx} with {len(batch_data)} works...")
+            logger.debug("Processing batch %d with %d works...", batch_idx, len(batch_data))
             wb = self.create_security_refund_sheet(batch_data, batch_idx, agreement_year)
             filename = f"Blank_Security_Refund_Batch_{batch_idx:02d}_{agreement_year}.xlsx"
             filepath = os.path.join(self.output_dir, filename)
             wb.save(filepath)
-            print(f"Saved: {filepath}")
-
-        print(f"\n" + "="*80)
-        print("BLANK SECURITY REFUND SHEETS GENERATION COMPLETED!")
-        print("="*80)
-        print(f"Generated {len(batches)} blank workbooks in '{self.output_dir}' directory.")
-        print("Each workbook contains:")
-        print("- 25 separate blank sheets (one per work order)")
-        print("- Sheet names: Based on contractor names and agreement numbers") 
-        print("- Professional formatting with proper borders")
-        print("- Print-ready A4 portrait format, one page per sheet")
-        print("- Ready for manual data entry")
-        print("="*80)
+            logger.info("Saved: %s", filepath)
+
+        logger.info("Generated %d blank workbooks (%d sheets) in '%s' directory.", len(batches), len(df),
+                    self.output_dir)
         
         return True
 
 def main():
     """Main function with improved path handling"""
-    print("="*80)
-    print("BLANK SECURITY REFUND GENERATOR")
-    print("="*80)
-    print("PWD Electric Division - Udaipur")
-    print("Developer: RAJKUMAR SINGH CHAUHAN")
-    print("="*80)
+    setup_logging()
+    logger.info("BLANK SECURITY REFUND GENERATOR - PWD Electric Division - Udaipur")
     
     # Initialize generator
     generator = BlankSecurityRefundGenerator()
@@ -373,9 +458,9 @@ def main():
     success = generator.generate_blank_sheets()
     
     if success:
-        print(f"\n✅ SUCCESS: Blank sheets generated in '{generator.output_dir}'")
+        logger.info("SUCCESS: Blank sheets generated in '%s'", generator.output_dir)
     else:
-        print(f"\n❌ FAILED: Could not generate blank sheets")
+        logger.error("FAILED: Could not generate blank sheets")
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+"""
+Security deposit amounts for the refund forms
+Per-work SD totals come from the deduction ledgers with one groupby-sum on
+the normalized agreement number and are joined to the master as an
+'SD Amount' column. Amounts are printed in Indian digit grouping
+(1,23,45,678.00) and in words (lakh / crore); both converters are memoized,
+so each distinct amount is spelled out once however many forms carry it.
+"""
+from functools import lru_cache
+
+import pandas as pd
+
+from work_orders import normalize_agreement_numbers
+
+SD_AMOUNT_COLUMN = 'SD Amount'
+
+ONES = ('', 'One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven', 'Eight', 'Nine', 'Ten', 'Eleven', 'Twelve',
+        'Thirteen', 'Fourteen', 'Fifteen', 'Sixteen', 'Seventeen', 'Eighteen', 'Nineteen')
+TENS = ('', '', 'Twenty', 'Thirty', 'Forty', 'Fifty', 'Sixty', 'Seventy', 'Eighty', 'Ninety')
+# Indian place values, largest first; crores above 99 are spelled recursively
+INDIAN_UNITS = ((10 ** 7, 'Crore'), (10 ** 5, 'Lakh'), (1000, 'Thousand'), (100, 'Hundred'))
+
+
+def sd_totals(ledger):
+    """SD deducted per agreement key, summed over every ledger line
+
+    ledger is the frame from reconcile_sd.read_deduction_ledgers.
+    """
+    return ledger.groupby('agreement_key', sort=False)['SD Deducted'].sum()
+
+
+def attach_sd_amounts(df, totals):
+    """Copy of the master with an 'SD Amount' column (blank where no ledger line matched)"""
+    keys = normalize_agreement_numbers(df['Agreement No.'])
+    return df.assign(**{SD_AMOUNT_COLUMN: keys.map(totals).to_numpy()})
+
+
+def read_sd_amounts(df, ledger_files):
+    """Join the SD totals of the ledger files to the master; returns (df, matched works)"""
+    from reconcile_sd import read_deduction_ledgers
+    df = attach_sd_amounts(df, sd_totals(read_deduction_ledgers(ledger_files)))
+    return df, int(df[SD_AMOUNT_COLUMN].notna().sum())
+
+
+def to_paise(amount):
+    """Rupee amount (number or text such as "29,280") as whole paise, or None when blank"""
+    if amount is None or amount == '':
+        return None
+    if isinstance(amount, str):
+        amount = pd.to_numeric(amount.replace(',', '').replace('₹', '').strip(), errors='coerce')
+    if pd.isna(amount):
+        return None
+    return int(round(float(amount) * 100))
+
+
+def _indian_digits(rupees):
+    """'12345678' -> '1,23,45,678': last three digits, then pairs"""
+    digits = str(rupees)
+    if len(digits) <= 3:
+        return digits
+    head, tail = digits[:-3], digits[-3:]
+    pairs = [head[max(0, end - 2):end] for end in range(len(head), 0, -2)]
+    return ','.join(reversed(pairs)) + ',' + tail
+
+
+@lru_cache(maxsize=None)
+def format_indian(paise):
+    """Whole paise -> '1,23,456.50' (Indian digit grouping, always two decimals)"""
+    sign = '-' if paise < 0 else ''
+    rupees, paise = divmod(abs(paise), 100)
+    return f"{sign}{_indian_digits(rupees)}.{paise:02d}"
+
+
+def _words_below_hundred(number):
+    if number < 20:
+        return ONES[number]
+    return ' '.join(part for part in (TENS[number // 10], ONES[number % 10]) if part)
+
+
+def _indian_words(number):
+    parts = []
+    for value, name in INDIAN_UNITS:
+        if number >= value:
+            count, number = divmod(number, value)
+            parts.append(f"{_indian_words(count) if count >= 100 else _words_below_hundred(count)} {name}")
+    if number:
+        parts.append(_words_below_hundred(number))
+    return ' '.join(parts)
+
+
+@lru_cache(maxsize=None)
+def amount_in_words(paise):
+    """Whole paise -> 'Rupees One Lakh Twenty Three Thousand Four Hundred Fifty Six and Paise Fifty Only'"""
+    rupees, remainder = divmod(abs(paise), 100)
+    words = f"Rupees {_indian_words(rupees) or 'Zero'}"
+    if remainder:
+        words += f" and Paise {_words_below_hundred(remainder)}"
+    return f"{'Minus ' if paise < 0 else ''}{words} Only"
@@ -0,0 +1,208 @@
+"""
+Per-contractor refund bundles for dispatch
+Instead of batches of 25 in row order that are split by contractor later,
+every contractor gets one file per format holding all of their refund forms.
+The xlsx opens with a covering Summary sheet (agreements, form sheets and SD
+amounts); the other formats carry the forms only.
+
+The deduction ledgers are reduced to per-agreement totals and joined to the
+master, which is then grouped by normalized contractor name once. Bundles are
+rendered in parallel, one contractor per task, and Bundle_Summary.csv lists
+every contractor with their works, SD total, ledger lines and files.
+
+    python contractor_bundles.py work_order_master.xlsx [LEDGER ...]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from amounts import SD_AMOUNT_COLUMN, attach_sd_amounts, format_indian, to_paise
+from division_profiles import DEFAULT_PROFILE, sheet_styles
+from print_layout import apply_print_profile
+from sd_logging import get_logger, setup_logging
+from work_orders import normalize_agreement_numbers, normalize_contractor_names
+
+logger = get_logger(__name__)
+
+SUMMARY_SHEET = "Summary"
+SUMMARY_HEADERS = ("S.No.", "Agreement No.", "Name of Work", "Form Sheet", "SD Amount (₹)")
+SUMMARY_COLUMN_WIDTHS = {'A': 8, 'B': 18, 'C': 50, 'D': 22, 'E': 18}
+LEDGER_LINES_COLUMN = 'Ledger Lines'
+BUNDLE_SUMMARY_COLUMNS = ['Name of Contractor', 'Works', 'SD Amount', 'Ledger Lines', 'Files']
+
+
+def ledger_totals(ledger):
+    """SD total and number of ledger lines per agreement key"""
+    return ledger.groupby('agreement_key', sort=False)['SD Deducted'].agg(['sum', 'size'])
+
+
+def attach_ledger_totals(df, ledger_files):
+    """Master with 'SD Amount' and 'Ledger Lines' columns; also returns the ledger agreements not in the master"""
+    from reconcile_sd import read_deduction_ledgers
+    totals = ledger_totals(read_deduction_ledgers(ledger_files))
+    df = attach_sd_amounts(df, totals['sum'])
+    keys = normalize_agreement_numbers(df['Agreement No.'])
+    df[LEDGER_LINES_COLUMN] = keys.map(totals['size']).fillna(0).astype(int).to_numpy()
+    unmatched = totals.index.difference(pd.Index(keys.unique()))
+    return df, unmatched
+
+
+def plan_bundles(df):
+    """[(file label, contractor name, works)] with one groupby on the normalized contractor name"""
+    from security_refund_generator import group_file_label
+    keys = normalize_contractor_names(df['Name of Contractor'])
+    bundles, taken = [], set()
+    for key, positions in keys.groupby(keys.values, sort=True).indices.items():
+        works = df.take(positions)
+        label = base = group_file_label(key)
+        suffix = 1
+        while label.casefold() in taken:  # names that differ only in punctuation
+            suffix += 1
+            label = f"{base}_{suffix}"
+        taken.add(label.casefold())
+        contractor = str(works['Name of Contractor'].iloc[0]).strip() if key else 'Unknown'
+        bundles.append((label, contractor, works))
+    return bundles
+
+
+def write_summary_sheet(wb, contractor, works, sheet_names, profile=DEFAULT_PROFILE):
+    """Covering sheet listing every form in the bundle, with the SD total"""
+    ws = wb.create_sheet(title=SUMMARY_SHEET, index=0)
+    styles = sheet_styles(profile)
+
+    def put(row, column, value, font='normal_font', alignment='left_alignment', border='thin_border', fill=None):
+        cell = ws.cell(row=row, column=column, value=value)
+        cell.font = styles[font]
+        cell.alignment = styles[alignment]
+        if border:
+            cell.border = styles[border]
+        if fill:
+            cell.fill = styles[fill]
+
+    for row, text, font in ((1, "Security Deposit Refund Orders - Dispatch Summary", 'title_font'),
+                            (2, profile.office_name, 'header_font'),
+                            (3, f"Name of Contractor: {contractor}", 'value_font')):
+        ws.merge_cells(start_row=row, start_column=1, end_row=row, end_column=5)
+        put(row, 1, text, font, 'center_alignment' if row < 3 else 'left_alignment', border=None)
+
+    header_row = 5
+    for column, header in enumerate(SUMMARY_HEADERS, 1):
+        put(header_row, column, header, 'header_font', 'center_alignment', fill='header_fill')
+
+    row = header_row
+    total_paise, has_amounts = 0, False
+    amounts = works[SD_AMOUNT_COLUMN] if SD_AMOUNT_COLUMN in works.columns else [None] * len(works)
+    for number, (agreement, name, sheet_name, amount) in enumerate(
+            zip(works['Agreement No.'], works['Name of Work'], sheet_names, amounts), 1):
+        row += 1
+        paise = to_paise(amount)
+        put(row, 1, number, alignment='center_alignment')
+        put(row, 2, '' if pd.isna(agreement) else str(agreement))
+        put(row, 3, '' if pd.isna(name) else str(name), alignment='wrap_alignment')
+        put(row, 4, sheet_name)
+        put(row, 5, format_indian(paise) if paise is not None else '', alignment='center_alignment')
+        if paise is not None:
+            total_paise, has_amounts = total_paise + paise, True
+
+    row += 1
+    ws.merge_cells(start_row=row, start_column=1, end_row=row, end_column=4)
+    put(row, 1, f"Total: {len(works)} works", 'value_font')
+    for column in (2, 3, 4):
+        put(row, column, None)
+    put(row, 5, f"₹{format_indian(total_paise)}" if has_amounts else '', 'value_font', 'center_alignment')
+
+    for column, width in SUMMARY_COLUMN_WIDTHS.items():
+        ws.column_dimensions[column].width = width
+    apply_print_profile(ws, row, header_text=None)
+    return ws
+
+
+def build_bundle(task):
+    """Worker: write one contractor's files; returns (label, works, [file names])"""
+    import openpyxl
+    from form_export import EMITTERS, build_form_models
+    from form_model import write_xlsx_sheet
+    from xlsx_compact import save_compact
+
+    label, contractor, works, formats, output_dir, profile, compact = task
+    models = build_form_models(works, profile)
+    files = []
+    for fmt in formats:
+        path = os.path.join(output_dir, f"SD_Refund_{label}.{fmt}")
+        if fmt == 'xlsx':
+            wb = openpyxl.Workbook()
+            wb.remove(wb.active)
+            sheet_names = [write_xlsx_sheet(wb, model).title for model in models]
+            write_summary_sheet(wb, contractor, works, sheet_names, profile)
+            if compact:
+                save_compact(wb, path)
+            else:
+                wb.save(path)
+        else:
+            EMITTERS[fmt](models, path)
+        files.append(os.path.basename(path))
+    return label, len(models), files
+
+
+def main(excel_file='work_order_master.xlsx', ledger_files=(), formats=('xlsx',), output_dir=None, workers=None,
+         profile=DEFAULT_PROFILE, compact=False):
+    """Write one bundle per contractor (in parallel) and Bundle_Summary.csv"""
+    from form_export import available_formats
+    from security_refund_generator import check_input_schema, drop_duplicate_work_orders, read_excel_data
+
+    setup_logging()
+    started = time.perf_counter()
+    formats = available_formats(formats)
+    if not formats:
+        return False
+    df = read_excel_data(excel_file, 'Work Orders')
+    if df is None:
+        return False
+    df, issues = check_input_schema(df)
+    if df is None:
+        logger.error("Input rejected. Fix the rows above and run again.")
+        return False
+    df, conflicts = drop_duplicate_work_orders(df)
+    if ledger_files:
+        df, unmatched = attach_ledger_totals(df, ledger_files)
+        logger.info("SD amounts filled for %d of %d works", int(df[SD_AMOUNT_COLUMN].notna().sum()), len(df))
+        if len(unmatched):
+            logger.warning("%d ledger agreements have no work in the master (e.g. %s)", len(unmatched),
+                           ', '.join(map(str, unmatched[:5])))
+
+    output_dir = output_dir or f"Contractor_Bundles_{time.strftime('%Y%m%d_%H%M%S')}"
+    os.makedirs(output_dir, exist_ok=True)
+    if not conflicts.empty:
+        conflicts.to_csv(os.path.join(output_dir, "Conflict_Report.csv"), index=False)
+
+    bundles = plan_bundles(df)
+    logger.info("%d works from %d contractors", len(df), len(bundles))
+    tasks = [(label, contractor, works, formats, output_dir, profile, compact)
+             for label, contractor, works in bundles]
+    if workers == 1 or len(tasks) < 2:
+        results = [build_bundle(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 4))
+            results = list(executor.map(build_bundle, tasks, chunksize=chunksize))
+
+    summary = []
+    for (label, contractor, works), (_, work_count, files) in zip(bundles, results):
+        amounts = works[SD_AMOUNT_COLUMN] if SD_AMOUNT_COLUMN in works.columns else pd.Series(dtype=float)
+        ledger_lines = works[LEDGER_LINES_COLUMN].sum() if LEDGER_LINES_COLUMN in works.columns else 0
+        summary.append([contractor, work_count, amounts.sum(min_count=1), int(ledger_lines), ' '.join(files)])
+        logger.debug("Bundled %d works for %s", work_count, contractor)
+    pd.DataFrame(summary, columns=BUNDLE_SUMMARY_COLUMNS).to_csv(
+        os.path.join(output_dir, "Bundle_Summary.csv"), index=False)
+
+    logger.info("Wrote bundles for %d contractors to '%s' (%.1fs)", len(bundles), output_dir,
+                time.perf_counter() - started)
+    return True
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(args[0] if args else 'work_order_master.xlsx', ledger_files=args[1:])
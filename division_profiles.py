@@ -0,0 +1,100 @@
+"""
+Division profiles for security refund forms
+Office name, form title and signatories come from a profile instead of being
+hard-coded, so one process can produce forms for every division of a circle.
+Fonts, borders and fills are built once per profile and shared by all sheets.
+"""
+import json
+from functools import lru_cache
+from typing import NamedTuple
+
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+
+class DivisionProfile(NamedTuple):
+    """Per-division text and colours printed on the RWMF 119 form"""
+    code: str
+    office_name: str
+    form_title: str = "ORDER FOR REFUND OF SECURITY DEPOSIT [RWMF 119]"
+    signatories: tuple = ("Divisional Accountant", "Assistant Engineer", "Executive Engineer")
+    title_color: str = '000080'  # Navy blue
+    header_fill_color: str = 'E6E6FA'
+    master_file: str = 'work_order_master.xlsx'
+
+
+DEFAULT_PROFILE = DivisionProfile(code='udaipur', office_name="PWD Electric Div.- Udaipur")
+# The signature block prints one title each in columns A, C and E
+MAX_SIGNATORIES = 3
+
+
+def load_division_profiles(path):
+    """Read a JSON list of division profiles, e.g.
+
+    [{"code": "udaipur", "office_name": "PWD Electric Div.- Udaipur",
+      "master_file": "udaipur/work_order_master.xlsx"}, ...]
+
+    Raises ValueError for a profile with no signatories or more than
+    MAX_SIGNATORIES, which the fixed form layout cannot print.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        entries = json.load(file)
+    profiles = []
+    for entry in entries:
+        if 'signatories' in entry:
+            entry['signatories'] = tuple(entry['signatories'])
+            if not 1 <= len(entry['signatories']) <= MAX_SIGNATORIES:
+                raise ValueError(f"Division '{entry.get('code')}' lists {len(entry['signatories'])} signatories; "
+                                 f"the form has room for 1 to {MAX_SIGNATORIES}")
+        profiles.append(DivisionProfile(**entry))
+    return profiles
+
+
+# Font name -> (bold, size in points); the title is in the profile's colour, the rest black.
+# The xlsx registry below and the HTML/Word/PDF emitters in form_export read the same specs.
+FONT_SPECS = {
+    'title_font': (True, 16),
+    'header_font': (True, 12),
+    'normal_font': (False, 11),
+    'small_font': (False, 10),
+    'value_font': (True, 11),
+}
+
+# Alignment name -> (horizontal, vertical, wrap text)
+ALIGNMENT_SPECS = {
+    'center_alignment': ('center', 'center', False),
+    'left_alignment': ('left', 'center', False),
+    'wrap_alignment': ('left', 'top', True),
+}
+
+
+def font_color(font_name, profile=DEFAULT_PROFILE):
+    return profile.title_color if font_name == 'title_font' else '000000'
+
+
+@lru_cache(maxsize=None)
+def sheet_styles(profile=DEFAULT_PROFILE):
+    """Style registry for one profile, built on first use and reused for every sheet"""
+    thin = Side(style='thin')
+    medium = Side(style='medium')
+    thick = Side(style='thick')
+    styles = {name: Font(bold=bold, size=size, color=font_color(name, profile))
+              for name, (bold, size) in FONT_SPECS.items()}
+    styles.update({name: Alignment(horizontal=horizontal, vertical=vertical, wrap_text=wrap or None)
+                   for name, (horizontal, vertical, wrap) in ALIGNMENT_SPECS.items()})
+    styles.update({
+        'thick_border': Border(left=thick, right=thick, top=thick, bottom=thick),
+        'medium_border': Border(left=medium, right=medium, top=medium, bottom=medium),
+        'thin_border': Border(left=thin, right=thin, top=thin, bottom=thin),
+        'header_fill': PatternFill(start_color=profile.header_fill_color, end_color=profile.header_fill_color,
+                                   fill_type='solid'),
+    })
+    return styles
+
+
+@lru_cache(maxsize=None)
+def signature_rows(profile=DEFAULT_PROFILE):
+    """Signature block: titles in A, C, E with the office name under the last one"""
+    return (
+        tuple(profile.signatories),
+        ("",) * (len(profile.signatories) - 1) + (profile.office_name,),
+    )
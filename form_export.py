@@ -0,0 +1,377 @@
+"""
+Export refund forms to Excel, Word, PDF and HTML in one pass
+Each work order is laid out once as a form_model.FormModel; every requested
+emitter then draws the same list of models, one form per sheet or page.
+
+    python form_export.py work_order_master.xlsx xlsx,docx,pdf,html [OUTPUT_DIR]
+
+Word output needs python-docx and PDF output needs reportlab; both are only
+imported when that format is asked for. HTML needs nothing extra.
+"""
+import html
+import importlib.util
+import os
+import sys
+import time
+from datetime import date
+
+from division_profiles import ALIGNMENT_SPECS, DEFAULT_PROFILE, FONT_SPECS, font_color
+from form_model import build_form_model, write_xlsx_sheet
+from print_layout import FOOTER_TEXT, HEADER_TEXT, PRINT_MARGINS
+from sd_logging import get_logger, setup_logging
+from work_orders import iter_work_orders
+
+logger = get_logger(__name__)
+
+# Border name -> line width in points for the non-Excel formats
+BORDER_WIDTHS = {'thin_border': 0.5, 'medium_border': 1.0, 'thick_border': 2.0}
+A4_POINTS = (595.27, 841.89)
+
+
+def build_form_models(data_batch, profile=DEFAULT_PROFILE):
+    """One FormModel per work order row, in row order"""
+    from security_refund_generator import create_sheet_name
+    return [build_form_model(work, create_sheet_name(work.contractor, work.agreement_no), profile)
+            for work in iter_work_orders(data_batch)]
+
+
+def column_points(width):
+    """Excel character width -> points (7 px per character plus 5 px padding, at 96 dpi)"""
+    return (width * 7 + 5) * 0.75
+
+
+def printed_columns(model):
+    """Widths in points of the printed columns A..E"""
+    return [column_points(model.column_widths[letter]) for letter in 'ABCDE']
+
+
+def display_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, date):
+        return value.strftime('%d/%m/%Y')  # as the masters write dates
+    return str(value)
+
+
+# --- xlsx ----------------------------------------------------------------------------
+
+def write_xlsx(models, path):
+    import openpyxl
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for model in models:
+        write_xlsx_sheet(wb, model)
+    wb.save(path)
+
+
+# --- HTML ----------------------------------------------------------------------------
+
+def _css(style, profile):
+    rules = []
+    if style.font:
+        bold, size = FONT_SPECS[style.font]
+        rules.append(f"font-size:{size}pt;color:#{font_color(style.font, profile)}")
+        if bold:
+            rules.append("font-weight:bold")
+    if style.alignment:
+        horizontal, vertical, wrap = ALIGNMENT_SPECS[style.alignment]
+        vertical = 'middle' if vertical == 'center' else vertical
+        rules.append(f"text-align:{horizontal};vertical-align:{vertical}")
+        rules.append("white-space:normal" if wrap else "white-space:nowrap")
+    if style.border:
+        rules.append(f"border:{BORDER_WIDTHS[style.border]}pt solid #000")
+    if style.fill:
+        rules.append(f"background:#{profile.header_fill_color}")
+    return ';'.join(rules)
+
+
+def write_html(models, path):
+    """One printable HTML page, each form on its own A4 page"""
+    classes = {}
+    parts = []
+    for model in models:
+        widths = printed_columns(model)
+        total = sum(widths)
+        parts.append(f'<section class="form" id="{html.escape(model.sheet_name, quote=True)}">'
+                     f'<div class="page-header">{html.escape(HEADER_TEXT)}</div><table><colgroup>')
+        parts.extend(f'<col style="width:{width / total:.2%}">' for width in widths)
+        parts.append('</colgroup>')
+        for row, items in enumerate(model.print_rows(), 1):
+            parts.append(f'<tr style="height:{model.row_heights.get(row, 15)}pt">')
+            for column, span, cell in items:
+                attributes = f' colspan="{span}"' if span > 1 else ''
+                if cell is not None:
+                    key = (cell.style, model.profile)
+                    if key not in classes:
+                        classes[key] = (f"s{len(classes)}", _css(cell.style, model.profile))
+                    attributes += f' class="{classes[key][0]}"'
+                text = html.escape(display_text(cell.value)) if cell is not None else ''
+                parts.append(f'<td{attributes}>{text}</td>')
+            parts.append('</tr>')
+        parts.append('</table></section>')
+
+    styles = ''.join(f".{name}{{{rules}}}\n" for name, rules in classes.values())
+    margin = PRINT_MARGINS.left
+    document = (
+        '<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Security Refund Forms</title><style>\n'
+        f'@page {{size:A4 portrait;margin:{margin}in}}\n'
+        'body{font-family:Calibri,Arial,sans-serif;font-size:11pt}\n'
+        '.form{page-break-after:always;break-after:page}\n'
+        '.page-header{text-align:center;font-size:9pt;margin-bottom:6pt}\n'
+        'table{border-collapse:collapse;table-layout:fixed;width:100%}\n'
+        'td{padding:0 3pt;overflow:hidden}\n'
+        f'{styles}</style></head><body>\n' + '\n'.join(parts) + '\n</body></html>\n'
+    )
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(document)
+
+
+# --- Word ----------------------------------------------------------------------------
+
+def _docx_cell_border(cell, width):
+    """Single line of width points on all four edges of a Word table cell"""
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+    borders = OxmlElement('w:tcBorders')
+    for edge in ('top', 'left', 'bottom', 'right'):
+        element = OxmlElement(f'w:{edge}')
+        element.set(qn('w:val'), 'single')
+        element.set(qn('w:sz'), str(int(width * 8)))  # eighths of a point
+        element.set(qn('w:space'), '0')
+        element.set(qn('w:color'), '000000')
+        borders.append(element)
+    cell._tc.get_or_add_tcPr().append(borders)
+
+
+def _docx_shading(cell, color):
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+    shading = OxmlElement('w:shd')
+    shading.set(qn('w:val'), 'clear')
+    shading.set(qn('w:color'), 'auto')
+    shading.set(qn('w:fill'), color)
+    cell._tc.get_or_add_tcPr().append(shading)
+
+
+def write_docx(models, path):
+    """Word document with one form table per page"""
+    from docx import Document
+    from docx.enum.table import WD_CELL_VERTICAL_ALIGNMENT
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.shared import Inches, Pt, RGBColor
+
+    horizontal_alignments = {'left': WD_ALIGN_PARAGRAPH.LEFT, 'center': WD_ALIGN_PARAGRAPH.CENTER}
+    vertical_alignments = {'top': WD_CELL_VERTICAL_ALIGNMENT.TOP, 'center': WD_CELL_VERTICAL_ALIGNMENT.CENTER}
+
+    doc = Document()
+    section = doc.sections[0]
+    section.page_width, section.page_height = Pt(A4_POINTS[0]), Pt(A4_POINTS[1])
+    for side in ('left', 'right', 'top', 'bottom'):
+        setattr(section, f'{side}_margin', Inches(getattr(PRINT_MARGINS, side)))
+    section.header.paragraphs[0].text = HEADER_TEXT
+    section.header.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+    available = A4_POINTS[0] - 72 * (PRINT_MARGINS.left + PRINT_MARGINS.right)
+
+    for index, model in enumerate(models):
+        if index:
+            doc.add_page_break()
+        rows = model.print_rows()
+        widths = printed_columns(model)
+        scale = min(1.0, available / sum(widths))
+        table = doc.add_table(rows=len(rows), cols=len(widths))
+        table.autofit = False
+        for column, width in zip(table.columns, widths):
+            for cell in column.cells:
+                cell.width = Pt(width * scale)
+
+        for row_index, items in enumerate(rows):
+            table.rows[row_index].height = Pt(model.row_heights.get(row_index + 1, 15))
+            for column, span, form_cell in items:
+                cell = table.cell(row_index, column - 1)
+                if span > 1:
+                    cell = cell.merge(table.cell(row_index, column + span - 2))
+                if form_cell is None:
+                    continue
+                style = form_cell.style
+                paragraph = cell.paragraphs[0]
+                run = paragraph.add_run(display_text(form_cell.value))
+                if style.font:
+                    bold, size = FONT_SPECS[style.font]
+                    run.font.bold = bold
+                    run.font.size = Pt(size)
+                    run.font.color.rgb = RGBColor.from_string(font_color(style.font, model.profile))
+                if style.alignment:
+                    horizontal, vertical, wrap = ALIGNMENT_SPECS[style.alignment]
+                    paragraph.alignment = horizontal_alignments[horizontal]
+                    cell.vertical_alignment = vertical_alignments[vertical]
+                if style.border:
+                    _docx_cell_border(cell, BORDER_WIDTHS[style.border])
+                if style.fill:
+                    _docx_shading(cell, model.profile.header_fill_color)
+    doc.save(path)
+
+
+# --- PDF -----------------------------------------------------------------------------
+
+def _pdf_text(value):
+    # The standard PDF fonts have no rupee sign
+    return display_text(value).replace('₹', 'Rs.')
+
+
+def write_pdf(models, path):
+    """A4 PDF, one form per page scaled to fit like Excel's fit-to-page"""
+    from reportlab.lib.colors import HexColor
+    from reportlab.lib.utils import simpleSplit
+    from reportlab.pdfgen import canvas
+
+    page_width, page_height = A4_POINTS
+    left, right = 72 * PRINT_MARGINS.left, 72 * PRINT_MARGINS.right
+    top, bottom = 72 * PRINT_MARGINS.top, 72 * PRINT_MARGINS.bottom
+    pdf = canvas.Canvas(path, pagesize=A4_POINTS)
+    pdf.setTitle("Security Refund Forms")
+
+    for page, model in enumerate(models, 1):
+        rows = model.print_rows()
+        widths = printed_columns(model)
+        heights = [model.row_heights.get(row, 15) for row in range(1, len(rows) + 1)]
+        scale = min(1.0, (page_width - left - right) / sum(widths), (page_height - top - bottom) / sum(heights))
+        edges = [(page_width - sum(widths) * scale) / 2]
+        for width in widths:
+            edges.append(edges[-1] + width * scale)
+
+        pdf.setFont('Helvetica', 9)
+        pdf.drawCentredString(page_width / 2, page_height - 72 * PRINT_MARGINS.header - 9, HEADER_TEXT)
+        footer = FOOTER_TEXT.replace('&P', str(page)).replace('&N', str(len(models)))
+        pdf.drawCentredString(page_width / 2, 72 * PRINT_MARGINS.footer, footer)
+
+        y = page_height - top
+        for items, row_height in zip(rows, heights):
+            height = row_height * scale
+            y -= height
+            for column, span, cell in items:
+                if cell is None:
+                    continue
+                style = cell.style
+                x, width = edges[column - 1], edges[column - 1 + span] - edges[column - 1]
+                if style.fill:
+                    pdf.setFillColor(HexColor(f"#{model.profile.header_fill_color}"))
+                    pdf.rect(x, y, width, height, stroke=0, fill=1)
+                if style.border:
+                    pdf.setLineWidth(BORDER_WIDTHS[style.border] * scale)
+                    pdf.rect(x, y, width, height, stroke=1, fill=0)
+                text = _pdf_text(cell.value)
+                if not text:
+                    continue
+                bold, size = FONT_SPECS[style.font or 'normal_font']
+                font_name, size = ('Helvetica-Bold' if bold else 'Helvetica'), size * scale
+                horizontal, vertical, wrap = ALIGNMENT_SPECS[style.alignment or 'left_alignment']
+                pdf.setFont(font_name, size)
+                pdf.setFillColor(HexColor(f"#{font_color(style.font, model.profile)}"))
+                lines = simpleSplit(text, font_name, size, width - 4) if wrap else [text]
+                if vertical == 'top':
+                    baseline = y + height - size
+                else:
+                    baseline = y + (height - size * len(lines)) / 2 + size * (len(lines) - 1) + size * 0.2
+                for line in lines:
+                    if horizontal == 'center':
+                        pdf.drawCentredString(x + width / 2, baseline, line)
+                    else:
+                        pdf.drawString(x + 2, baseline, line)
+                    baseline -= size
+        pdf.showPage()
+    pdf.save()
+
+
+# Format -> emitter(models, path); add a format by registering its emitter here
+EMITTERS = {
+    'xlsx': write_xlsx,
+    'docx': write_docx,
+    'pdf': write_pdf,
+    'html': write_html,
+}
+# Format -> (module, pip package) it cannot be written without
+EMITTER_REQUIREMENTS = {
+    'docx': ('docx', 'python-docx'),
+    'pdf': ('reportlab', 'reportlab'),
+}
+
+
+def available_formats(formats):
+    """The formats whose emitter can run here; the others are reported once"""
+    available = []
+    for fmt in formats:
+        if fmt not in EMITTERS:
+            logger.error("Unknown export format '%s' (choose from %s)", fmt, ', '.join(EMITTERS))
+            continue
+        module, package = EMITTER_REQUIREMENTS.get(fmt, (None, None))
+        if module and importlib.util.find_spec(module) is None:
+            logger.error("Skipping %s output: it needs %s (pip install %s)", fmt, package, package)
+            continue
+        available.append(fmt)
+    return available
+
+
+def export_forms(data_batch, formats, output_base, profile=DEFAULT_PROFILE):
+    """Lay out every work once and write output_base.<format> for each format
+
+    Returns {format: path} for the formats written.
+    """
+    unknown = [fmt for fmt in formats if fmt not in EMITTERS]
+    if unknown:
+        raise ValueError(f"Unknown export format(s): {', '.join(unknown)} (choose from {', '.join(EMITTERS)})")
+
+    models = build_form_models(data_batch, profile)
+    written = {}
+    for fmt in formats:
+        path = f"{output_base}.{fmt}"
+        EMITTERS[fmt](models, path)
+        written[fmt] = path
+        logger.debug("Wrote %d forms to %s", len(models), path)
+    return written
+
+
+def main(excel_file='work_order_master.xlsx', formats=('xlsx', 'html'), output_dir=None, batch_size=25,
+         profile=DEFAULT_PROFILE, ledger_files=()):
+    """Export the whole master in batches of batch_size forms per file
+
+    With ledger_files the forms carry each work's SD total (see amounts).
+    """
+    from amounts import read_sd_amounts
+    from security_refund_generator import check_input_schema, drop_duplicate_work_orders, read_excel_data
+
+    setup_logging()
+    started = time.perf_counter()
+    formats = available_formats(formats)
+    if not formats:
+        return False
+    df = read_excel_data(excel_file, 'Work Orders')
+    if df is None:
+        return False
+    df, issues = check_input_schema(df)
+    if df is None:
+        logger.error("Input rejected. Fix the rows above and run again.")
+        return False
+    df, conflicts = drop_duplicate_work_orders(df)
+    if ledger_files:
+        df, matched = read_sd_amounts(df, ledger_files)
+        logger.info("SD amounts filled for %d of %d works", matched, len(df))
+
+    output_dir = output_dir or f"Security_Refund_Export_{time.strftime('%Y%m%d_%H%M%S')}"
+    os.makedirs(output_dir, exist_ok=True)
+    if not conflicts.empty:
+        conflicts.to_csv(os.path.join(output_dir, "Conflict_Report.csv"), index=False)
+    files = 0
+    for batch_number, start in enumerate(range(0, len(df), batch_size), 1):
+        output_base = os.path.join(output_dir, f"Security_Refund_Batch_{batch_number:02d}")
+        files += len(export_forms(df.iloc[start:start + batch_size], formats, output_base, profile))
+
+    logger.info("Exported %d forms to %d files in '%s' (%.1fs)", len(df), files, output_dir,
+                time.perf_counter() - started)
+    return files > 0
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(args[0] if args else 'work_order_master.xlsx',
+         args[1].split(',') if len(args) > 1 else ('xlsx', 'html'),
+         args[2] if len(args) > 2 else None)
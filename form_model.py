@@ -0,0 +1,250 @@
+"""
+Format-neutral model of one RWMF 119 security refund form
+The layout (which text goes in which cell, merges, styles, row heights and
+column widths) is worked out once per work order in build_form_model. The
+xlsx writer below and the HTML, Word and PDF emitters in form_export all read
+the same model, so the formats cannot drift apart and a work exported to
+several formats is laid out only once.
+
+Styles are referred to by their names in division_profiles (e.g.
+'title_font', 'thin_border'), which map to openpyxl objects for Excel and to
+FONT_SPECS / ALIGNMENT_SPECS for the other formats.
+"""
+from typing import NamedTuple
+
+from amounts import amount_in_words, format_indian, to_paise
+from division_profiles import DEFAULT_PROFILE, DivisionProfile, sheet_styles, signature_rows
+from print_layout import PRINT_AREA_PADDING, PRINT_LAST_COLUMN, apply_print_profile
+
+FORM_COLUMN_WIDTHS = {'A': 30, 'B': 5, 'C': 25, 'D': 25, 'E': 25, 'F': 15, 'G': 15, 'H': 15}
+DEFAULT_ROW_HEIGHT = 20
+CERT_POINT5_HEIGHT = 26
+TALL_ROW, TALL_ROW_HEIGHT = 32, 40  # Row 32 is doubled (~40 points)
+
+# Table rows A20:B26 (header + 6 data rows) always carry thin borders
+TABLE_BORDER_ROWS = range(20, 27)
+
+FORM_FIELDS = (
+    "1. Name of Contractor:",
+    "2. Amount of Deposit: ₹",
+    "3. Name of Work:",
+    "4. Agreement No.:",
+    "5. Reference for granting refunds:",
+    "6. Date of Commencement:",
+    "7. Stipulated date of Completion:",
+    "8. Actual Date of Completion:",
+    "9. MB No.:",
+    "10. Date of Payment of final bill:",
+    "11. Date of Expiry of 3/6 months/DLP:",
+    "12. Was work satisfactory:",
+    "13. Any tools outstanding against contractor:",
+    "14. Any recovery due from contractor after payment of final bill:",
+    "15. Extension of time limit sanctioned vide",
+    "16. Assistant Engineer Signature's Recommending refund",
+    "17. Accountant's Remarks",
+)
+TABLE_HEADERS = ("Bill Type", "MB No.", "SD Type", "Amount (₹)")
+TABLE_DATA = (
+    ("", "", "", ""),  # Rows 1-5 - empty for filling
+    ("", "", "", ""),
+    ("", "", "", ""),
+    ("", "", "", ""),
+    ("", "", "", ""),
+    ("Total:", "", "", "₹[Amount to be filled]"),
+)
+# With an SD amount, the Total row carries it in words across C:D
+WORDS_CHARACTERS_PER_LINE = 55
+WORDS_LINE_HEIGHT = 13
+CERTIFICATION_ITEMS = (
+    "Certified That:-",
+    "1. The Work has been completed as per G-schedule.",
+    "2. The work has been inspected by the undersigned as on and it stood satisfactory.",
+    "3. No Defect found during DLP Period.",
+    "4. The final time extension granted upto With/without compensation by the competent authority.",
+    "5. The defects pointed out by higher authorities or other authorized authorities during inspection etc have been removed by the contractor and compliance has been refund.",
+)
+
+
+class CellStyle(NamedTuple):
+    """Names of the style parts of one cell (None leaves that part at the default)"""
+    font: str = None
+    alignment: str = None
+    border: str = None
+    fill: str = None
+
+
+class FormCell(NamedTuple):
+    row: int
+    column: int
+    value: object
+    style: CellStyle
+
+
+class FormModel(NamedTuple):
+    """Everything an emitter needs to draw one form"""
+    sheet_name: str
+    profile: DivisionProfile
+    cells: tuple          # FormCell, in writing order
+    merges: tuple         # (row, first column, last column)
+    row_heights: dict     # row -> points
+    column_widths: dict   # column letter -> Excel character widths
+    last_row: int         # last row with content in column A (print area anchor)
+
+    @property
+    def print_last_row(self):
+        return self.last_row + PRINT_AREA_PADDING
+
+    def print_rows(self):
+        """Printed area as rows of (column, column span, FormCell or None); merged-over cells are left out"""
+        last_column = ord(PRINT_LAST_COLUMN) - 64
+        cells = {(cell.row, cell.column): cell for cell in self.cells}
+        spans = {(row, first): last - first + 1 for row, first, last in self.merges}
+        rows = []
+        for row in range(1, self.print_last_row + 1):
+            items, column = [], 1
+            while column <= last_column:
+                span = spans.get((row, column), 1)
+                items.append((column, span, cells.get((row, column))))
+                column += span
+            rows.append(items)
+        return rows
+
+
+def build_form_model(work, sheet_name, profile=DEFAULT_PROFILE):
+    """Lay out the refund form for one WorkOrder"""
+    cells = {}
+    merges = []
+
+    def put(row, column, value, font=None, alignment=None, border=None, fill=None):
+        cells[(row, column)] = FormCell(row, column, value, CellStyle(font, alignment, border, fill))
+
+    current_row = 1
+
+    # Main title merged A to E
+    merges.append((current_row, 1, 5))
+    put(current_row, 1, profile.form_title, 'title_font', 'center_alignment', 'thick_border', 'header_fill')
+    current_row += 1
+
+    sd_paise = to_paise(work.sd_amount)
+    field_values = {
+        "1. Name of Contractor:": work.contractor,
+        "2. Amount of Deposit: ₹": format_indian(sd_paise) if sd_paise is not None else "",
+        "3. Name of Work:": work.name_of_work,
+        "4. Agreement No.:": work.agreement_no,
+        "6. Date of Commencement:": work.date_of_commencement,
+        "7. Stipulated date of Completion:": work.stipulated_completion,
+        "8. Actual Date of Completion:": work.actual_completion,
+        "12. Was work satisfactory:": "Yes",
+        "13. Any tools outstanding against contractor:": "Nil",
+        "14. Any recovery due from contractor after payment of final bill:": "Nil",
+    }
+    for field_label in FORM_FIELDS:
+        field_value = field_values.get(field_label, "")
+        if field_label == "3. Name of Work:":
+            # Name of work spans A to E
+            merges.append((current_row, 1, 5))
+            put(current_row, 1, f"{field_label} {field_value}", 'value_font', 'wrap_alignment')
+        else:
+            # Label in A (no border), value in E
+            put(current_row, 1, field_label, 'normal_font', 'left_alignment')
+            put(current_row, 5, field_value, 'value_font', 'left_alignment', 'thin_border')
+        current_row += 1
+
+    # Security Deposit Details Table
+    put(current_row, 1, "18. Details of Security Deposit", 'header_font', 'left_alignment', 'thin_border')
+    current_row += 1
+
+    # Headers: first spans A and B, the others in C, D, E
+    merges.append((current_row, 1, 2))
+    for column, header in zip((1, 3, 4, 5), TABLE_HEADERS):
+        put(current_row, column, header, 'header_font', 'center_alignment', 'thin_border', 'header_fill')
+    current_row += 1
+
+    for table_row in TABLE_DATA:
+        merges.append((current_row, 1, 2))
+        for column, value in zip((1, 3, 4, 5), table_row):
+            put(current_row, column, value, 'normal_font', 'center_alignment', 'thin_border')
+        current_row += 1
+    total_row = current_row - 1
+
+    words_height = None
+    if sd_paise is not None:
+        put(total_row, 5, f"₹{format_indian(sd_paise)}", 'value_font', 'center_alignment', 'thin_border')
+        words = amount_in_words(sd_paise)
+        merges.append((total_row, 3, 4))
+        put(total_row, 3, words, 'small_font', 'wrap_alignment', 'thin_border')
+        put(total_row, 4, None, border='thin_border')
+        lines = -(-len(words) // WORDS_CHARACTERS_PER_LINE)
+        words_height = max(DEFAULT_ROW_HEIGHT, lines * WORDS_LINE_HEIGHT)
+
+    # Enforce borders on A20:B26 regardless of layout shifts
+    for row in TABLE_BORDER_ROWS:
+        for column in (1, 2):
+            cell = cells.get((row, column))
+            if cell is None:
+                put(row, column, None, border='thin_border')
+            else:
+                cells[(row, column)] = cell._replace(style=cell.style._replace(border='thin_border'))
+
+    # Certification section - no borders
+    row_heights = {}
+    for cert_item in CERTIFICATION_ITEMS:
+        if cert_item.startswith("Certified That:-"):
+            put(current_row, 1, cert_item, 'header_font', 'left_alignment')
+        elif cert_item.startswith("5."):
+            # Point 5 spans A to E with wrapped text
+            merges.append((current_row, 1, 5))
+            put(current_row, 1, cert_item, 'small_font', 'wrap_alignment')
+            cert_point5_row = current_row
+        else:
+            put(current_row, 1, cert_item, 'small_font', 'left_alignment')
+        current_row += 1
+
+    # Signatures in A, C, E with the office name directly below, after one blank row
+    current_row += 1
+    signature_row = current_row
+    for sig_row in signature_rows(profile):
+        for col_idx, sig_text in enumerate(sig_row):
+            if sig_text:
+                put(current_row, 1 + col_idx * 2, sig_text, 'normal_font', 'center_alignment')
+        current_row += 1
+
+    for row in range(1, current_row + 5):
+        row_heights[row] = DEFAULT_ROW_HEIGHT
+    row_heights[cert_point5_row] = CERT_POINT5_HEIGHT
+    row_heights[TALL_ROW] = TALL_ROW_HEIGHT
+    if words_height:
+        row_heights[total_row] = words_height
+
+    return FormModel(sheet_name, profile, tuple(cells.values()), tuple(merges), row_heights,
+                     dict(FORM_COLUMN_WIDTHS), signature_row)
+
+
+def write_xlsx_sheet(wb, model):
+    """Add the form as a new worksheet of an openpyxl workbook"""
+    ws = wb.create_sheet(title=model.sheet_name)
+    styles = sheet_styles(model.profile)
+
+    for row, first_column, last_column in model.merges:
+        ws.merge_cells(start_row=row, start_column=first_column, end_row=row, end_column=last_column)
+
+    for row, column, value, style in model.cells:
+        cell = ws.cell(row=row, column=column)
+        if value is not None:
+            cell.value = value
+        if style.font:
+            cell.font = styles[style.font]
+        if style.alignment:
+            cell.alignment = styles[style.alignment]
+        if style.border:
+            cell.border = styles[style.border]
+        if style.fill:
+            cell.fill = styles[style.fill]
+
+    for column, width in model.column_widths.items():
+        ws.column_dimensions[column].width = width
+    for row, height in model.row_heights.items():
+        ws.row_dimensions[row].height = height
+
+    apply_print_profile(ws, model.last_row)
+    return ws
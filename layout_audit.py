@@ -0,0 +1,181 @@
+"""
+Read-only layout audit of refund workbooks
+Checks every sheet of every workbook under a folder against the RWMF 119
+layout that the repairs enforce (A20:B26 borders, tall row 32, no borders in
+the certificate block or at A4, print area, A4 one-page setup) and writes the
+deviations to Layout_Audit.csv. Sheets without the "Certified That:-" block
+(masters, ledgers, reports) are not forms and are skipped.
+
+Workbooks are read part by part from the zip (no openpyxl object model,
+nothing is written back) in a process pool, so auditing an archive is much
+cheaper than repairing all of it; the report then drives repairs of only the
+failing files (main(repair=True), or sd_tools.py repair --from-report).
+
+    python layout_audit.py [DIR]
+"""
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from parallel_workbook import print_areas
+from print_layout import PAGE_SETUP, PRINT_AREA_PADDING, PRINT_LAST_COLUMN
+from sd_logging import get_logger, setup_logging
+from xlsx_patcher import (CERT_COLUMNS, TABLE_BORDER_CELLS, TALL_ROW, TALL_ROW_HEIGHT, SheetPatcher, StylePatcher,
+                          get_attr, read_shared_strings, sheet_parts, split_ref)
+
+logger = get_logger(__name__)
+
+REPORT_FILENAME = "Layout_Audit.csv"
+REPORT_COLUMNS = ['File', 'Sheet', 'Check', 'Found', 'Expected']
+BORDER_SIDES = ('left', 'right', 'top', 'bottom')
+CERT_BLOCK_ROWS = 12  # rows from "Certified That:-" that must stay unbordered (as in the repairs)
+
+# Declared layout spec: check name -> what a compliant sheet has
+LAYOUT_SPEC = {
+    'table_borders': "thin borders on all sides of A20:B26",
+    'tall_row': f"row {TALL_ROW} is {TALL_ROW_HEIGHT} points high",
+    'certificate_borders': "no borders in the certificate block",
+    'a4_border': "no border at A4",
+    'print_area': f"A1:{PRINT_LAST_COLUMN} to {PRINT_AREA_PADDING} rows past the last column-A entry",
+    'page_setup': "A4 portrait, fit to one page",
+}
+
+
+def side_style(border_xml, side):
+    match = re.search(r'<%s\b[^>]*' % side, border_xml)
+    return get_attr(match.group(0), 'style') if match else None
+
+
+def cell_borders(styles_xml):
+    """Cell format index -> (left, right, top, bottom) border styles"""
+    styles = StylePatcher(styles_xml)
+    borders = [tuple(side_style(border, side) for side in BORDER_SIDES) for border in styles.borders]
+    return [borders[int(get_attr(xf, 'borderId') or 0)] for xf in styles.xfs]
+
+
+def audit_sheet(xml, borders, shared_strings, area):
+    """[(check, found, expected)] for one worksheet part; empty when compliant, None when not a form"""
+    sheet = SheetPatcher(xml, shared_strings)
+    cert_start, last_row, max_row = sheet.scan()
+    if cert_start is None:
+        return None
+    failures = []
+
+    def border_of(ref):
+        cell = sheet.rows.get(split_ref(ref)[1], (None, {}))[1].get(ref)
+        return borders[int(get_attr(cell, 's') or 0)] if cell else (None,) * 4
+
+    unbordered = [ref for ref in TABLE_BORDER_CELLS if border_of(ref) != ('thin',) * 4]
+    if unbordered:
+        failures.append(('table_borders', ' '.join(unbordered), LAYOUT_SPEC['table_borders']))
+
+    tall_row = sheet.rows.get(TALL_ROW)
+    height = get_attr(tall_row[0], 'ht') if tall_row else None
+    if height is None or float(height) != TALL_ROW_HEIGHT:
+        failures.append(('tall_row', height or 'default', str(TALL_ROW_HEIGHT)))
+
+    bordered = [f'{column}{number}' for number in range(cert_start, min(cert_start + CERT_BLOCK_ROWS, max_row + 1))
+                for column in CERT_COLUMNS if any(border_of(f'{column}{number}'))]
+    if bordered:
+        failures.append(('certificate_borders', ' '.join(bordered), LAYOUT_SPEC['certificate_borders']))
+    if any(border_of('A4')):
+        failures.append(('a4_border', 'bordered', LAYOUT_SPEC['a4_border']))
+
+    expected = f'$A$1:${PRINT_LAST_COLUMN}${last_row + PRINT_AREA_PADDING}'
+    if area != expected:
+        failures.append(('print_area', area or 'none', expected))
+
+    setup = re.search(r'<pageSetup\b[^>]*>', xml)
+    found = {name: get_attr(setup.group(0), name) if setup else None for name in PAGE_SETUP}
+    # fitToWidth / fitToHeight default to 1 when absent
+    found.update({name: found[name] or '1' for name in ('fitToWidth', 'fitToHeight')})
+    wrong = [f'{name}={found[name]}' for name, value in PAGE_SETUP.items() if found[name] != str(value)]
+    page_pr = re.search(r'<pageSetUpPr\b[^>]*>', xml)
+    fit_to_page = get_attr(page_pr.group(0), 'fitToPage') if page_pr else None
+    if fit_to_page not in ('1', 'true'):
+        wrong.append(f'fitToPage={fit_to_page}')
+    if wrong:
+        failures.append(('page_setup', ' '.join(wrong), LAYOUT_SPEC['page_setup']))
+    return failures
+
+
+def audit_workbook(path):
+    """Worker: (path, form sheets checked, [report rows]) for one workbook"""
+    rows, sheet_count = [], 0
+    try:
+        with zipfile.ZipFile(path) as archive:
+            borders = cell_borders(archive.read('xl/styles.xml').decode('utf-8'))
+            shared_strings = read_shared_strings(archive)
+            areas = print_areas(archive.read('xl/workbook.xml').decode('utf-8'))
+            for local_id, (sheet_name, part) in enumerate(sheet_parts(archive)):
+                xml = archive.read(part).decode('utf-8')
+                failures = audit_sheet(xml, borders, shared_strings, areas.get(str(local_id)))
+                if failures is None:
+                    continue
+                sheet_count += 1
+                rows.extend([path, sheet_name, check, found, expected] for check, found, expected in failures)
+    except Exception as e:
+        return path, 0, [[path, '', 'unreadable', str(e), 'a valid xlsx package']]
+    return path, sheet_count, rows
+
+
+def find_workbooks(target_dir):
+    """Every .xlsx under target_dir (sub-folders included), skipping Excel lock files"""
+    return sorted(os.path.join(folder, name) for folder, _, names in os.walk(target_dir)
+                  for name in names if name.endswith('.xlsx') and not name.startswith('~$'))
+
+
+def audit_workbooks(paths, workers=None):
+    """Audit workbooks in parallel; returns (report DataFrame, sheets checked)"""
+    if workers == 1 or len(paths) < 2:
+        results = [audit_workbook(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(paths) // ((workers or os.cpu_count() or 1) * 4))
+            results = list(executor.map(audit_workbook, paths, chunksize=chunksize))
+    rows, sheet_count = [], 0
+    for path, sheets, failures in results:
+        sheet_count += sheets
+        rows.extend(failures)
+        if failures:
+            logger.debug("%s: %d deviations", os.path.basename(path), len(failures))
+    return pd.DataFrame(rows, columns=REPORT_COLUMNS), sheet_count
+
+
+def failing_workbooks(report):
+    """Paths of the workbooks a repair can fix (unreadable files are left for a person)"""
+    return list(report.loc[report['Check'] != 'unreadable', 'File'].drop_duplicates())
+
+
+def main(target_dir='.', workers=None, report_path=None, repair=False, engine='xml'):
+    """Audit every workbook under target_dir; with repair, fix only the failing ones and audit them again"""
+    setup_logging()
+    paths = find_workbooks(target_dir)
+    report, sheet_count = audit_workbooks(paths, workers)
+    failing = failing_workbooks(report)
+    report_path = report_path or os.path.join(target_dir, REPORT_FILENAME)
+    report.to_csv(report_path, index=False)
+    logger.info("Audited %d workbooks (%d sheets): %d fail the layout spec (see %s)",
+                len(paths), sheet_count, report['File'].nunique(), report_path)
+    for check, count in report['Check'].value_counts().items():
+        logger.info("  %s: %d sheets", check, count)
+
+    if repair and failing:
+        from update_existing_workbooks import main as repair_workbooks
+        repair_workbooks(target_dir, engine=engine, paths=failing)
+        recheck, _ = audit_workbooks(failing, workers)
+        if recheck.empty:
+            logger.info("All %d repaired workbooks now pass.", len(failing))
+        else:
+            logger.warning("%d workbooks still fail after repair:", recheck['File'].nunique())
+            for path, check in recheck[['File', 'Check']].drop_duplicates().itertuples(index=False):
+                logger.warning("  %s: %s", path, check)
+    return report
+
+
+if __name__ == '__main__':
+    import sys
+    main(sys.argv[1] if len(sys.argv) > 1 else '.')
@@ -0,0 +1,248 @@
+"""
+Build one large refund workbook with its sheets rendered in parallel
+Worker processes each render a contiguous chunk of works into an in-memory
+xlsx; the parent then assembles the chunks into a single package: one merged
+styles table, one workbook.xml with every sheet and print area, and matching
+relationships and content types. Sheet XML is copied as rendered, with only
+its style indices remapped onto the shared styles table.
+"""
+import io
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape, unescape
+
+import numpy as np
+
+from division_profiles import DEFAULT_PROFILE
+from work_order_snapshot import SnapshotRows
+from xlsx_patcher import get_attr, set_attr, sheet_parts
+
+MIN_SHEETS_PER_WORKER = 5
+WORKSHEET_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+WORKSHEET_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+STYLE_SECTIONS = (('fonts', 'font', 'fontId'), ('fills', 'fill', 'fillId'), ('borders', 'border', 'borderId'))
+
+
+def section_items(xml, section, tag):
+    """Child elements of one styles.xml section, as XML strings"""
+    match = re.search(r'<%s\b[^>]*>(.*?)</%s>' % (section, section), xml, re.S)
+    if not match:
+        return []
+    return re.findall(r'<%s\b[^>]*?(?:/>|>.*?</%s>)' % (tag, tag), match.group(1), re.S)
+
+
+def replace_section(xml, section, items):
+    """Rewrite a styles.xml section with the given children and count"""
+    block = f'<{section} count="{len(items)}">' + ''.join(items) + f'</{section}>'
+    pattern = re.compile(r'<%s\b[^>]*?(?:/>|>.*?</%s>)' % (section, section), re.S)
+    return pattern.sub(lambda m: block, xml, count=1)
+
+
+class SharedStyles:
+    """Styles table of the assembled workbook; other chunks' formats are merged in"""
+
+    def __init__(self, styles_xml):
+        self.xml = styles_xml
+        self.parts = {section: section_items(styles_xml, section, tag) for section, tag, _ in STYLE_SECTIONS}
+        self.num_fmts = {get_attr(f, 'numFmtId'): f for f in section_items(styles_xml, 'numFmts', 'numFmt')}
+        self.xfs = section_items(styles_xml, 'cellXfs', 'xf')
+
+    def _index(self, items, item_xml):
+        if item_xml not in items:
+            items.append(item_xml)
+        return items.index(item_xml)
+
+    def _num_fmt_id(self, fmt_id, other_fmts):
+        """Built-in ids pass through; custom formats are matched on their format code"""
+        if fmt_id not in other_fmts:
+            return fmt_id
+        code = get_attr(other_fmts[fmt_id], 'formatCode')
+        for existing_id, existing in self.num_fmts.items():
+            if get_attr(existing, 'formatCode') == code:
+                return existing_id
+        new_id = str(max([163] + [int(i) for i in self.num_fmts]) + 1)
+        self.num_fmts[new_id] = set_attr(other_fmts[fmt_id], 'numFmtId', new_id)
+        return new_id
+
+    def merge(self, styles_xml):
+        """Map of cellXfs index in styles_xml -> index in the shared table"""
+        other_parts = {section: section_items(styles_xml, section, tag) for section, tag, _ in STYLE_SECTIONS}
+        other_fmts = {get_attr(f, 'numFmtId'): f for f in section_items(styles_xml, 'numFmts', 'numFmt')}
+        mapping = {}
+        for index, xf in enumerate(section_items(styles_xml, 'cellXfs', 'xf')):
+            for section, _, attr in STYLE_SECTIONS:
+                ref = get_attr(xf, attr)
+                if ref is not None:
+                    new_ref = self._index(self.parts[section], other_parts[section][int(ref)])
+                    xf = set_attr(xf, attr, str(new_ref))
+            fmt_id = get_attr(xf, 'numFmtId')
+            if fmt_id is not None:
+                xf = set_attr(xf, 'numFmtId', self._num_fmt_id(fmt_id, other_fmts))
+            mapping[str(index)] = str(self._index(self.xfs, xf))
+        return mapping
+
+    def render(self):
+        xml = self.xml
+        for section, _, _ in STYLE_SECTIONS:
+            xml = replace_section(xml, section, self.parts[section])
+        if self.num_fmts:
+            xml = replace_section(xml, 'numFmts', list(self.num_fmts.values()))
+        return replace_section(xml, 'cellXfs', self.xfs)
+
+
+def remap_styles(sheet_xml, mapping):
+    """Point every cell, row and column style index at the shared table"""
+    def remap(match):
+        return f'{match.group(1)}="{mapping.get(match.group(2), match.group(2))}"'
+    sheet_xml = re.sub(r'<c\b[^>]*>', lambda m: re.sub(r'\b(s)="(\d+)"', remap, m.group(0)), sheet_xml)
+    sheet_xml = re.sub(r'<row\b[^>]*>', lambda m: re.sub(r'\b(s)="(\d+)"', remap, m.group(0)), sheet_xml)
+    return re.sub(r'<col\b[^>]*>', lambda m: re.sub(r'\b(style)="(\d+)"', remap, m.group(0)), sheet_xml)
+
+
+def unique_sheet_name(name, taken):
+    """Same rule as openpyxl: append 1, 2, ... until the title is free"""
+    candidate, suffix = name, 0
+    while candidate.lower() in taken:
+        suffix += 1
+        candidate = f"{name[:31 - len(str(suffix))]}{suffix}"
+    taken.add(candidate.lower())
+    return candidate
+
+
+def print_areas(workbook_xml):
+    """localSheetId -> the range part of each sheet's _xlnm.Print_Area"""
+    areas = {}
+    for name in re.findall(r'<definedName\b[^>]*>.*?</definedName>', workbook_xml, re.S):
+        if get_attr(name, 'name') == '_xlnm.Print_Area' and get_attr(name, 'localSheetId') is not None:
+            reference = unescape(re.search(r'>(.*)</', name, re.S).group(1))
+            areas[get_attr(name, 'localSheetId')] = reference.rsplit('!', 1)[-1]
+    return areas
+
+
+class AssembledWorkbook:
+    """A finished xlsx package with the two things main() needs: sheetnames and save()"""
+
+    def __init__(self, members, sheetnames):
+        self.members = members
+        self.sheetnames = sheetnames
+
+    def save(self, path):
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as package:
+            for name, data in self.members.items():
+                package.writestr(name, data)
+
+
+def assemble_workbook(chunks, sheet_names=None):
+    """Merge chunk packages (xlsx bytes, in order) into one AssembledWorkbook
+
+    sheet_names, when given, renames the sheets in order (the same package
+    can then be passed several times to stamp copies of its sheets).
+    """
+    archives = [zipfile.ZipFile(io.BytesIO(data)) for data in chunks]
+    base = archives[0]
+    members = {info.filename: base.read(info.filename) for info in base.infolist()
+               if not info.filename.startswith('xl/worksheets/')}
+    styles = SharedStyles(base.read('xl/styles.xml').decode('utf-8'))
+
+    sheets = []  # (name, sheet xml, print area)
+    taken = set()
+    names = iter(sheet_names or ())
+    for archive in archives:
+        mapping = styles.merge(archive.read('xl/styles.xml').decode('utf-8'))
+        areas = print_areas(archive.read('xl/workbook.xml').decode('utf-8'))
+        for local_id, (name, part) in enumerate(sheet_parts(archive)):
+            sheet_xml = remap_styles(archive.read(part).decode('utf-8'), mapping)
+            name = next(names, name)
+            sheets.append((unique_sheet_name(name, taken), sheet_xml, areas.get(str(local_id))))
+
+    # Worksheet parts, relationships and content types, numbered in order
+    sheet_entries, defined_names, relationships, overrides = [], [], [], []
+    for number, (name, sheet_xml, area) in enumerate(sheets, 1):
+        members[f'xl/worksheets/sheet{number}.xml'] = sheet_xml.encode('utf-8')
+        xml_name = escape(name, {'"': '&quot;'})
+        sheet_entries.append(f'<sheet name="{xml_name}" sheetId="{number}" '
+                             f'state="visible" r:id="rId{number}"/>')
+        relationships.append(f'<Relationship Type="{WORKSHEET_TYPE}" Target="/xl/worksheets/sheet{number}.xml" '
+                             f'Id="rId{number}"/>')
+        overrides.append(f'<Override PartName="/xl/worksheets/sheet{number}.xml" '
+                         f'ContentType="{WORKSHEET_CONTENT_TYPE}"/>')
+        if area:
+            quoted = "'%s'" % name.replace("'", "''")
+            defined_names.append(f'<definedName name="_xlnm.Print_Area" localSheetId="{number - 1}">'
+                                 f'{escape(quoted)}!{area}</definedName>')
+
+    workbook = base.read('xl/workbook.xml').decode('utf-8')
+    workbook = re.sub(r'<sheets>.*?</sheets>', lambda m: '<sheets>' + ''.join(sheet_entries) + '</sheets>',
+                      workbook, count=1, flags=re.S)
+    workbook = re.sub(r'<definedNames>.*?</definedNames>|<definedNames\s*/>', '', workbook, flags=re.S)
+    if defined_names:
+        workbook = workbook.replace('</sheets>', '</sheets><definedNames>' + ''.join(defined_names) + '</definedNames>', 1)
+    members['xl/workbook.xml'] = workbook.encode('utf-8')
+
+    rels = base.read('xl/_rels/workbook.xml.rels').decode('utf-8')
+    others = [rel for rel in re.findall(r'<Relationship\b[^>]*>', rels) if get_attr(rel, 'Type') != WORKSHEET_TYPE]
+    others = [set_attr(rel, 'Id', f'rId{len(sheets) + i}') for i, rel in enumerate(others, 1)]
+    members['xl/_rels/workbook.xml.rels'] = re.sub(
+        r'(<Relationships\b[^>]*>).*(</Relationships>)',
+        lambda m: m.group(1) + ''.join(relationships + others) + m.group(2), rels, flags=re.S).encode('utf-8')
+
+    types = base.read('[Content_Types].xml').decode('utf-8')
+    types = re.sub(r'<Override\b[^>]*ContentType="%s"[^>]*/>' % re.escape(WORKSHEET_CONTENT_TYPE), '', types)
+    members['[Content_Types].xml'] = types.replace('</Types>', ''.join(overrides) + '</Types>').encode('utf-8')
+
+    members['xl/styles.xml'] = styles.render().encode('utf-8')
+    return AssembledWorkbook(members, [name for name, _, _ in sheets])
+
+
+def render_chunk(data_chunk, batch_number, agreement_year, profile):
+    """Worker: render a chunk of works and return (xlsx bytes, [(work, error message)])
+
+    data_chunk is a DataFrame, or SnapshotRows to read from the shared snapshot.
+    """
+    from security_refund_generator import create_security_refund_sheet
+    if isinstance(data_chunk, SnapshotRows):
+        data_chunk = data_chunk.load()
+    errors = []
+    wb = create_security_refund_sheet(data_chunk, batch_number, agreement_year,
+                                      on_error=lambda work, e: errors.append((work, str(e))), profile=profile)
+    if not wb.worksheets:
+        return None, errors
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue(), errors
+
+
+def create_security_refund_sheet_parallel(data_batch, batch_number, agreement_year=None, on_error=None,
+                                          profile=DEFAULT_PROFILE, executor=None, workers=4, snapshot=None):
+    """Same result as create_security_refund_sheet, rendered by a process pool
+
+    Works are split into contiguous chunks (sheet order is kept) of at least
+    MIN_SHEETS_PER_WORKER; pass a long-lived executor to reuse worker
+    processes across batches. Errors are reported through on_error as
+    RuntimeError(message) since exceptions do not cross processes intact.
+    When data_batch was read from snapshot (its index holds snapshot rows),
+    workers get row positions and read the memory-mapped columns themselves.
+    """
+    chunk_count = max(1, min(workers, len(data_batch) // MIN_SHEETS_PER_WORKER))
+    chunks = [data_batch.iloc[positions] for positions in np.array_split(np.arange(len(data_batch)), chunk_count)]
+    # Columns added after reading (e.g. SD amounts) are not in the snapshot
+    if snapshot is not None and set(data_batch.columns) <= set(snapshot.columns()):
+        chunks = [snapshot.rows_ref(chunk.index.to_numpy()) for chunk in chunks]
+
+    own_executor = executor is None
+    executor = executor or ProcessPoolExecutor(max_workers=chunk_count)
+    try:
+        futures = [executor.submit(render_chunk, chunk, batch_number, agreement_year, profile) for chunk in chunks]
+        results = [future.result() for future in futures]
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    for _, errors in results:
+        for work, message in errors:
+            if on_error is None:
+                raise RuntimeError(f"{work.contractor} / {work.agreement_no}: {message}")
+            on_error(work, RuntimeError(message))
+    packages = [data for data, _ in results if data is not None]
+    return assemble_workbook(packages) if packages else None
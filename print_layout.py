@@ -0,0 +1,49 @@
+"""
+Shared A4 print profile for security refund sheets
+The page setup is built once and applied to every sheet of a workbook, with the
+print area taken from the last row the writer tracked, so no sheet is scanned
+"""
+from copy import copy
+
+from openpyxl.worksheet.page import PageMargins
+from openpyxl.worksheet.properties import PageSetupProperties
+
+# Print area spans columns A to E, two rows past the last column-A entry
+PRINT_LAST_COLUMN = 'E'
+PRINT_AREA_PADDING = 2
+
+PRINT_MARGINS = PageMargins(left=0.5, right=0.5, top=0.5, bottom=0.5, header=0.2, footer=0.2)
+PAGE_SETUP = {
+    'paperSize': 9,  # A4
+    'orientation': 'portrait',
+    'fitToWidth': 1,
+    'fitToHeight': 1,
+}
+HEADER_TEXT = "Security Deposit Refund Form"
+FOOTER_TEXT = "Page &P of &N"
+
+
+def apply_print_profile(ws, last_row, header_text=HEADER_TEXT, footer_text=FOOTER_TEXT):
+    """Apply the A4 one-page print profile to a sheet whose last column-A row is known"""
+    if last_row:
+        ws.print_area = f'A1:{PRINT_LAST_COLUMN}{last_row + PRINT_AREA_PADDING}'
+
+    # A copy per sheet: a shared PageMargins would change every sheet (and the
+    # module default) when one sheet's margins are edited afterwards
+    ws.page_margins = copy(PRINT_MARGINS)
+    for name, value in PAGE_SETUP.items():
+        setattr(ws.page_setup, name, value)
+    # fitToWidth/fitToHeight are ignored by Excel unless fit-to-page is switched on
+    ws.sheet_properties.pageSetUpPr = PageSetupProperties(fitToPage=True)
+    ws.print_options.horizontalCentered = True
+
+    if header_text:
+        ws.oddHeader.center.text = header_text
+    if footer_text:
+        ws.oddFooter.center.text = footer_text
+
+
+def apply_print_profile_to_workbook(wb, last_rows, header_text=HEADER_TEXT, footer_text=FOOTER_TEXT):
+    """Apply the print profile to every sheet, using last_rows[sheet title] for the print area"""
+    for ws in wb.worksheets:
+        apply_print_profile(ws, last_rows.get(ws.title), header_text, footer_text)
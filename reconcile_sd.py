@@ -0,0 +1,258 @@
+"""
+Reconcile security deposit deducted vs refunded vs pending
+Joins the deduction ledgers, the generated refund forms (Security_Refund_Batch
+and With_Deduction_fill workbooks) and the pending-SD statement on the
+normalized agreement number, and writes per-agreement and per-contractor
+summaries to one workbook
+"""
+import glob
+import json
+import os
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from amounts import to_paise
+from sd_logging import get_logger, setup_logging
+from work_order_snapshot import load_fresh_ledger
+from work_orders import (extract_fiscal_years, normalize_agreement_numbers, normalize_columns,
+                         normalize_contractor_names, normalize_work_names, parse_amounts)
+
+DEFAULT_CACHE = os.path.join("Output_Record", ".reconcile_cache.json")
+CACHE_VERSION = 3  # bump when extract_refund_form_lines reads forms differently
+PENDING_SHEET = "Summary (2)"
+SD_TYPES = ('', 'SD')  # deduction-type values counted as security deposit on refund forms
+
+logger = get_logger(__name__)
+
+
+def read_deduction_ledgers(paths):
+    """SD deducted per ledger line, with normalized agreement/contractor/work keys
+
+    A ledger covered by an up-to-date snapshot (sd_tools.py snapshot --ledger)
+    is read from its memory-mapped columns and stored agreement keys instead
+    of being parsed again.
+    """
+    frames = []
+    for path in paths:
+        cached = load_fresh_ledger(path)
+        if cached is not None:
+            snapshot, table = cached
+            df = snapshot.frame(table)
+            keys = snapshot.agreement_keys(table) if 'Agreement No.' in df.columns else None
+        else:
+            df = normalize_columns(pd.read_excel(path))
+            keys = normalize_agreement_numbers(df['Agreement No.']) if 'Agreement No.' in df.columns else None
+        if 'Agreement No.' not in df.columns or 'SD' not in df.columns:
+            logger.warning("'%s' has no Agreement No./SD columns; skipped", path)
+            continue
+        frames.append(pd.DataFrame({
+            'agreement_key': keys.set_axis(df.index),
+            'Agreement No.': df['Agreement No.'].astype(str),
+            'Name of Contractor': df.get('Name of Contractor', pd.Series('', index=df.index)),
+            'Name of Work': df.get('Name of Work', pd.Series('', index=df.index)),
+            'SD Deducted': parse_amounts(df['SD']),
+        }))
+    if not frames:
+        return pd.DataFrame(columns=['agreement_key', 'Agreement No.', 'Name of Contractor', 'Name of Work',
+                                     'SD Deducted'])
+    return pd.concat(frames, ignore_index=True)
+
+
+def extract_refund_form_lines(path):
+    """One record per refund form sheet that carries an SD amount: agreement, contractor and amount
+
+    Reads in streaming read-only mode; the deduction lines sit between the
+    "Amount (₹)" header row and the "Total:" row. Without itemised lines the
+    amount of the Total row (or of field 2) is used, as written by the
+    generator from the ledgers. Sheets without any amount (blank stock,
+    unfilled forms) are skipped.
+    """
+    records = []
+    wb = load_workbook(path, read_only=True, data_only=False)
+    try:
+        for ws in wb.worksheets:
+            record = {'File': os.path.basename(path), 'Sheet': ws.title,
+                      'Agreement No.': '', 'Name of Contractor': '', 'SD Refunded': 0.0}
+            in_table = has_amount = False
+            stated_paise = None  # "2. Amount of Deposit" / Total row amount, for forms without itemised lines
+            for row in ws.iter_rows(max_col=5, values_only=True):
+                row = tuple(row) + (None,) * (5 - len(row))
+                label = str(row[0]).strip() if row[0] is not None else ''
+                if label.startswith('1. Name of Contractor'):
+                    record['Name of Contractor'] = row[2] or row[4] or ''
+                elif label.startswith('2. Amount of Deposit'):
+                    stated_paise = to_paise(row[4])
+                elif label.startswith('4. Agreement No'):
+                    record['Agreement No.'] = str(row[4] or '')
+                elif row[4] == 'Amount (₹)':
+                    in_table = True
+                elif in_table and label.startswith('Total'):
+                    total_paise = to_paise(row[4])
+                    if total_paise is not None:
+                        stated_paise = total_paise
+                    break
+                elif in_table:
+                    ded_type = str(row[3] or '').strip().upper()
+                    if ded_type in SD_TYPES and isinstance(row[4], (int, float)):
+                        record['SD Refunded'] += row[4]
+                        has_amount = True
+            if not has_amount and stated_paise is not None:
+                # Forms generated with --ledger state the SD total without itemised lines
+                record['SD Refunded'] = stated_paise / 100
+                has_amount = True
+            # Blank forms (and forms still waiting for their amounts) refund nothing
+            if has_amount:
+                records.append(record)
+    finally:
+        wb.close()
+    return records
+
+
+def read_refund_forms(paths, cache_path=DEFAULT_CACHE):
+    """Refund form records for all workbooks, re-reading only files changed since the cache"""
+    cache = {}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as file:
+            cache = json.load(file)
+
+    records = []
+    fresh_cache = {}
+    for path in paths:
+        stat = os.stat(path)
+        stamp = [stat.st_mtime_ns, stat.st_size]
+        entry = cache.get(path)
+        if entry is None or entry['stamp'] != stamp or entry.get('version') != CACHE_VERSION:
+            entry = {'stamp': stamp, 'version': CACHE_VERSION, 'records': extract_refund_form_lines(path)}
+        fresh_cache[path] = entry
+        records.extend(dict(record, Modified=stamp[0]) for record in entry['records'])
+
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        with open(cache_path, 'w', encoding='utf-8') as file:
+            json.dump(fresh_cache, file)
+
+    refunds = pd.DataFrame(records, columns=['File', 'Sheet', 'Agreement No.', 'Name of Contractor', 'SD Refunded',
+                                             'Modified'])
+    # Unmapped forms ("Not Available") are keyed per contractor instead
+    mapped = extract_fiscal_years(refunds['Agreement No.']) != 'Unknown'
+    refunds['agreement_key'] = normalize_agreement_numbers(refunds['Agreement No.']).where(
+        mapped, 'unmapped: ' + normalize_contractor_names(refunds['Name of Contractor']))
+
+    # The archive holds regenerated copies of the same forms, not always under the
+    # same sheet name: the newest copy per agreement wins (per sheet for unmapped forms)
+    refunds['copy_key'] = refunds['agreement_key'].where(mapped, refunds['agreement_key'] + '|' + refunds['Sheet'])
+    refunds = refunds.sort_values('Modified', kind='stable').drop_duplicates('copy_key', keep='last')
+    refunds = refunds.drop(columns='copy_key')
+    return refunds.drop(columns='Modified').sort_index()
+
+
+def read_pending_statement(path, sheet_name=PENDING_SHEET):
+    """Pending SD per contractor and work from the pending-EMD/SD/MD statement"""
+    df = pd.read_excel(path, sheet_name=sheet_name)
+    df = df[df['Vendor'].notna()]  # drops the TOTAL: row
+    return pd.DataFrame({
+        'Name of Contractor': df['Vendor'],
+        'Name of Work': df['Work Name'],
+        'SD Pending': parse_amounts(df['SD Amount (₹)']),
+    })
+
+
+def attach_pending_agreements(pending, ledger):
+    """Give pending rows an agreement key via (contractor, work) matches in the ledger
+
+    The statement has no agreement numbers; rows that match no ledger work keep
+    an empty key and are reported separately.
+    """
+    ledger_keys = pd.DataFrame({
+        'contractor_key': normalize_contractor_names(ledger['Name of Contractor']),
+        'work_key': normalize_work_names(ledger['Name of Work']),
+        'agreement_key': ledger['agreement_key'],
+    }).drop_duplicates(['contractor_key', 'work_key'])
+    pending = pending.assign(contractor_key=normalize_contractor_names(pending['Name of Contractor']),
+                             work_key=normalize_work_names(pending['Name of Work']))
+    matched = pending.merge(ledger_keys, on=['contractor_key', 'work_key'], how='left')
+    matched['agreement_key'] = matched['agreement_key'].fillna('')
+    return matched
+
+
+def reconcile(ledger, refunds, pending):
+    """Per-agreement and per-contractor SD deducted / refunded / pending / discrepancy"""
+    deducted = ledger.groupby('agreement_key').agg(
+        **{'Agreement No.': ('Agreement No.', 'first'),
+           'Name of Contractor': ('Name of Contractor', 'first'),
+           'Name of Work': ('Name of Work', 'first'),
+           'SD Deducted': ('SD Deducted', 'sum'),
+           'Ledger Lines': ('SD Deducted', 'size')})
+    refunded = refunds.groupby('agreement_key').agg(
+        **{'Refund Agreement No.': ('Agreement No.', 'first'),
+           'Refund Contractor': ('Name of Contractor', 'first'),
+           'SD Refunded': ('SD Refunded', 'sum'),
+           'Refund Forms': ('Sheet', 'size')})
+    pending_sd = pending[pending['agreement_key'] != ''].groupby('agreement_key').agg(
+        **{'SD Pending': ('SD Pending', 'sum')})
+
+    by_agreement = deducted.join(refunded, how='outer').join(pending_sd, how='outer')
+    by_agreement['Agreement No.'] = by_agreement['Agreement No.'].fillna(by_agreement['Refund Agreement No.'])
+    by_agreement['Name of Contractor'] = by_agreement['Name of Contractor'].fillna(by_agreement['Refund Contractor'])
+    by_agreement = by_agreement.drop(columns=['Refund Agreement No.', 'Refund Contractor'])
+    amounts = ['SD Deducted', 'SD Refunded', 'SD Pending', 'Ledger Lines', 'Refund Forms']
+    by_agreement[amounts] = by_agreement[amounts].fillna(0)
+    by_agreement['Discrepancy'] = by_agreement['SD Deducted'] - by_agreement['SD Refunded'] - by_agreement['SD Pending']
+    by_agreement = by_agreement.reset_index(names='Agreement Key')
+
+    contractor_keys = normalize_contractor_names(by_agreement['Name of Contractor'])
+    by_contractor = by_agreement.groupby(contractor_keys).agg(
+        **{'Name of Contractor': ('Name of Contractor', 'first'),
+           'Agreements': ('Agreement Key', 'size'),
+           'SD Deducted': ('SD Deducted', 'sum'),
+           'SD Refunded': ('SD Refunded', 'sum'),
+           'SD Pending': ('SD Pending', 'sum'),
+           'Discrepancy': ('Discrepancy', 'sum')}).reset_index(drop=True)
+
+    unmatched_pending = pending.loc[pending['agreement_key'] == '', ['Name of Contractor', 'Name of Work', 'SD Pending']]
+    return by_agreement, by_contractor, unmatched_pending
+
+
+def find_refund_workbooks(folders):
+    """All refund-form workbooks under the given folders"""
+    paths = []
+    for folder in folders:
+        for pattern in ('Security_Refund_Batch_*.xlsx', 'With_Deduction_fill_*.xlsx'):
+            paths.extend(glob.glob(os.path.join(folder, '**', pattern), recursive=True))
+    return sorted(path for path in set(paths) if not os.path.basename(path).startswith('~$'))
+
+
+def main(ledger_paths, refund_folders=('Output_Record',), pending_path=None,
+         output_file='SD_Reconciliation.xlsx', csv_dir=None, cache_path=DEFAULT_CACHE):
+    """Build the reconciliation report and write it as xlsx (and optionally CSV)"""
+    setup_logging()
+    ledger = read_deduction_ledgers(ledger_paths)
+    workbooks = find_refund_workbooks(refund_folders)
+    logger.info("Reading %d refund workbooks...", len(workbooks))
+    refunds = read_refund_forms(workbooks, cache_path)
+    pending = read_pending_statement(pending_path) if pending_path else \
+        pd.DataFrame(columns=['Name of Contractor', 'Name of Work', 'SD Pending'])
+    pending = attach_pending_agreements(pending, ledger)
+
+    by_agreement, by_contractor, unmatched_pending = reconcile(ledger, refunds, pending)
+
+    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+        by_contractor.to_excel(writer, sheet_name='By Contractor', index=False)
+        by_agreement.to_excel(writer, sheet_name='By Agreement', index=False)
+        unmatched_pending.to_excel(writer, sheet_name='Pending Unmatched', index=False)
+    if csv_dir:
+        os.makedirs(csv_dir, exist_ok=True)
+        by_contractor.to_csv(os.path.join(csv_dir, 'SD_Reconciliation_By_Contractor.csv'), index=False)
+        by_agreement.to_csv(os.path.join(csv_dir, 'SD_Reconciliation_By_Agreement.csv'), index=False)
+
+    discrepancies = int((by_agreement['Discrepancy'].abs() > 0.5).sum())
+    logger.info("Reconciled %d agreements for %d contractors; %d with discrepancies, %d pending rows unmatched.",
+                len(by_agreement), len(by_contractor), discrepancies, len(unmatched_pending))
+    logger.info("Saved: %s", output_file)
+    return by_agreement, by_contractor
+
+
+if __name__ == '__main__':
+    main(glob.glob(os.path.join('Attached_assets', 'record room of deduction files', '*.xlsx')),
+         pending_path=os.path.join('Attached_assets', 'STATEMENT OF PENDING EMD, SD AND MD AS ON 11-09-2025.xlsx'))
@@ -0,0 +1,452 @@
+"""
+Golden-output regression check and performance gate for the refund forms
+Builds forms from fixed fixtures with every writer (generator, sheet-parallel
+generator, compact output, blank forms, stamped blank stock, openpyxl repair,
+XML repair), reduces each workbook to a normalized signature (cell values, fonts, fills,
+borders, alignment, merges, row heights, column widths, print setup) and
+compares it with the JSON files in golden/. Checks the fiscal year read from
+every known agreement number spelling, that the reconciler reads the SD
+totals of filled forms back, and that a batch whose every row fails is
+quarantined without stopping the run, and that the memory-mapped snapshot
+reads back like the Excel file. Then times the hot paths against
+minimum sheets-per-second thresholds.
+
+    python regression_check.py            # compare and time
+    python regression_check.py --update   # accept current output as golden
+"""
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import openpyxl
+import pandas as pd
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, 'Blank_Generator'))
+
+from security_refund_generator import create_security_refund_sheet
+
+GOLDEN_DIR = os.path.join(SCRIPT_DIR, "golden")
+MAX_REPORTED_DIFFERENCES = 20
+
+# Minimum throughput (sheets per second); set well below a typical laptop so
+# only real regressions trip them
+THROUGHPUT_THRESHOLDS = {
+    'generate': 40,
+    'blank_stamp': 150,
+    'repair_xml': 150,
+}
+
+# Ten works (enough for the sheet-parallel writer to use two workers) covering
+# M/s prefixes, repeated sheet names, long names, blanks and odd agreement numbers
+FIXTURE_WORKS = pd.DataFrame({
+    'Name of Contractor': ['M/s Arun Electricals', 'Shri Ram Kumar', 'M/s. Arun Electricals',
+                           'Bharat Infra Projects Private Limited Udaipur', None, 'Meena Traders',
+                           'M/s Arun Electricals', 'Gupta & Sons', 'Shri Ram Kumar', 'Patel Electric Works'],
+    'Name of Work': ['E/F work in Govt. school building, Udaipur', 'Internal electrification of PHC ' * 6,
+                     'Street light work', 'HT line shifting', 'Misc. work', None, 'E/F work in hostel',
+                     'Pump house wiring', 'Repair of LT line', 'Solar street lights'],
+    'Agreement No.': ['104/2020-21', '56/2021-22', '107/2020-21', '12/023-24', '8/2022-23', 'Not Available',
+                      '104/2021-22', '56/2020/21', '009/2019-20', ''],
+    'Date of Commencement': ['01/04/2020', '15/06/2021', '', '10/10/2023', '02/02/2022', None,
+                             '05/05/2021', '01/01/2021', '12/12/2019', '2022-03-01'],
+    'Stipulated date of Completion': ['30/09/2020', '14/12/2021', '31/03/2021', '', '01/08/2022', None,
+                                      '04/11/2021', '30/06/2021', '11/06/2020', ''],
+    'Actual Date of Completion': ['28/09/2020', '', '31/03/2021', '01/02/2024', None, None,
+                                  '01/11/2021', '', '10/06/2020', None],
+})
+
+# Archived workbook from before the layout fixes: fails the table border, row 32,
+# certificate border, A4 border and page setup checks on every sheet
+REPAIR_FIXTURE = os.path.join(SCRIPT_DIR, "Security_Refund_Sheets_2025_20250903_033335",
+                              "Security_Refund_Batch_15_2025.xlsx")
+
+# SD totals as the ledgers fill them: numbers, Indian-grouped text, blanks, paise, a negative
+FIXTURE_SD_AMOUNTS = [29280, None, '1,23,456.50', 0.5, None, 15044, '', 100000, -250, 7]
+
+
+# --- normalized workbook signature ----------------------------------------------
+
+def _color(color):
+    return getattr(color, 'rgb', None) if color is not None and color.type == 'rgb' else None
+
+
+def style_signature(cell):
+    font, fill, border, alignment = cell.font, cell.fill, cell.border, cell.alignment
+    # font, fill, border (left/right/top/bottom), alignment, number format
+    return ' '.join(map(str, (
+        font.b, font.i, font.sz, _color(font.color),
+        fill.fill_type, _color(fill.fgColor),
+        *[getattr(getattr(border, side), 'style', None) for side in ('left', 'right', 'top', 'bottom')],
+        alignment.horizontal, alignment.vertical, bool(alignment.wrap_text),
+        cell.number_format,
+    )))
+
+
+DEFAULT_STYLE = style_signature(openpyxl.Workbook().active['A1'])
+
+
+def workbook_signature(data):
+    """Normalized, JSON-ready description of an xlsx (bytes) for comparison"""
+    wb = openpyxl.load_workbook(io.BytesIO(data))
+    sheets = []
+    for ws in wb.worksheets:
+        cells = {}
+        for row in ws.iter_rows():
+            for cell in row:
+                # Empty cells that only exist with the default look are not layout
+                style = style_signature(cell)
+                if cell.value is not None or style != DEFAULT_STYLE:
+                    cells[cell.coordinate] = [cell.value, style]
+        margins, setup = ws.page_margins, ws.page_setup
+        sheets.append({
+            'title': ws.title,
+            'cells': cells,
+            'merges': sorted(str(r) for r in ws.merged_cells.ranges),
+            'row_heights': {str(r): d.height for r, d in sorted(ws.row_dimensions.items()) if d.height is not None},
+            'column_widths': {c: d.width for c, d in sorted(ws.column_dimensions.items()) if d.customWidth},
+            'print': {
+                'area': ws.print_area,
+                'paper_size': setup.paperSize,
+                'orientation': setup.orientation,
+                'fit_to': [setup.fitToWidth, setup.fitToHeight, ws.sheet_properties.pageSetUpPr.fitToPage
+                           if ws.sheet_properties.pageSetUpPr else None],
+                'margins': [margins.left, margins.right, margins.top, margins.bottom, margins.header, margins.footer],
+                'centered': ws.print_options.horizontalCentered,
+                'header': ws.oddHeader.center.text,
+                'footer': ws.oddFooter.center.text,
+            },
+        })
+    return sheets
+
+
+def compare_signatures(expected, actual, path='', differences=None):
+    """List of 'path: expected != actual' lines (recursive, stops at the report limit)"""
+    differences = [] if differences is None else differences
+    if len(differences) >= MAX_REPORTED_DIFFERENCES:
+        return differences
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in sorted(set(expected) | set(actual), key=str):
+            compare_signatures(expected.get(key), actual.get(key), f"{path}/{key}", differences)
+    elif isinstance(expected, list) and isinstance(actual, list) and len(expected) == len(actual):
+        for index, (e, a) in enumerate(zip(expected, actual)):
+            label = e.get('title', index) if isinstance(e, dict) else index
+            compare_signatures(e, a, f"{path}/{label}", differences)
+    elif expected != actual:
+        differences.append(f"{path or '/'}: expected {expected!r}, got {actual!r}")
+    return differences
+
+
+# --- fixture cases -------------------------------------------------------------------
+
+def save_bytes(wb):
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def build_generated():
+    return save_bytes(create_security_refund_sheet(FIXTURE_WORKS, 1, '2020-21'))
+
+
+def build_generated_amounts():
+    return save_bytes(create_security_refund_sheet(FIXTURE_WORKS.assign(**{'SD Amount': FIXTURE_SD_AMOUNTS}),
+                                                   1, '2020-21'))
+
+
+def build_generated_parallel():
+    from parallel_workbook import create_security_refund_sheet_parallel
+    return package_bytes(create_security_refund_sheet_parallel(FIXTURE_WORKS, 1, '2020-21', workers=2))
+
+
+def build_generated_compact():
+    from xlsx_compact import compact_package
+    return compact_package(build_generated())
+
+
+def build_blank():
+    from enhanced_blank_generator import BlankSecurityRefundGenerator
+    return BlankSecurityRefundGenerator().blank_package()
+
+
+def build_blank_stamped():
+    from enhanced_blank_generator import BlankSecurityRefundGenerator
+    return package_bytes(BlankSecurityRefundGenerator().stamp_workbook(['Blank 001', 'Blank 002', 'Blank 002']))
+
+
+def package_bytes(workbook):
+    """Bytes of an openpyxl workbook or an AssembledWorkbook"""
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'book.xlsx')
+        workbook.save(path)
+        with open(path, 'rb') as file:
+            return file.read()
+
+
+def repaired(repair):
+    """Archived pre-repair workbook (REPAIR_FIXTURE) after one of the repair implementations"""
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'book.xlsx')
+        shutil.copyfile(REPAIR_FIXTURE, path)
+        repair(path)
+        with open(path, 'rb') as file:
+            return file.read()
+
+
+def build_repaired_openpyxl():
+    from update_existing_workbooks import fix_workbook
+    return repaired(fix_workbook)
+
+
+def build_repaired_xml():
+    from xlsx_patcher import patch_workbook
+    return repaired(patch_workbook)
+
+
+# case name -> (golden file, builder); several writers share one golden file
+CASES = {
+    'generator': ('generator.json', build_generated),
+    'generator_parallel': ('generator.json', build_generated_parallel),
+    'generator_compact': ('generator_compact.json', build_generated_compact),
+    'generator_amounts': ('generator_amounts.json', build_generated_amounts),
+    'blank_form': ('blank_form.json', build_blank),
+    'blank_stamped': ('blank_stamped.json', build_blank_stamped),
+    'repair_openpyxl': ('repaired.json', build_repaired_openpyxl),
+    'repair_xml': ('repaired.json', build_repaired_xml),
+}
+
+
+def check_golden(update=False):
+    """Compare every case with its golden file (or rewrite them); True when all match"""
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    all_passed = True
+    written = set()
+    for case, (golden_file, builder) in CASES.items():
+        golden_path = os.path.join(GOLDEN_DIR, golden_file)
+        with contextlib.redirect_stdout(io.StringIO()):  # the writers report every sheet
+            data = builder()
+        signature = json.loads(json.dumps(workbook_signature(data)))  # tuples -> lists
+        if update and golden_file not in written:
+            with open(golden_path, 'w', encoding='utf-8') as file:
+                json.dump(signature, file, ensure_ascii=False, sort_keys=True)
+            written.add(golden_file)
+            print(f"UPDATED {case}: {golden_file}")
+            continue
+        if not os.path.exists(golden_path):
+            print(f"MISSING {case}: {golden_file} (run with --update)")
+            all_passed = False
+            continue
+        with open(golden_path, 'r', encoding='utf-8') as file:
+            differences = compare_signatures(json.load(file), signature)
+        if differences:
+            all_passed = False
+            print(f"FAIL {case}: differs from {golden_file}")
+            for line in differences:
+                print(f"    {line}")
+        else:
+            print(f"PASS {case}")
+    return all_passed
+
+
+def check_refund_amounts():
+    """The reconciler reads back the SD total of every filled form (and skips the unfilled ones)"""
+    from amounts import to_paise
+    from reconcile_sd import extract_refund_form_lines
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = build_generated_amounts()
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'book.xlsx')
+        with open(path, 'wb') as file:
+            file.write(data)
+        found = [record['SD Refunded'] for record in extract_refund_form_lines(path)]
+    expected = [to_paise(amount) / 100 for amount in FIXTURE_SD_AMOUNTS if to_paise(amount) is not None]
+    passed = found == expected
+    print(f"{'PASS' if passed else 'FAIL'} refund_amounts: {len(found)} of {len(FIXTURE_SD_AMOUNTS)} forms read")
+    if not passed:
+        print(f"    expected {expected}, got {found}")
+    return passed
+
+
+def check_quarantined_batch():
+    """A batch whose every row fails is quarantined and skipped; the run goes on and resumes cleanly"""
+    import logging
+    from unittest import mock
+
+    import security_refund_generator
+    from run_journal import QUARANTINE_FILENAME
+
+    render = security_refund_generator.create_single_work_sheet
+
+    def fail_2020_21(wb, work, *args):
+        render(wb, work, *args)  # leave a half-written sheet behind, as a real failure would
+        if '2020' in str(work.agreement_no):
+            raise ValueError("unreadable row")
+
+    failing = 3  # the whole FY 2020-21 batch: 104/2020-21, 107/2020-21, 56/2020/21
+    with tempfile.TemporaryDirectory() as folder:
+        master = os.path.join(folder, 'master.xlsx')
+        FIXTURE_WORKS.to_excel(master, sheet_name='Work Orders', index=False)
+        output_dir = os.path.join(folder, 'out')
+        logging.disable(logging.WARNING)
+        try:
+            with mock.patch.object(security_refund_generator, 'create_single_work_sheet', fail_2020_21):
+                # the second run resumes the first and retries only the quarantined batch
+                results = [security_refund_generator.main(master, resume_dir=output_dir) for _ in range(2)]
+        finally:
+            logging.disable(logging.NOTSET)
+        files = [name for _, _, names in os.walk(output_dir) for name in names]
+        with open(os.path.join(output_dir, QUARANTINE_FILENAME), encoding='utf-8') as file:
+            quarantined = len(file.readlines()) - 1
+    problems = []
+    if results != [True, True]:
+        problems.append(f"runs returned {results}")
+    if quarantined != failing:
+        problems.append(f"{quarantined} quarantined rows, expected {failing}")
+    if any(name.endswith('.tmp') or '2020-21' in name for name in files):
+        problems.append(f"left behind {[name for name in files if name.endswith('.tmp') or '2020-21' in name]}")
+    if not any(name.endswith('.xlsx') for name in files):
+        problems.append("the other batches were not saved")
+    print(f"{'FAIL' if problems else 'PASS'} quarantined_batch: {failing} rows of a fully failing batch")
+    for line in problems:
+        print(f"    {line}")
+    return not problems
+
+
+def check_snapshot_frame():
+    """A snapshot of the master reads back like read_excel, including date columns mixing dates and text"""
+    from datetime import datetime
+
+    from work_order_snapshot import build_snapshot
+    from work_orders import normalize_columns
+
+    # Excel stores some dates as real dates and others as typed text
+    works = FIXTURE_WORKS.astype(object)
+    works.loc[[0, 3, 8], 'Date of Commencement'] = [datetime(2020, 4, 1), datetime(2023, 10, 10),
+                                                     datetime(2019, 12, 12)]
+    works.loc[[1, 6], 'Actual Date of Completion'] = [datetime(2021, 12, 20), datetime(2021, 11, 1)]
+    with tempfile.TemporaryDirectory() as folder:
+        master = os.path.join(folder, 'master.xlsx')
+        works.to_excel(master, sheet_name='Work Orders', index=False)
+        expected = normalize_columns(pd.read_excel(master, sheet_name='Work Orders'))
+        found = build_snapshot(master).frame()
+    try:
+        pd.testing.assert_frame_equal(found, expected, check_dtype=False, check_index_type=False)
+        problem = None
+    except AssertionError as e:
+        problem = str(e).strip().splitlines()
+    print(f"{'FAIL' if problem else 'PASS'} snapshot_frame: {len(expected)} rows with mixed date columns")
+    for line in problem or []:
+        print(f"    {line}")
+    return not problem
+
+
+# --- agreement numbers -------------------------------------------------------------
+
+# Spellings found in the masters and ledgers -> fiscal year folder
+FISCAL_YEAR_CASES = {
+    '104/2020-21': '2020-21', '63 of 2022-23': '2022-23', '99/ 2022-23': '2022-23', '40 / 2022-23': '2022-23',
+    '16 /2023-24': '2023-24', '73 2022-23': '2022-23', '98 year 2023-24': '2023-24', '72/2022-2023': '2022-23',
+    '56/2020/21': '2020-21', '41/22-23': '2022-23', '12/023-24': '2023-24', '25 of 20221-22': '2021-22',
+    '0104/2020-2021': '2020-21', '63 of2022-23': '2022-23', '2020-21': '2020-21',
+    # serials whose digits look like a year
+    '72014/2022-23': '2022-23', '2019/2021-22': '2021-22', '2020 of 2023-24': '2023-24',
+    '104-21': 'Unknown', '7/98-99': '1998-99', '15/99-00': '1999-00',
+    'Not Available': 'Unknown', '': 'Unknown',
+}
+
+
+def check_fiscal_years():
+    """extract_fiscal_years over FISCAL_YEAR_CASES and every synthetic_data spelling; True when all match"""
+    from synthetic_data import AGREEMENT_FORMATS
+    from work_orders import extract_fiscal_years
+
+    cases = dict(FISCAL_YEAR_CASES)
+    for fmt in AGREEMENT_FORMATS:
+        for serial in (7, 104, 2019, 72014):
+            cases[fmt.format(s=serial, y=2022, e='23')] = '2022-23'
+    found = extract_fiscal_years(pd.Series(list(cases)))
+    wrong = [f"{agreement!r}: expected {expected}, got {year}"
+             for (agreement, expected), year in zip(cases.items(), found) if year != expected]
+    print(f"{'FAIL' if wrong else 'PASS'} fiscal_years: {len(cases)} agreement spellings")
+    for line in wrong:
+        print(f"    {line}")
+    return not wrong
+
+
+# --- performance gate ------------------------------------------------------------------
+
+def measure(label, sheets, action, repeat=3):
+    """Best-of-repeat sheets per second for one action"""
+    best = min(_timed(action) for _ in range(repeat))
+    return label, sheets / best if best else float('inf')
+
+
+def _timed(action):
+    start = time.perf_counter()
+    action()
+    return time.perf_counter() - start
+
+
+def check_throughput():
+    """Time the hot paths and compare with THROUGHPUT_THRESHOLDS; True when all pass"""
+    from enhanced_blank_generator import BlankSecurityRefundGenerator
+    from xlsx_patcher import patch_workbook
+
+    works = pd.concat([FIXTURE_WORKS] * 3, ignore_index=True)
+    blank = BlankSecurityRefundGenerator()
+    blank.blank_package()  # the one-off render is not what the gate measures
+    stamp_names = [f"Blank {n:03d}" for n in range(1, 51)]
+
+    folder = tempfile.mkdtemp()
+    try:
+        source = os.path.join(folder, 'source.xlsx')
+        with contextlib.redirect_stdout(io.StringIO()):
+            create_security_refund_sheet(works, 1, '2020-21').save(source)
+        target = os.path.join(folder, 'target.xlsx')
+
+        def repair_copy():
+            shutil.copyfile(source, target)
+            patch_workbook(target)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = [
+                measure('generate', len(works),
+                        lambda: save_bytes(create_security_refund_sheet(works, 1, '2020-21'))),
+                measure('blank_stamp', len(stamp_names), lambda: package_bytes(blank.stamp_workbook(stamp_names))),
+                measure('repair_xml', len(works), repair_copy),
+            ]
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    all_passed = True
+    for label, rate in results:
+        threshold = THROUGHPUT_THRESHOLDS[label]
+        status = 'PASS' if rate >= threshold else 'FAIL'
+        all_passed &= rate >= threshold
+        print(f"{status} {label}: {rate:.0f} sheets/s (minimum {threshold})")
+    return all_passed
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    update = '--update' in argv
+    golden_ok = check_golden(update)
+    if update:
+        return 0
+    golden_ok &= check_refund_amounts()
+    golden_ok &= check_fiscal_years()
+    golden_ok &= check_quarantined_batch()
+    golden_ok &= check_snapshot_frame()
+    speed_ok = '--no-timing' in argv or check_throughput()
+    print("\nAll checks passed." if golden_ok and speed_ok else "\nRegression check FAILED.")
+    return 0 if golden_ok and speed_ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Job journal for resumable security refund runs
+Records finished batches and their sheets in the output directory, so an
+interrupted run can continue where it stopped, and keeps rows that failed
+to render in a quarantine file instead of stopping the run
+"""
+import csv
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+
+JOURNAL_FILENAME = "run_journal.json"
+QUARANTINE_FILENAME = "Quarantined_Rows.csv"
+# Fixed header, so the file layout does not change when WorkOrder gains fields
+QUARANTINE_COLUMNS = ['Batch', 'contractor', 'name_of_work', 'agreement_no', 'date_of_commencement',
+                      'stipulated_completion', 'actual_completion', 'sd_amount', 'Error']
+
+
+def input_signature(df, **options):
+    """Fingerprint of the input rows and batching options a run was planned from"""
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    digest.update(json.dumps(options, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class RunJournal:
+    """Per-output-directory record of completed batches, failures and quarantined rows"""
+
+    def __init__(self, output_dir, signature):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, JOURNAL_FILENAME)
+        self.signature = signature
+        self.state = {'signature': signature, 'batches': {}, 'failures': {}}
+        self._quarantine_columns = QUARANTINE_COLUMNS
+        self._quarantined = None  # keys of the rows in the quarantine file, read on first use
+
+    @classmethod
+    def open(cls, output_dir, signature):
+        """Load the journal of an earlier run, or start a new one
+
+        Returns None when the directory holds a journal for different input
+        or options; resuming it would mix two batch plans.
+        """
+        journal = cls(output_dir, signature)
+        if os.path.exists(journal.path):
+            with open(journal.path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+            if state.get('signature') != signature:
+                return None
+            journal.state = state
+        return journal
+
+    def is_done(self, batch_key):
+        """True when the batch was saved by an earlier attempt and its file still exists"""
+        entry = self.state['batches'].get(batch_key)
+        return bool(entry) and os.path.exists(os.path.join(self.output_dir, entry['file']))
+
+    def record_batch(self, batch_key, relative_path, sheet_names):
+        """Mark a batch as saved, with the sheets it contains"""
+        self.state['batches'][batch_key] = {
+            'file': relative_path,
+            'sheets': list(sheet_names),
+            'finished': datetime.now().isoformat(timespec='seconds'),
+        }
+        self.state['failures'].pop(batch_key, None)
+        self.save()
+
+    def record_failure(self, batch_key, error):
+        """Remember a batch that could not be saved so the next attempt retries it"""
+        self.state['failures'][batch_key] = str(error)
+        self.save()
+
+    def _quarantine_key(self, row):
+        """The row as the CSV stores it (every column but the error text)"""
+        return tuple('' if row.get(column) is None else str(row[column])
+                     for column in self._quarantine_columns if column != 'Error')
+
+    def _read_quarantine(self, path):
+        """Header and row keys of an existing quarantine file"""
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', newline='', encoding='utf-8') as file:
+            reader = csv.DictReader(file)
+            self._quarantine_columns = reader.fieldnames or QUARANTINE_COLUMNS
+            self._quarantined.update(self._quarantine_key(row) for row in reader)
+
+    def quarantine(self, batch_key, work, error):
+        """Append a work order that failed to render to the quarantine CSV
+
+        A row already in the file (written by an earlier attempt of a resumed
+        run) is not written again; distinct rows always are, even when they
+        share a blank or conflicting agreement number.
+        """
+        path = os.path.join(self.output_dir, QUARANTINE_FILENAME)
+        if self._quarantined is None:
+            self._quarantined = set()
+            self._read_quarantine(path)
+        row = {'Batch': batch_key, **work._asdict(), 'Error': str(error)}
+        key = self._quarantine_key(row)
+        if key in self._quarantined:
+            return
+        self._quarantined.add(key)
+
+        write_header = not os.path.exists(path)
+        with open(path, 'a', newline='', encoding='utf-8') as file:
+            # Files from older runs keep their own header; fields they lack are dropped
+            writer = csv.DictWriter(file, fieldnames=self._quarantine_columns, restval='', extrasaction='ignore')
+            if write_header:
+                writer.writeheader()
+            writer.writerow(row)
+
+    @property
+    def failures(self):
+        return dict(self.state['failures'])
+
+    def save(self):
+        """Write the journal atomically so a crash never leaves it half-written"""
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.state, file, indent=2)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,3 @@
+@echo off
+REM Unified entry point: sd-tools generate^|blank^|repair^|template^|docx^|pdf
+python "%~dp0sd_tools.py" %*
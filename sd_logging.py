@@ -0,0 +1,74 @@
+"""
+Logging for the security deposit tools
+Records go through a queue to a background thread, so writing to a slow
+(Windows) console or to disk never blocks form generation. The console shows
+plain messages and the rotating log file under Output_Record the same records
+with timestamps. Per-row detail is logged at DEBUG, so it costs nothing at the
+default INFO level.
+
+    from sd_logging import get_logger, setup_logging
+    logger = get_logger(__name__)
+    setup_logging()               # once, in the entry point
+    setup_logging('DEBUG')        # or SD_LOG_LEVEL=DEBUG in the environment
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+LOGGER_NAME = "sd_tools"
+LOG_DIR = os.path.join("Output_Record", "logs")
+LOG_FILENAME = "sd_tools.log"
+LOG_MAX_BYTES = 2 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+FILE_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+_listener = None
+
+
+def get_logger(name=None):
+    """Child of the tools' root logger, e.g. get_logger(__name__)"""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+def setup_logging(level=None, log_dir=LOG_DIR, console=True):
+    """Attach the queued console and rotating-file handlers (first call wins)
+
+    level defaults to $SD_LOG_LEVEL or INFO. A log directory that cannot be
+    created only disables the file.
+    """
+    global _listener
+    root = logging.getLogger(LOGGER_NAME)
+    level = level.upper() if isinstance(level, str) else level
+    if _listener is not None:
+        if level:
+            root.setLevel(level)
+        return root
+
+    level = level or os.environ.get("SD_LOG_LEVEL", "INFO").upper()
+    handlers = []
+    if console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter("%(message)s"))
+        handlers.append(console_handler)
+    if log_dir:
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                os.path.join(log_dir, LOG_FILENAME), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                encoding='utf-8', delay=True)
+            file_handler.setFormatter(logging.Formatter(FILE_FORMAT))
+            handlers.append(file_handler)
+        except OSError as e:
+            print(f"Warning: cannot write logs to '{log_dir}': {e}")
+
+    records = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(level)
+    root.propagate = False
+    _listener = logging.handlers.QueueListener(records, *handlers)
+    _listener.start()
+    atexit.register(_listener.stop)  # flush the queue before the interpreter exits
+    return root
@@ -0,0 +1,322 @@
+"""
+Single command-line entry point for the security deposit tools
+
+    python sd_tools.py generate [--group-by contractor] [--balance] [--resume DIR] [--divisions JSON]
+                                [--sheet-workers N] [--keep-duplicates] [--ledger FILE ...] [--compact]
+    python sd_tools.py blank [--input work_order_master.xlsx] [--names-only]
+    python sd_tools.py blank --count 500 [--per-workbook 25]
+    python sd_tools.py repair [DIR] [--engine openpyxl] [--from-report Layout_Audit.csv]
+    python sd_tools.py audit [DIR] [--workers N] [--report FILE] [--repair]
+    python sd_tools.py compact [DIR]
+    python sd_tools.py template [SOURCE] [OUTPUT]
+    python sd_tools.py docx [EXCEL] [WORD]
+    python sd_tools.py pdf
+    python sd_tools.py export [--input FILE] [--formats xlsx,docx,pdf,html] [--output DIR] [--ledger FILE ...]
+    python sd_tools.py bundle [--input FILE] [--ledger FILE ...] [--formats xlsx,pdf] [--workers N] [--compact]
+    python sd_tools.py watch [--master FILE] [--ledger FILE ...] [--formats xlsx,pdf]
+    python sd_tools.py snapshot [--master FILE] [--ledger FILE ...]
+    python sd_tools.py reconcile --ledger FILE [--pending FILE] [--forms DIR ...]
+    python sd_tools.py check [--update] [--no-timing]
+    python sd_tools.py synth [--works 100000] [--lines 1000000] [--seed 7] [--output DIR]
+
+Several steps can run in one process by separating them with "+":
+
+    python sd_tools.py generate --balance + repair Security_Refund_Sheets_...
+
+Add -v to any step for per-row detail (or set SD_LOG_LEVEL=DEBUG); every run
+is also logged to Output_Record/logs/sd_tools.log.
+
+Only this module, argparse and sd_logging load at startup; pandas, openpyxl
+and python-docx are imported by the subcommand that needs them.
+"""
+import argparse
+import os
+import sys
+
+from sd_logging import get_logger, setup_logging
+
+logger = get_logger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+STEP_SEPARATOR = '+'
+
+
+def run_generate(args):
+    from security_refund_generator import generate_for_divisions, main
+    if args.divisions:
+        return generate_for_divisions(args.divisions, batch_size=args.batch_size, group_by=args.group_by,
+                                      balance=args.balance, strict=args.strict, sheet_workers=args.sheet_workers,
+                                      deduplicate=not args.keep_duplicates, ledger_files=args.ledger or (),
+                                      compact=args.compact)
+    return main(args.input or 'work_order_master.xlsx', batch_size=args.batch_size, group_by=args.group_by,
+                balance=args.balance, strict=args.strict, resume_dir=args.resume, sheet_workers=args.sheet_workers,
+                deduplicate=not args.keep_duplicates, ledger_files=args.ledger or (), compact=args.compact)
+
+
+def run_blank(args):
+    sys.path.insert(0, os.path.join(SCRIPT_DIR, 'Blank_Generator'))
+    from enhanced_blank_generator import BlankSecurityRefundGenerator
+    generator = BlankSecurityRefundGenerator(args.input)
+    if args.count is not None:
+        return generator.generate_blank_stock(args.count, args.per_workbook)
+    if args.names_only:
+        return generator.generate_named_blank_sheets(args.per_workbook)
+    return generator.generate_blank_sheets()
+
+
+def run_repair(args):
+    from update_existing_workbooks import TARGET_DIR, main
+    paths = None
+    if args.from_report:
+        import pandas as pd
+        from layout_audit import failing_workbooks
+        paths = failing_workbooks(pd.read_csv(args.from_report))
+    main(args.directory or TARGET_DIR, engine=args.engine, paths=paths)
+    return True
+
+
+def run_audit(args):
+    from layout_audit import main
+    main(args.directory, workers=args.workers, report_path=args.report, repair=args.repair, engine=args.engine)
+    return True
+
+
+def run_compact(args):
+    from xlsx_compact import main
+    main(args.directory)
+    return True
+
+
+def run_template(args):
+    from extract_single_sheet_template import extract_single_sheet_template
+    if not os.path.exists(args.source):
+        logger.error("Source file not found: %s", args.source)
+        return False
+    extract_single_sheet_template(args.source, args.output)
+    return True
+
+
+def run_docx(args):
+    from convert_to_word import convert_excel_to_word
+    if not os.path.exists(args.excel):
+        logger.error("Excel file not found: %s", args.excel)
+        return False
+    convert_excel_to_word(args.excel, args.word)
+    return True
+
+
+def run_pdf(args):
+    try:
+        from simple_pdf_export import main
+    except ImportError:
+        logger.error("simple_pdf_export.py not found; PDF export needs it next to sd_tools.py.")
+        return False
+    main()
+    return True
+
+
+def run_export(args):
+    from form_export import main
+    return main(args.input, [fmt.strip() for fmt in args.formats.split(',') if fmt.strip()], args.output,
+                args.batch_size, ledger_files=args.ledger or ())
+
+
+def run_bundle(args):
+    from contractor_bundles import main
+    return main(args.input, args.ledger or (), [fmt.strip() for fmt in args.formats.split(',') if fmt.strip()],
+                args.output, workers=args.workers, compact=args.compact)
+
+
+def run_watch(args):
+    from watch_inputs import InputWatcher
+    return InputWatcher(args.master, args.ledger or ['deductions.xlsx'], args.output, poll_interval=args.interval,
+                        settle_seconds=args.settle,
+                        formats=[fmt.strip() for fmt in args.formats.split(',') if fmt.strip()]).run()
+
+
+def run_snapshot(args):
+    from work_order_snapshot import main
+    main(args.master, args.ledger or [])
+    return True
+
+
+def run_reconcile(args):
+    from reconcile_sd import main
+    main(args.ledger, args.forms or ['Output_Record'], args.pending, args.output, csv_dir=args.csv)
+    return True
+
+
+def run_check(args):
+    from regression_check import main
+    return main((['--update'] if args.update else []) + (['--no-timing'] if args.no_timing else [])) == 0
+
+
+def run_synth(args):
+    from synthetic_data import main
+    main(args.works, args.lines, args.seed, args.output)
+    return True
+
+
+def build_parser():
+    """Argument parser with one subcommand per tool"""
+    parser = argparse.ArgumentParser(
+        prog='sd-tools',
+        description='PWD security deposit refund tools. Chain steps with "+".')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log per-row detail (DEBUG level)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    # -v after the step name too; SUPPRESS keeps a step from resetting a -v given before it
+    step_options = argparse.ArgumentParser(add_help=False)
+    step_options.add_argument('-v', '--verbose', action='store_true', default=argparse.SUPPRESS,
+                              help='log per-row detail (DEBUG level)')
+
+    def add_step(name, **kwargs):
+        return subparsers.add_parser(name, parents=[step_options], **kwargs)
+
+    generate = add_step('generate', help='generate security refund workbooks from the master')
+    generate.add_argument('--input', help='work order master (default: work_order_master.xlsx)')
+    generate.add_argument('--batch-size', type=int, default=25)
+    generate.add_argument('--group-by', choices=['contractor', 'sub-division', 'fiscal-year'])
+    generate.add_argument('--balance', action='store_true', help='even out batch sizes')
+    generate.add_argument('--strict', action='store_true', help='reject input with error rows')
+    generate.add_argument('--resume', metavar='DIR', help='continue an interrupted run in DIR')
+    generate.add_argument('--divisions', metavar='JSON',
+                          help="generate for every division profile in JSON (each profile names its master_file)")
+    generate.add_argument('--sheet-workers', type=int, metavar='N',
+                          help='render the sheets of large workbooks in N worker processes')
+    generate.add_argument('--keep-duplicates', action='store_true',
+                          help='generate repeated work orders too (default: drop them, see Conflict_Report.csv)')
+    generate.add_argument('--ledger', action='append',
+                          help='deduction ledger whose SD totals fill the forms (repeatable)')
+    generate.add_argument('--compact', action='store_true',
+                          help='save size-optimized workbooks (shared strings, trimmed rows, max compression)')
+    generate.set_defaults(handler=run_generate)
+
+    blank = add_step('blank', help='generate blank refund sheets')
+    blank.add_argument('--input', default=None)
+    blank.add_argument('--count', type=int, help='stamp this many blank forms without reading any input')
+    blank.add_argument('--per-workbook', type=int, default=25)
+    blank.add_argument('--names-only', action='store_true',
+                       help='stream just the contractor and agreement columns for sheet names')
+    blank.set_defaults(handler=run_blank)
+
+    repair = add_step('repair', help='fix layout of existing workbooks')
+    repair.add_argument('directory', nargs='?')
+    repair.add_argument('--engine', choices=['xml', 'openpyxl'], default='xml',
+                        help='patch sheet XML in place (default) or round-trip through openpyxl')
+    repair.add_argument('--from-report', metavar='CSV', help='repair only the failing workbooks of a layout audit')
+    repair.set_defaults(handler=run_repair)
+
+    audit = add_step('audit', help='check workbooks against the form layout (read-only)')
+    audit.add_argument('directory', nargs='?', default='.')
+    audit.add_argument('--workers', type=int, metavar='N', help='worker processes (default: one per CPU)')
+    audit.add_argument('--report', metavar='CSV', help='report path (default: DIR/Layout_Audit.csv)')
+    audit.add_argument('--repair', action='store_true', help='repair the failing workbooks and audit them again')
+    audit.add_argument('--engine', choices=['xml', 'openpyxl'], default='xml', help='repair engine')
+    audit.set_defaults(handler=run_audit)
+
+    compact = add_step('compact', help='size-optimize existing workbooks in place')
+    compact.add_argument('directory', nargs='?', default='.')
+    compact.set_defaults(handler=run_compact)
+
+    template = add_step('template', help='extract a single-sheet blank template')
+    template.add_argument('source', nargs='?', default=os.path.join(
+        'Output_Record', 'Excel_Files', 'output_17-09-2025_02-34', 'With_Deduction_fill_Batch_Full_01_17-09-2025.xlsx'))
+    template.add_argument('output', nargs='?', default='Blank_Security_Refund_Template.xlsx')
+    template.set_defaults(handler=run_template)
+
+    docx = add_step('docx', help='convert a refund sheet to Word')
+    docx.add_argument('excel', nargs='?', default='Blank_Security_Refund_Template.xlsx')
+    docx.add_argument('word', nargs='?', default='Blank_Security_Refund_Template.docx')
+    docx.set_defaults(handler=run_docx)
+
+    pdf = add_step('pdf', help='export generated workbooks to PDF')
+    pdf.set_defaults(handler=run_pdf)
+
+    export = add_step('export', help='lay out each form once and write it in several formats')
+    export.add_argument('--input', default='work_order_master.xlsx')
+    export.add_argument('--formats', default='xlsx,html', help='comma-separated: xlsx, docx, pdf, html')
+    export.add_argument('--output', metavar='DIR', help='output folder (default: timestamped)')
+    export.add_argument('--batch-size', type=int, default=25)
+    export.add_argument('--ledger', action='append', help='deduction ledger for the SD totals (repeatable)')
+    export.set_defaults(handler=run_export)
+
+    bundle = add_step('bundle', help='one workbook / PDF per contractor with a covering summary')
+    bundle.add_argument('--input', default='work_order_master.xlsx')
+    bundle.add_argument('--ledger', action='append', help='deduction ledger for the SD totals (repeatable)')
+    bundle.add_argument('--formats', default='xlsx', help='comma-separated: xlsx, docx, pdf, html')
+    bundle.add_argument('--output', metavar='DIR', help='output folder (default: timestamped)')
+    bundle.add_argument('--workers', type=int, metavar='N', help='worker processes (default: one per CPU)')
+    bundle.add_argument('--compact', action='store_true', help='save size-optimized workbooks')
+    bundle.set_defaults(handler=run_bundle)
+
+    watch = add_step('watch', help='regenerate sheets when the master or ledgers are saved')
+    watch.add_argument('--master', default='work_order_master.xlsx')
+    watch.add_argument('--ledger', action='append', default=None, help='deduction ledger (repeatable)')
+    watch.add_argument('--output', default=os.path.join('Output_Record', 'Auto_Updates'))
+    watch.add_argument('--interval', type=float, default=2.0, help='seconds between polls')
+    watch.add_argument('--settle', type=float, default=5.0, help='seconds a save must be stable')
+    watch.add_argument('--formats', default='xlsx,pdf', help='comma-separated: xlsx, docx, pdf, html')
+    watch.set_defaults(handler=run_watch)
+
+    snapshot = add_step('snapshot', help='memory-mapped snapshot of the master and ledgers')
+    snapshot.add_argument('--master', default='work_order_master.xlsx')
+    snapshot.add_argument('--ledger', action='append', help='deduction ledger (repeatable)')
+    snapshot.set_defaults(handler=run_snapshot)
+
+    reconcile = add_step('reconcile', help='SD deducted vs refunded vs pending report')
+    reconcile.add_argument('--ledger', action='append', required=True, help='deduction ledger (repeatable)')
+    reconcile.add_argument('--pending', help='pending EMD/SD/MD statement workbook')
+    reconcile.add_argument('--forms', action='append', help='folder with refund workbooks (repeatable)')
+    reconcile.add_argument('--output', default='SD_Reconciliation.xlsx')
+    reconcile.add_argument('--csv', metavar='DIR', help='also write CSV summaries to DIR')
+    reconcile.set_defaults(handler=run_reconcile)
+
+    check = add_step('check', help='golden-output regression check and throughput gate')
+    check.add_argument('--update', action='store_true', help='accept the current output as golden')
+    check.add_argument('--no-timing', action='store_true', help='skip the throughput thresholds')
+    check.set_defaults(handler=run_check)
+
+    synth = add_step('synth', help='seeded synthetic master and ledgers for load testing')
+    synth.add_argument('--works', type=int, default=1000)
+    synth.add_argument('--lines', type=int, default=10000, help='deduction ledger lines')
+    synth.add_argument('--seed', type=int, default=7)
+    synth.add_argument('--output', default='Synthetic_Data')
+    synth.set_defaults(handler=run_synth)
+
+    return parser
+
+
+def split_steps(argv):
+    """Split the command line into steps at each "+" token"""
+    steps = [[]]
+    for token in argv:
+        if token == STEP_SEPARATOR:
+            steps.append([])
+        else:
+            steps[-1].append(token)
+    return [step for step in steps if step]
+
+
+def main(argv=None):
+    parser = build_parser()
+    steps = split_steps(sys.argv[1:] if argv is None else argv)
+    if not steps:
+        parser.print_help()
+        return 2
+
+    # Parse every step first so a typo in step 3 does not waste steps 1 and 2
+    parsed_steps = [parser.parse_args(step) for step in steps]
+    for args in parsed_steps:
+        if args.command == 'generate' and args.divisions and (args.input or args.resume):
+            parser.error("generate: --divisions reads each profile's master_file in a new output folder; "
+                         "it cannot be combined with --input or --resume")
+    setup_logging('DEBUG' if any(args.verbose for args in parsed_steps) else None)
+    for args in parsed_steps:
+        if not args.handler(args):
+            logger.error("Step '%s' failed; stopping.", args.command)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,25 +1,43 @@
 import pandas as pd
+import numpy as np
 import openpyxl
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.drawing.image import Image
-from openpyxl.worksheet.hyperlink import Hyperlink
 import os
+import re
+import time
 from datetime import datetime
 
+from amounts import read_sd_amounts
+from division_profiles import DEFAULT_PROFILE, load_division_profiles
+from form_model import build_form_model, write_xlsx_sheet
+from print_layout import apply_print_profile
+from run_journal import QUARANTINE_FILENAME, RunJournal, input_signature
+from sd_logging import get_logger, setup_logging
+from work_order_snapshot import load_fresh_snapshot
+from work_orders import (extract_fiscal_years, find_duplicate_work_orders, iter_work_orders, normalize_contractor_names,
+                         validate_work_orders)
+from xlsx_compact import save_compact
+
+logger = get_logger(__name__)
+
 def read_excel_data(file_path, sheet_name='agency'):
-    """Read data from Excel file agency sheet"""
+    """Read data from Excel file agency sheet (from its snapshot when that is up to date)"""
     try:
+        snapshot = load_fresh_snapshot(file_path, sheet_name)
+        if snapshot is not None:
+            df = snapshot.frame()
+            logger.info("Read %d rows from snapshot %s of %s", len(df), snapshot.version, file_path)
+            return df
+        
         # First, let's see what sheets are available
         xl_file = pd.ExcelFile(file_path)
-        print(f"Available sheets: {xl_file.sheet_names}")
+        logger.debug("Available sheets: %s", xl_file.sheet_names)
         
-        df = pd.read_excel(file_path, sheet_name=sheet_name)
-        print(f"Successfully read {len(df)} rows from {sheet_name} sheet")
-        print(f"Columns: {list(df.columns)}")
+        df = pd.read_excel(xl_file, sheet_name=sheet_name)
+        logger.info("Successfully read %d rows from %s sheet", len(df), sheet_name)
+        logger.debug("Columns: %s", list(df.columns))
         return df
     except Exception as e:
-        print(f"Error reading Excel file: {e}")
+        logger.error("Error reading Excel file: %s", e)
         return None
 
 def create_sheet_name(vendor, agreement_no):
@@ -64,12 +82,12 @@ def create_sheet_name(vendor, agreement_no):
         # Final cleanup
         sheet_name = sheet_name.strip()
         
-        print(f"Creating sheet: '{sheet_name}' from vendor: '{vendor_str}' and agreement: '{agreement_str}'")
+        logger.debug("Creating sheet: '%s' from vendor: '%s' and agreement: '%s'", sheet_name, vendor_str, agreement_str)
         
         return sheet_name
         
     except Exception as e:
-        print(f"Error creating sheet name: {e}")
+        logger.warning("Error creating sheet name: %s", e)
         # Fallback naming
         try:
             agreement_clean = str(agreement_no).split('/')[0] if '/' in str(agreement_no) else str(agreement_no)
@@ -77,287 +95,31 @@ def create_sheet_name(vendor, agreement_no):
         except:
             return "Work_Unknown"
 
-def create_single_work_sheet(wb, row, work_idx):
-    """Create a single work sheet with enhanced formatting"""
-    
-    # Create new worksheet with correct column names
-    vendor_name = row['Name of Contractor'] if 'Name of Contractor' in row else ''
-    agreement_no = row['Agreement No.'] if 'Agreement No.' in row else ''
-    
-    sheet_name = create_sheet_name(vendor_name, agreement_no)
-    ws = wb.create_sheet(title=sheet_name)
-    
-    # Define enhanced styles
-    title_font = Font(bold=True, size=16, color='000080')  # Navy blue
-    header_font = Font(bold=True, size=12, color='000000')
-    normal_font = Font(size=11, color='000000')
-    small_font = Font(size=10, color='000000')
-    value_font = Font(size=11, bold=True, color='000000')
-    
-    center_alignment = Alignment(horizontal='center', vertical='center')
-    left_alignment = Alignment(horizontal='left', vertical='center')
-    
-    # Enhanced borders
-    thick_border = Border(
-        left=Side(style='thick'),
-        right=Side(style='thick'),
-        top=Side(style='thick'),
-        bottom=Side(style='thick')
-    )
-    
-    medium_border = Border(
-        left=Side(style='medium'),
-        right=Side(style='medium'),
-        top=Side(style='medium'),
-        bottom=Side(style='medium')
-    )
-    
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    # Header background
-    header_fill = PatternFill(start_color='E6E6FA', end_color='E6E6FA', fill_type='solid')
-    
-    current_row = 1
-    
-    # Main title with enhanced styling - merged A to E
-    ws.merge_cells(f'A{current_row}:E{current_row}')
-    ws[f'A{current_row}'] = f"ORDER FOR REFUND OF SECURITY DEPOSIT [RWMF 119]"
-    ws[f'A{current_row}'].font = title_font
-    ws[f'A{current_row}'].alignment = center_alignment
-    ws[f'A{current_row}'].border = thick_border
-    ws[f'A{current_row}'].fill = header_fill
-    current_row += 1  # Only one blank row after heading
-    
-    # Form fields with enhanced formatting - using correct column names
-    form_fields = [
-        ("1. Name of Contractor:", vendor_name),
-        ("2. Amount of Deposit: ₹", ""),  # Not available in current data
-        ("3. Name of Work:", row['Name of Work'] if 'Name of Work' in row else ''),
-        ("4. Agreement No.:", agreement_no),
-        ("5. Reference for granting refunds:", ""),
-        ("6. Date of Commencement:", row['Date of Commencement'] if 'Date of Commencement' in row else ''),
-        ("7. Stipulated date of Completion:", row['Stipulated date of Completion'] if 'Stipulated date of Completion' in row else ''),
-        ("8. Actual Date of Completion:", row['Actual Date of Completion'] if 'Actual Date of Completion' in row else ''),
-        ("9. MB No.:", ""),
-        ("10. Date of Payment of final bill:", ""),
-        ("11. Date of Expiry of 3/6 months/DLP:", ""),
-        ("12. Was work satisfactory:", "Yes"),
-        ("13. Any tools outstanding against contractor:", "Nil"),
-        ("14. Any recovery due from contractor after payment of final bill:", "Nil"),
-        ("15. Extension of time limit sanctioned vide", ""),
-        ("16. Assistant Engineer Signature's Recommending refund", ""),
-        ("17. Accountant's Remarks", "")
-    ]
-    
-    for field_label, field_value in form_fields:
-        if field_label == "3. Name of Work:":
-            # Name of work spans A to E
-            ws.merge_cells(f'A{current_row}:E{current_row}')
-            ws[f'A{current_row}'] = f"{field_label} {field_value}"
-            ws[f'A{current_row}'].font = value_font
-            ws[f'A{current_row}'].alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
-        else:
-            # All other items: Label in A, Value in E (shifting from C to E)
-            ws[f'A{current_row}'] = field_label
-            ws[f'A{current_row}'].font = normal_font
-            ws[f'A{current_row}'].alignment = left_alignment
-            # No border for form fields A2 to A18
-            
-            ws[f'E{current_row}'] = field_value
-            ws[f'E{current_row}'].font = value_font
-            ws[f'E{current_row}'].alignment = left_alignment
-            ws[f'E{current_row}'].border = thin_border
-        
-        current_row += 1
-    
-    # No blank row between item 17 and 18
-    
-    # Security Deposit Details Table - corrected header
-    ws[f'A{current_row}'] = "18. Details of Security Deposit"
-    ws[f'A{current_row}'].font = header_font
-    ws[f'A{current_row}'].alignment = left_alignment
-    ws[f'A{current_row}'].border = thin_border
-    current_row += 1
-    
-    # Table headers - merge A and B, shift others to C, D, E
-    headers = ["Bill Type", "MB No.", "SD Type", "Amount (₹)"]
-    
-    # First header spans A and B
-    table_header_row = current_row
-    ws.merge_cells(f'A{current_row}:B{current_row}')
-    ws[f'A{current_row}'] = headers[0]
-    ws[f'A{current_row}'].font = header_font
-    ws[f'A{current_row}'].alignment = center_alignment
-    ws[f'A{current_row}'].border = thin_border
-    ws[f'A{current_row}'].fill = header_fill
-    
-    # Remaining headers in C, D, E
-    for col_idx, header in enumerate(headers[1:], 1):
-        col_letter = chr(67 + col_idx - 1)  # C, D, E
-        ws[f'{col_letter}{current_row}'] = header
-        ws[f'{col_letter}{current_row}'].font = header_font
-        ws[f'{col_letter}{current_row}'].alignment = center_alignment
-        ws[f'{col_letter}{current_row}'].border = thin_border
-        ws[f'{col_letter}{current_row}'].fill = header_fill
-    
-    current_row += 1
-    
-    # Enhanced table data rows - A-B merged, then C, D, E
-    table_data = [
-        ("", "", "", ""),  # Row 1 - empty for filling
-        ("", "", "", ""),  # Row 2 - empty for filling
-        ("", "", "", ""),  # Row 3 - empty for filling
-        ("", "", "", ""),  # Row 4 - empty for filling
-        ("", "", "", ""),  # Row 5 - empty for filling
-        ("Total:", "", "", "₹[Amount to be filled]")
-    ]
-    
-    for table_row in table_data:
-        # First column spans A and B
-        ws.merge_cells(f'A{current_row}:B{current_row}')
-        ws[f'A{current_row}'] = table_row[0]
-        ws[f'A{current_row}'].font = normal_font
-        ws[f'A{current_row}'].alignment = center_alignment
-        ws[f'A{current_row}'].border = thin_border
-        
-        # Remaining columns in C, D, E
-        for col_idx, value in enumerate(table_row[1:], 1):
-            col_letter = chr(67 + col_idx - 1)  # C, D, E
-            ws[f'{col_letter}{current_row}'] = value
-            ws[f'{col_letter}{current_row}'].font = normal_font
-            ws[f'{col_letter}{current_row}'].alignment = center_alignment
-            ws[f'{col_letter}{current_row}'].border = thin_border
-        current_row += 1
-    
-    # Ensure borders are correctly applied to A20:B26 (table header + 6 data rows)
-    # Based on the current layout, this corresponds to table_header_row through table_header_row + len(table_data)
-    for row_idx in range(table_header_row, table_header_row + len(table_data) + 1):
-        for col_letter in ('A', 'B'):
-            ws[f'{col_letter}{row_idx}'].border = thin_border
-
-    # Explicitly enforce borders on A20:B26 regardless of layout shifts
-    for row_idx in range(20, 27):
-        for col_letter in ('A', 'B'):
-            ws[f'{col_letter}{row_idx}'].border = thin_border
-    
-    # No blank rows after total
-    
-    # Certification section - no borders, proper formatting
-    certification_items = [
-        "Certified That:-",
-        "1. The Work has been completed as per G-schedule.",
-        "2. The work has been inspected by the undersigned as on and it stood satisfactory.",
-        "3. No Defect found during DLP Period.",
-        "4. The final time extension granted upto With/without compensation by the competent authority.",
-        "5. The defects pointed out by higher authorities or other authorized authorities during inspection etc have been removed by the contractor and compliance has been refund."
-    ]
-    
-    for cert_item in certification_items:
-        if cert_item.startswith("Certified That:-"):
-            ws[f'A{current_row}'] = cert_item
-            ws[f'A{current_row}'].font = header_font
-            ws[f'A{current_row}'].alignment = left_alignment
-        elif cert_item.startswith("5."):
-            # Special handling for point 5 - span columns A to E with wrap text and proper height
-            ws.merge_cells(f'A{current_row}:E{current_row}')
-            ws[f'A{current_row}'] = cert_item
-            ws[f'A{current_row}'].font = small_font
-            ws[f'A{current_row}'].alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
-            ws.row_dimensions[current_row].height = 26  # Set to 26 points as requested
-        else:
-            ws[f'A{current_row}'] = cert_item
-            ws[f'A{current_row}'].font = small_font
-            ws[f'A{current_row}'].alignment = left_alignment
-        current_row += 1
-    
-    # Signature section - no borders, proper layout
-    current_row += 1
-    
-    # Signature items with PWD Electric Div.- Udaipur below Executive Engineer - no blank rows
-    signature_items = [
-        ("Divisional Accountant", "Assistant Engineer", "Executive Engineer"),
-        ("", "", "PWD Electric Div.- Udaipur")  # Directly below Executive Engineer
-    ]
-    
-    for sig_row in signature_items:
-        for col_idx, sig_text in enumerate(sig_row):
-            col_letter = chr(65 + col_idx * 2)  # A, C, E (spacing between signatures)
-            if sig_text:  # Only write if there's text
-                ws[f'{col_letter}{current_row}'] = sig_text
-                ws[f'{col_letter}{current_row}'].font = normal_font
-                ws[f'{col_letter}{current_row}'].alignment = center_alignment
-                # No border for signature section
-        current_row += 1
-    
-    # Auto-adjust column widths with better formatting for wrapped text
-    column_widths = {'A': 30, 'B': 5, 'C': 25, 'D': 25, 'E': 25, 'F': 15, 'G': 15, 'H': 15}
-    for col, width in column_widths.items():
-        ws.column_dimensions[col].width = width
-    
-    # Set row heights for better appearance
-    for row_num in range(1, current_row + 5):
-        ws.row_dimensions[row_num].height = 20
-    
-    # Ensure certificate point 5 maintains its 26 point height (override general setting)
-    # Find the certificate point 5 row and set its height to 26
-    for row_num in range(1, current_row + 5):
-        cell_value = ws[f'A{row_num}'].value
-        if cell_value and str(cell_value).startswith("5."):
-            ws.row_dimensions[row_num].height = 26
-            break
-    
-    # Special case: Double the height of row 32 (~40 points)
-    ws.row_dimensions[32].height = 40
-    
-    # Setup default print layout for all sheets
-    setup_default_print_layout(ws)
-    
-    return ws
+def create_single_work_sheet(wb, work, work_idx, profile=DEFAULT_PROFILE):
+    """Create a single work sheet with enhanced formatting for the given division
+    
+    The layout comes from form_model, which the Word, PDF and HTML exports
+    share, so every format prints the same form.
+    """
+    sheet_name = create_sheet_name(work.contractor, work.agreement_no)
+    return write_xlsx_sheet(wb, build_form_model(work, sheet_name, profile))
 
-def setup_default_print_layout(ws):
-    """Setup default print layout for all sheets to fit on 1 page"""
-    
-    # Set print area to cover all content (A1 to E with last row)
-    # Find the last row with content
-    last_row = 0
-    for row_num in range(1, 50):  # Check up to row 50
-        if ws[f'A{row_num}'].value is not None:
-            last_row = row_num
-    
-    # Set print area to A1:E{last_row + 2} to ensure all content is included
-    print_area = f'A1:E{last_row + 2}'
-    ws.print_area = print_area
-    
-    # Set page setup for A4 portrait
-    ws.page_setup.paperSize = 9  # A4 paper size
-    ws.page_setup.orientation = 'portrait'
-    
-    # Set smaller margins to fit more content
-    ws.page_margins.left = 0.5
-    ws.page_margins.right = 0.5
-    ws.page_margins.top = 0.5
-    ws.page_margins.bottom = 0.5
-    ws.page_margins.header = 0.2
-    ws.page_margins.footer = 0.2
-    
-    # Set scaling to fit to 1 page wide and tall
-    ws.page_setup.fitToWidth = 1
-    ws.page_setup.fitToHeight = 1  # Fit to 1 page tall
-    
-    # Center the page horizontally
-    ws.print_options.horizontalCentered = True
-    
-    # Set header and footer
-    ws.oddHeader.center.text = "Security Deposit Refund Form"
-    ws.oddFooter.center.text = "Page &P of &N"
+def setup_default_print_layout(ws, last_row=None):
+    """Setup default print layout for all sheets to fit on 1 page
+    
+    last_row is the last row with content in column A, as tracked by the
+    writer; without it the sheet's existing extent is used (no cell probing).
+    """
+    apply_print_profile(ws, last_row or ws.max_row)
 
-def create_security_refund_sheet(data_batch, batch_number, agreement_year=None):
-    """Create a security refund workbook with 25 separate sheets, one per work"""
+def create_security_refund_sheet(data_batch, batch_number, agreement_year=None, on_error=None,
+                                 profile=DEFAULT_PROFILE):
+    """Create a security refund workbook with 25 separate sheets, one per work
+    
+    When on_error is given, a work whose sheet fails to render is dropped
+    from the workbook and passed to on_error(work, exception) instead of
+    aborting the whole batch.
+    """
     
     # Create a new workbook
     wb = openpyxl.Workbook()
@@ -366,8 +128,18 @@ def create_security_refund_sheet(data_batch, batch_number, agreement_year=None):
     wb.remove(wb.active)
     
     # Process each work in the batch and create a separate sheet
-    for work_idx, (_, row) in enumerate(data_batch.iterrows(), 1):
-        create_single_work_sheet(wb, row, work_idx)
+    for work_idx, work in enumerate(iter_work_orders(data_batch), 1):
+        if on_error is None:
+            create_single_work_sheet(wb, work, work_idx, profile)
+            continue
+        sheet_count = len(wb.worksheets)
+        try:
+            create_single_work_sheet(wb, work, work_idx, profile)
+        except Exception as e:
+            # Drop the half-written sheet, keep the rest of the batch
+            for ws in wb.worksheets[sheet_count:]:
+                wb.remove(ws)
+            on_error(work, e)
     
     # Add VBA macro for print functionality
     add_print_macro(wb)
@@ -418,31 +190,88 @@ End Sub
     # The print button will work with Excel's built-in print functionality
     # Users can manually add this VBA code if they want advanced print control
 
-def split_data_into_batches(df, batch_size=25):
-    """Split dataframe into batches of specified size"""
-    batches = []
+# Grouping keys accepted by the batch planner, mapped to the master column they read
+BATCH_GROUP_COLUMNS = {
+    'contractor': 'Name of Contractor',
+    'sub-division': 'Sub Division',
+    'fiscal-year': 'Agreement No.',
+}
+
+def _batch_group_keys(df, group_by):
+    """Build one grouping key per row for the requested planner grouping"""
+    column = BATCH_GROUP_COLUMNS.get(group_by, group_by)
+    if column not in df.columns:
+        logger.warning("Column '%s' not found, batching without grouping", column)
+        return None
+    
+    values = df[column].fillna('').astype(str)
+    if group_by == 'contractor':
+        return normalize_contractor_names(df[column])
+    if group_by == 'fiscal-year':
+        return extract_fiscal_years(df[column])
+    return values.str.strip()
+
+def plan_batches(df, batch_size=25, group_by=None, balance=False):
+    """Plan batches as row-position arrays, optionally grouped and size-balanced
+    
+    Returns a list of (group_key, positions) tuples. Positions index into df
+    with .iloc / .take, so no DataFrame is copied while planning. With
+    balance=True every group is cut into equally sized batches (sizes differ
+    by at most one) instead of full batches followed by a short remainder.
+    """
     total_rows = len(df)
+    if total_rows == 0:
+        return []
+    
+    keys = _batch_group_keys(df, group_by) if group_by else None
+    if keys is None:
+        groups = [(None, np.arange(total_rows))]
+    else:
+        # groupby preserves file order of rows inside each group
+        groups = list(keys.groupby(keys.values, sort=True).indices.items())
+    
+    plan = []
+    for key, positions in groups:
+        if balance:
+            batch_count = -(-len(positions) // batch_size)
+            chunks = np.array_split(positions, batch_count)
+        else:
+            chunks = [positions[i:i+batch_size] for i in range(0, len(positions), batch_size)]
+        plan.extend((key, chunk) for chunk in chunks)
+    
+    return plan
+
+def split_data_into_batches(df, batch_size=25, group_by=None, balance=False):
+    """Split dataframe into batches of specified size
     
-    for i in range(0, total_rows, batch_size):
-        batch = df.iloc[i:i+batch_size].copy()
-        batch_number = (i // batch_size) + 1
-        batches.append((batch, batch_number))
+    Contiguous batches are handed out as .iloc slices (views, not copies);
+    grouped batches are taken by row position only when the plan is built.
+    """
+    batches = []
+    
+    for batch_number, (group_key, positions) in enumerate(plan_batches(df, batch_size, group_by, balance), 1):
+        batches.append((take_batch(df, positions, group_key), batch_number))
     
     return batches
 
+def group_file_label(group_key):
+    """File-name safe label of a batch group, e.g. 'arun electricals' -> 'Arun_Electricals'"""
+    return re.sub(r'[^A-Za-z0-9-]+', '_', str(group_key).title()).strip('_') or 'Unknown'
+
+def take_batch(df, positions, group_key=None):
+    """Materialize one planned batch (a slice view when rows are contiguous)"""
+    if group_key is None:
+        return df.iloc[positions[0]:positions[-1] + 1]
+    return df.take(positions)
+
 def get_agreement_year_from_data(df):
-    """Extract agreement year from the data for naming convention"""
+    """Extract the most common agreement start year from the data for naming convention"""
     try:
-        # Try to extract year from Agreement No or Start Date
-        if 'Agreement No' in df.columns:
-            # Look for year pattern in agreement numbers
-            sample_agreement = str(df['Agreement No'].iloc[0]) if not df.empty else ''
-            if len(sample_agreement) >= 4:
-                # Try to find 4-digit year
-                for i in range(len(sample_agreement) - 3):
-                    year_candidate = sample_agreement[i:i+4]
-                    if year_candidate.isdigit() and 2000 <= int(year_candidate) <= 2030:
-                        return year_candidate
+        if 'Agreement No.' in df.columns and not df.empty:
+            fiscal_years = extract_fiscal_years(df['Agreement No.'])
+            known_years = fiscal_years[fiscal_years != 'Unknown']
+            if not known_years.empty:
+                return known_years.mode().iloc[0][:4]
         
         # Fallback to current year
         return datetime.now().strftime('%Y')
@@ -458,8 +287,6 @@ def read_work_data_from_txt(file_path):
         # The file is all on one line, so we need to split it properly
         # Looking at the structure, each work order starts with a number followed by the work name
         
-        import re
-        
         # Split the content by work order numbers (1, 2, 3, etc.)
         # Each work order starts with a number followed by the work description
         work_entries = re.split(r'(?=\d+[A-Z])', content)
@@ -521,63 +348,242 @@ def read_work_data_from_txt(file_path):
                     works.append(work_data)
         
         df = pd.DataFrame(works)
-        print(f"Successfully read {len(df)} works from {file_path}")
+        logger.info("Successfully read %d works from %s", len(df), file_path)
         return df
         
     except Exception as e:
-        print(f"Error reading text file: {e}")
+        logger.error("Error reading text file: %s", e)
         return None
 
-def main():
-    """Main function to process Excel file and generate security refund sheets"""
-    
-    excel_file = 'work_order_master.xlsx'
-    
-    print("Reading Excel file Work Orders...")
+def check_input_schema(df, strict=False):
+    """Validate input columns and rows before any workbook is built
+    
+    Returns (normalized_df, issues), or (None, issues) when the run must be
+    rejected: a required column is missing, or strict mode and any row has
+    an error-level problem.
+    """
+    df, missing_columns, issues = validate_work_orders(df)
+    
+    if missing_columns:
+        logger.error("Required columns missing: %s", missing_columns)
+        logger.error("Columns found: %s", list(df.columns))
+        return None, issues
+    
+    if not issues.empty:
+        error_count = int((issues['Severity'] == 'error').sum())
+        logger.warning("Validation found %d errors and %d warnings:", error_count, len(issues) - error_count)
+        for issue in issues.head(20).itertuples(index=False):
+            logger.warning("  Row %s [%s] %s: %s (%r)", issue.Row, issue.Severity, issue.Column, issue.Problem,
+                           issue.Value)
+        if len(issues) > 20:
+            logger.warning("  ... %d more", len(issues) - 20)
+        if strict and error_count:
+            return None, issues
+    
+    return df, issues
+
+def drop_duplicate_work_orders(df):
+    """Remove repeated work orders before any form is generated
+    
+    Returns (deduplicated_df, conflicts); conflicts lists the dropped
+    duplicates and the agreement conflicts that were kept for review.
+    """
+    keep, conflicts = find_duplicate_work_orders(df)
+    if not conflicts.empty:
+        dropped = int((~keep).sum())
+        logger.warning("Duplicate check: %d duplicate rows dropped, %d conflicts kept for review:", dropped,
+                       len(conflicts) - dropped)
+        for row, first_row, kind, action in conflicts[['Row', 'First Row', 'Kind', 'Action']].head(20).itertuples(
+                index=False):
+            logger.warning("  Row %s %s of row %s (%s)", row, kind, first_row, action)
+        if len(conflicts) > 20:
+            logger.warning("  ... %d more", len(conflicts) - 20)
+    return df[keep.values], conflicts
+
+def main(excel_file='work_order_master.xlsx', batch_size=25, group_by=None, balance=False, strict=False,
+         resume_dir=None, profile=DEFAULT_PROFILE, sheet_workers=None, deduplicate=True, ledger_files=(),
+         compact=False):
+    """Main function to process Excel file and generate security refund sheets
+    
+    Exact and near duplicate work orders are dropped before batching (see
+    Conflict_Report.csv) unless deduplicate is False. With ledger_files, each
+    work's SD total from the deduction ledgers fills "Amount of Deposit" and
+    the Total row, in figures and words. Pass resume_dir to continue an interrupted run in its output directory;
+    batches recorded in its run journal are skipped. profile selects the
+    division whose office name and signatories are printed. With
+    sheet_workers, large batches (e.g. a whole contractor) have their sheets
+    rendered by that many worker processes and assembled into one workbook.
+    With compact, workbooks are saved size-optimized (see xlsx_compact).
+    Returns False when the input is rejected or a batch could not be saved.
+    """
+    
+    setup_logging()
+    started = time.perf_counter()
+    logger.info("Reading Excel file Work Orders...")
     df = read_excel_data(excel_file, 'Work Orders')
     
     if df is None:
-        print("Failed to read Excel file. Please check the file path and sheet name.")
-        return
+        logger.error("Failed to read Excel file. Please check the file path and sheet name.")
+        return False
     
-    print(f"Total works found: {len(df)}")
+    # Map column aliases and check the whole input before generating anything
+    df, issues = check_input_schema(df, strict)
+    if df is None:
+        logger.error("Input rejected. Fix the rows above and run again.")
+        return False
     
-    # Get agreement year for naming
-    agreement_year = get_agreement_year_from_data(df)
-    print(f"Using agreement year: {agreement_year}")
+    logger.info("Total works found: %d", len(df))
+    conflicts = None
+    if deduplicate:
+        df, conflicts = drop_duplicate_work_orders(df)
+    if ledger_files:
+        df, matched = read_sd_amounts(df, ledger_files)
+        logger.info("SD amounts from %d ledgers filled for %d of %d works", len(ledger_files), matched, len(df))
     
-    # Split data into batches
-    batches = split_data_into_batches(df, 25)
-    print(f"Created {len(batches)} batches")
+    # Fiscal year of every work, e.g. "104/2020-21" -> "2020-21"
+    fiscal_years = extract_fiscal_years(df['Agreement No.'])
+    logger.info("Fiscal years found: %s", ', '.join(sorted(fiscal_years.unique())))
     
     # Create output directory with timestamp to avoid permission issues
-    from datetime import datetime
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_dir = f"Security_Refund_Sheets_{agreement_year}_{timestamp}"
+    if resume_dir:
+        output_dir = resume_dir
+        logger.info("Resuming run in '%s'", output_dir)
+    else:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_dir = f"Security_Refund_Sheets_{timestamp}"
+        if profile != DEFAULT_PROFILE:
+            output_dir = f"Security_Refund_Sheets_{profile.code}_{timestamp}"
     os.makedirs(output_dir, exist_ok=True)
     
-    # Generate security refund sheets for each batch
-    for batch_idx, (batch_data, batch_number) in enumerate(batches, 1):
-        print(f"Processing batch {batch_idx} with {len(batch_data)} works...")
+    signature = input_signature(df, batch_size=batch_size, group_by=group_by, balance=balance, division=profile)
+    journal = RunJournal.open(output_dir, signature)
+    if journal is None:
+        logger.error("'%s' was generated from different input or batch options; cannot resume it.", output_dir)
+        return False
+    
+    if not issues.empty:
+        issues.to_csv(os.path.join(output_dir, "Validation_Report.csv"), index=False)
+    if conflicts is not None and not conflicts.empty:
+        conflicts.to_csv(os.path.join(output_dir, "Conflict_Report.csv"), index=False)
+    
+    # Worker processes for sheet-level parallelism, reused by every large batch
+    sheet_executor = None
+    if sheet_workers and sheet_workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        from parallel_workbook import MIN_SHEETS_PER_WORKER, create_security_refund_sheet_parallel
+        sheet_executor = ProcessPoolExecutor(max_workers=sheet_workers)
+        # Workers map the snapshot's pages instead of receiving pickled rows
+        snapshot = load_fresh_snapshot(excel_file, 'Work Orders')
+    
+    # One sub-directory and batch series per fiscal year
+    workbook_count = 0
+    sheet_count = 0
+    skipped_count = 0
+    quarantined_count = 0
+    for fiscal_year, year_df in df.groupby(fiscal_years, sort=True):
+        year_dir = os.path.join(output_dir, f"FY_{fiscal_year}")
+        os.makedirs(year_dir, exist_ok=True)
         
-        # Create security refund sheet
-        wb = create_security_refund_sheet(batch_data, batch_idx, agreement_year)
+        # Plan batches (optionally per contractor / sub-division)
+        batches = plan_batches(year_df, batch_size, group_by, balance)
+        logger.info("Fiscal year %s: %d works in %d batches", fiscal_year, len(year_df), len(batches))
         
-        # Save the file
-        filename = f"Security_Refund_Batch_{batch_idx:02d}_{agreement_year}.xlsx"
-        filepath = os.path.join(output_dir, filename)
-        wb.save(filepath)
-        
-        print(f"Saved: {filepath}")
-    
-    print(f"\nCompleted! Generated {len(batches)} security refund workbooks in '{output_dir}' directory.")
-    print("Each workbook contains:")
-    print("- 25 separate sheets (one per work order)")
-    print("- Sheet names: First name of contractor + agreement number")
-    print("- Enhanced formatting with elegant borders and professional styling")
-    print("- Default 'Satisfactory' status for security refund")
-    print("- All relevant work order data")
-    print("- Print-ready format with proper spacing and alignment")
+        # Generate security refund sheets for each batch
+        for batch_idx, (group_key, positions) in enumerate(batches, 1):
+            batch_key = f"{fiscal_year}/{batch_idx:02d}"
+            if journal.is_done(batch_key):
+                skipped_count += 1
+                continue
+            
+            batch_data = take_batch(year_df, positions, group_key)
+            logger.debug("Processing batch %d with %d works...", batch_idx, len(batch_data))
+            
+            # Create security refund sheet; bad rows go to the quarantine file
+            def quarantine(work, error):
+                nonlocal quarantined_count
+                quarantined_count += 1
+                logger.warning("Quarantined %s / %s: %s", work.contractor, work.agreement_no, error)
+                journal.quarantine(batch_key, work, error)
+            
+            if sheet_executor and len(batch_data) >= 2 * MIN_SHEETS_PER_WORKER:
+                wb = create_security_refund_sheet_parallel(batch_data, batch_idx, fiscal_year, on_error=quarantine,
+                                                           profile=profile, executor=sheet_executor,
+                                                           workers=sheet_workers, snapshot=snapshot)
+            else:
+                wb = create_security_refund_sheet(batch_data, batch_idx, fiscal_year, on_error=quarantine,
+                                                  profile=profile)
+            if wb is None or not wb.worksheets:
+                # openpyxl cannot save a workbook without sheets
+                logger.warning("Batch %d: every row was quarantined; nothing to save.", batch_idx)
+                continue
+            
+            # Save the file (grouped batches carry their group in the name)
+            filename = f"Security_Refund_Batch_{batch_idx:02d}_{fiscal_year}.xlsx"
+            if group_key is not None:
+                filename = f"Security_Refund_Batch_{batch_idx:02d}_{fiscal_year}_{group_file_label(group_key)}.xlsx"
+            filepath = os.path.join(year_dir, filename)
+            
+            # Save next to the target and swap in, so a locked or interrupted
+            # save never leaves a truncated workbook behind
+            try:
+                if compact:
+                    save_compact(wb, filepath + '.tmp')
+                else:
+                    wb.save(filepath + '.tmp')
+                os.replace(filepath + '.tmp', filepath)
+            except OSError as e:
+                logger.error("Error saving %s: %s", filepath, e)
+                journal.record_failure(batch_key, e)
+                continue
+            
+            journal.record_batch(batch_key, os.path.relpath(filepath, output_dir), wb.sheetnames)
+            workbook_count += 1
+            
+            sheet_count += len(wb.sheetnames)
+            logger.info("Saved: %s", filepath)
+    
+    if sheet_executor:
+        sheet_executor.shutdown()
+    
+    # Run summary
+    elapsed = time.perf_counter() - started
+    logger.info("Completed! Generated %d workbooks (%d sheets) in '%s' in %.1fs (%.0f sheets/s).",
+                workbook_count, sheet_count, output_dir, elapsed, sheet_count / elapsed if elapsed else 0)
+    if skipped_count:
+        logger.info("Skipped %d batches already finished by an earlier attempt.", skipped_count)
+    if quarantined_count:
+        logger.warning("Quarantined %d rows into '%s'.", quarantined_count, QUARANTINE_FILENAME)
+    if journal.failures:
+        logger.warning("%d batches failed to save; run again with resume_dir='%s' to retry them.",
+                       len(journal.failures), output_dir)
+    if not issues.empty:
+        logger.info("Validation issues: %d (see Validation_Report.csv)", len(issues))
+    if conflicts is not None and not conflicts.empty:
+        logger.info("Duplicates and conflicts: %d (see Conflict_Report.csv)", len(conflicts))
+    return not journal.failures
+
+def generate_for_divisions(profiles_file, **options):
+    """Generate forms for every division listed in a profiles JSON file, in one process
+    
+    Each profile's master_file is processed with that division's office name
+    and signatories; styles are built once per profile and reused. Returns
+    False when any division failed (the others are still generated).
+    """
+    setup_logging()
+    try:
+        profiles = load_division_profiles(profiles_file)
+    except (OSError, ValueError) as e:
+        logger.error("Cannot read division profiles from %s: %s", profiles_file, e)
+        return False
+    logger.info("Generating forms for %d divisions", len(profiles))
+    failed = []
+    for profile in profiles:
+        logger.info("=== %s (%s) ===", profile.office_name, profile.master_file)
+        if not main(profile.master_file, profile=profile, **options):
+            failed.append(profile.code)
+    if failed:
+        logger.error("Generation failed for %d divisions: %s", len(failed), ', '.join(failed))
+    return not failed
 
 if __name__ == "__main__":
     main()
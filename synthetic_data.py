@@ -0,0 +1,279 @@
+"""
+Seeded synthetic work-order master and deduction ledgers for load testing
+Writes a work_order_master.xlsx ('Work Orders' sheet) and deduction ledgers
+in the layout of the real files, at any scale up to 100k works and 1M
+deduction lines. The data is messy in the same ways the real inputs are:
+- M/s, M/s. and Shri prefixes, case, spacing and typos in contractor names
+- dd/mm/yyyy, dd-mm-yyyy, dd.mm.yyyy, ISO and real Excel dates in one column
+- agreement numbers written as "104/2020-21", "104 of 2020-21",
+  "0104/2020-2021", "104/2020/21" or "104 2020-21", spread over thirteen
+  fiscal years
+- SD amounts as numbers, "29,280" text or "₹ 9038"
+- a few repeated work orders
+The same seed always gives the same rows.
+
+    python synthetic_data.py [WORKS] [LINES] [SEED] [OUTPUT_DIR]
+    python synthetic_data.py 100000 1000000 7 load_test
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from sd_logging import get_logger, setup_logging
+
+logger = get_logger(__name__)
+
+DEFAULT_OUTPUT_DIR = "Synthetic_Data"
+MASTER_FILENAME = "work_order_master.xlsx"
+LEDGER_FILENAME = "deductions_synthetic_{:03d}.xlsx"
+LEDGER_ROWS_PER_FILE = 100_000  # whole contractors per file, so a file may run a little over
+FIRST_FISCAL_YEAR, LAST_FISCAL_YEAR = 2013, 2025
+DUPLICATE_RATE = 0.005  # share of master rows repeated (half exact, half with a respelled work)
+BLANK_COMPLETION_RATE = 0.1  # works still running
+TYPO_RATE = 0.02
+
+MASTER_COLUMNS = ['s.no.', 'Name of Contractor', 'Name of Work', 'Agreement No.', 'Date of Commencement',
+                  'Stipulated date of Completion', 'Actual Date of Completion']
+# Headers as the real ledger spells them (trailing space included)
+LEDGER_COLUMNS = ['Contractor Name', 'Name Of work ', 'SD', 'MD-V', 'Voucher No.', 'Date', 'Agreement No.',
+                  'Date of Commencement', 'Stipulated date of Completion', 'Actual Date of Completion']
+
+NAME_WORDS = ('Abhinav', 'Arun', 'Balaji', 'Bharat', 'Ganpati', 'Goyal', 'Govindam', 'Gupta', 'Kartik', 'Khatri',
+              'Mahadev', 'Mandore', 'Meena', 'Metro', 'Mitul', 'Neha', 'Omega', 'Patel', 'Powertech', 'Sai Kripa',
+              'Seema', 'Shubham', 'Taniya', 'Techno', 'Vikas', 'Vimal', 'Yashaswini', 'R S', 'H M', 'S K')
+TRADE_WORDS = ('Electricals', 'Enterprises', 'Electric', 'Engineers', 'Traders', 'Electric Works',
+               'Engineering and Suppliers', 'Electric Company', 'Industries Pvt Ltd', 'Fire Safety Centre',
+               'Elevators', 'Communication Services', 'Electricals and Maintenance')
+WORK_TEMPLATES = (
+    'E/F work in {building} at {place}',
+    'E/f in {building} {place}',
+    'Electric Repair and Maintenance work at {building} {place}',
+    'Electric Repair & Maintenance Work in {building}, {place}',
+    'Internal electrification of {building} at {place}',
+    'SITC of {equipment} in {building} at {place}',
+    'Hire Charges of {equipment} for VIP Visit at {place}',
+    'Supply of Electricians for general Electric maintenance at {building} {place}',
+    'Remaining electric work of {building} at {place}',
+)
+BUILDINGS = ('Govt. Sr. Sec. School Building', 'PHC', 'Tehsil Building', 'Circuit House', 'ADJ Court',
+             'Girls Hostel', 'Residential Quarters', 'Police Thana', 'District Court Campus', 'Collectorate',
+             'Govt College Building', 'Panchayat Samiti Bhawan', 'Veterinary Hospital', 'Excise Building')
+PLACES = ('Udaipur', 'Rajsamand', 'Nathdwara', 'Kherwara', 'Jhadol', 'Salumber', 'Amet', 'Railmagra', 'Gogunda',
+          'Mavli', 'Vallabhnagar', 'Kotra', 'Sarada', 'Rishabhdev')
+EQUIPMENT = ('ACs', 'DG set', 'Transformer', 'Fire fighting system', 'Lift', 'Solar street lights',
+             'Flood lights', 'LED lights')
+
+# Share of each date spelling in one column; 'excel' writes a real date cell
+DATE_FORMATS = {'%d/%m/%Y': 0.7, '%d-%m-%Y': 0.1, '%d.%m.%Y': 0.05, '%Y-%m-%d': 0.05, 'excel': 0.1}
+# Agreement spellings: serial/year-pair, e.g. 104 and 2020-21
+AGREEMENT_FORMATS = {'{s}/{y}-{e}': 0.65, '{s} of {y}-{e}': 0.12, '{s} / {y}-{e}': 0.08, '{s:0>4}/{y}-20{e}': 0.05,
+                     '{s}/{y}/{e}': 0.05, '{s} {y}-{e}': 0.05}
+NAME_PREFIXES = {'': 0.7, 'M/s ': 0.15, 'M/s. ': 0.1, 'Shri ': 0.05}
+
+
+def _pick(rng, options, size):
+    """Random keys of an {option: probability} dict"""
+    keys = list(options)
+    return np.array(keys, dtype=object)[rng.choice(len(keys), size=size, p=list(options.values()))]
+
+
+def _typos(rng, text, rate=TYPO_RATE):
+    """Drop or double one letter in about rate of the values"""
+    text = text.copy()
+    for position in np.flatnonzero(rng.random(len(text)) < rate):
+        value = text.iat[position]
+        if len(value) > 4:
+            at = int(rng.integers(1, len(value) - 1))
+            dropped = rng.random() < 0.5
+            text.iat[position] = value[:at] + value[at + 1:] if dropped else value[:at] + value[at] + value[at:]
+    return text
+
+
+def contractor_pool(rng, count):
+    """count distinct clean contractor names"""
+    names, seen = [], set()
+    while len(names) < count:
+        name = f"{NAME_WORDS[rng.integers(len(NAME_WORDS))]} {TRADE_WORDS[rng.integers(len(TRADE_WORDS))]}"
+        if name in seen:
+            name = f"{name} {len(names)}"  # larger pools run out of word pairs
+        seen.add(name)
+        names.append(name)
+    return np.array(names, dtype=object)
+
+
+def messy_names(rng, names):
+    """Contractor names as typed by different clerks: prefixes, case, spacing and typos"""
+    text = pd.Series(names, dtype=object)
+    text = pd.Series(_pick(rng, NAME_PREFIXES, len(text)), dtype=object) + text
+    case = rng.random(len(text))
+    text = text.where(case >= 0.08, text.str.upper()).where((case < 0.08) | (case >= 0.12), text.str.lower())
+    spaced = rng.random(len(text)) < 0.05
+    text = text.where(~spaced, text.str.replace(' ', '  ', n=1, regex=False))
+    return _typos(rng, text).to_numpy()
+
+
+def work_names(rng, count):
+    templates = rng.integers(len(WORK_TEMPLATES), size=count)
+    buildings = rng.integers(len(BUILDINGS), size=count)
+    places = rng.integers(len(PLACES), size=count)
+    equipment = rng.integers(len(EQUIPMENT), size=count)
+    return np.array([WORK_TEMPLATES[t].format(building=BUILDINGS[b], place=PLACES[p], equipment=EQUIPMENT[e])
+                     for t, b, p, e in zip(templates, buildings, places, equipment)], dtype=object)
+
+
+def agreement_numbers(rng, serials, start_years):
+    """Agreement numbers in a random mix of the spellings found in masters and ledgers"""
+    formats = _pick(rng, AGREEMENT_FORMATS, len(serials))
+    end_years = (start_years + 1) % 100
+    return np.array([fmt.format(s=s, y=y, e=f"{e:02d}") for fmt, s, y, e in zip(formats, serials, start_years,
+                                                                                 end_years)], dtype=object)
+
+
+def mixed_dates(rng, dates):
+    """Dates spelled in a random mix of DATE_FORMATS; NaT stays blank"""
+    dates = pd.Series(pd.DatetimeIndex(dates))
+    formats = _pick(rng, DATE_FORMATS, len(dates))
+    values = np.empty(len(dates), dtype=object)
+    for fmt in DATE_FORMATS:
+        chosen = formats == fmt
+        if fmt == 'excel':
+            values[chosen] = dates[chosen].dt.to_pydatetime().to_numpy(dtype=object)
+        else:
+            values[chosen] = dates[chosen].dt.strftime(fmt).to_numpy(dtype=object)
+    values[dates.isna().to_numpy()] = None
+    return values
+
+
+def build_master(rng, works):
+    """(master frame as written, per-work facts the ledgers are drawn from)"""
+    contractor_count = max(10, works // 50)
+    pool = contractor_pool(rng, contractor_count)
+    # A few contractors hold most works, as in the real master
+    weights = 1.0 / np.arange(1, contractor_count + 1) ** 0.8
+    contractors = rng.choice(contractor_count, size=works, p=weights / weights.sum())
+
+    start_years = rng.integers(FIRST_FISCAL_YEAR, LAST_FISCAL_YEAR + 1, size=works)
+    serials = pd.Series(start_years).groupby(start_years).cumcount().to_numpy() + 1
+    commencement = (pd.to_datetime(pd.Series(start_years).astype(str) + '-04-01')
+                    + pd.to_timedelta(rng.integers(0, 365, size=works), unit='D'))
+    stipulated = commencement + pd.to_timedelta(rng.integers(30, 540, size=works), unit='D')
+    actual = stipulated + pd.to_timedelta(rng.integers(-60, 180, size=works), unit='D')
+    actual[rng.random(works) < BLANK_COMPLETION_RATE] = pd.NaT
+
+    facts = pd.DataFrame({
+        'contractor': pool[contractors],
+        'work': work_names(rng, works),
+        'serial': serials,
+        'start_year': start_years,
+        'commencement': commencement,
+        'stipulated': stipulated,
+        'actual': actual,
+    })
+    master = pd.DataFrame({
+        'Name of Contractor': messy_names(rng, facts['contractor'].to_numpy()),
+        'Name of Work': facts['work'].to_numpy(),
+        'Agreement No.': agreement_numbers(rng, serials, start_years),
+        'Date of Commencement': mixed_dates(rng, commencement),
+        'Stipulated date of Completion': mixed_dates(rng, stipulated),
+        'Actual Date of Completion': mixed_dates(rng, actual),
+    })
+
+    # Repeated rows: half verbatim, half with the work respelled
+    repeats = rng.choice(works, size=int(works * DUPLICATE_RATE), replace=False)
+    copies = master.iloc[repeats].copy()
+    respelled = np.arange(len(copies)) % 2 == 1
+    copies.loc[respelled, 'Name of Work'] = _typos(rng, copies.loc[respelled, 'Name of Work'], rate=1.0).to_numpy()
+    order = np.argsort(np.concatenate([np.arange(works), rng.integers(0, works, size=len(copies))]), kind='stable')
+    master = pd.concat([master, copies], ignore_index=True).iloc[order].reset_index(drop=True)
+    master.insert(0, 's.no.', np.arange(1, len(master) + 1))
+    return master[MASTER_COLUMNS], facts
+
+
+def build_ledger(rng, facts, lines):
+    """Deduction lines drawn over the works, sorted by contractor then voucher date"""
+    works = rng.integers(len(facts), size=lines)
+    work_facts = facts.iloc[works].reset_index(drop=True)
+
+    sd = rng.integers(500, 60000, size=lines)
+    sd_text = pd.Series(sd, dtype=object)
+    spelling = rng.random(lines)
+    sd_text = sd_text.where(spelling >= 0.1, pd.Series([f"{value:,}\xa0" for value in sd], dtype=object))
+    sd_text = sd_text.where((spelling < 0.1) | (spelling >= 0.15), pd.Series([f"₹ {value}" for value in sd],
+                                                                             dtype=object))
+    md = rng.integers(1000, 250000, size=lines).astype(float)
+    md[rng.random(lines) < 0.7] = np.nan
+    voucher_dates = work_facts['commencement'] + pd.to_timedelta(rng.integers(30, 900, size=lines), unit='D')
+
+    ledger = pd.DataFrame({
+        'Contractor Name': messy_names(rng, work_facts['contractor'].to_numpy()),
+        'Name Of work ': work_facts['work'].to_numpy(),
+        'SD': sd_text.to_numpy(),
+        'MD-V': md,
+        'Voucher No.': rng.integers(10000, 100000, size=lines),
+        'Date': mixed_dates(rng, voucher_dates),
+        'Agreement No.': agreement_numbers(rng, work_facts['serial'].to_numpy(), work_facts['start_year'].to_numpy()),
+        'Date of Commencement': mixed_dates(rng, work_facts['commencement']),
+        'Stipulated date of Completion': mixed_dates(rng, work_facts['stipulated']),
+        'Actual Date of Completion': mixed_dates(rng, work_facts['actual']),
+    })
+    order = pd.DataFrame({'contractor': work_facts['contractor'], 'date': voucher_dates}).sort_values(
+        ['contractor', 'date'], kind='stable').index.to_numpy()
+    return ledger[LEDGER_COLUMNS].iloc[order].reset_index(drop=True), work_facts['contractor'].to_numpy()[order]
+
+
+def ledger_chunks(contractors, rows_per_file=LEDGER_ROWS_PER_FILE):
+    """(start, stop) row ranges of the sorted ledger, never splitting a contractor"""
+    boundaries = np.flatnonzero(contractors[1:] != contractors[:-1]) + 1
+    chunks, start = [], 0
+    for boundary in list(boundaries) + [len(contractors)]:
+        if boundary - start >= rows_per_file or boundary == len(contractors):
+            chunks.append((start, boundary))
+            start = boundary
+    return [chunk for chunk in chunks if chunk[1] > chunk[0]]
+
+
+def write_rows(path, sheet_name, df):
+    """Stream a frame to xlsx (write-only mode keeps memory flat at any row count)"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    ws.append(list(df.columns))
+    values = df.astype(object).where(df.notna(), None)
+    for row in values.itertuples(index=False, name=None):
+        ws.append(row)
+    wb.save(path)
+
+
+def main(works=1000, lines=10000, seed=7, output_dir=DEFAULT_OUTPUT_DIR):
+    """Write the master and ledgers for one seed; returns (master path, ledger paths)"""
+    setup_logging()
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+
+    master, facts = build_master(rng, works)
+    master_path = os.path.join(output_dir, MASTER_FILENAME)
+    write_rows(master_path, 'Work Orders', master)
+    logger.info("Master: %d works (%d repeated) -> %s", len(master), len(master) - works, master_path)
+
+    ledger_paths = []
+    if lines:
+        ledger, contractors = build_ledger(rng, facts, lines)
+        for number, (start, stop) in enumerate(ledger_chunks(contractors), 1):
+            path = os.path.join(output_dir, LEDGER_FILENAME.format(number))
+            write_rows(path, 'Sheet1', ledger.iloc[start:stop])
+            ledger_paths.append(path)
+            logger.debug("Ledger %s: %d lines", path, stop - start)
+        logger.info("Ledgers: %d deduction lines in %d files", len(ledger), len(ledger_paths))
+
+    logger.info("Synthetic data (seed %d) written to '%s' in %.1fs", seed, output_dir,
+                time.perf_counter() - started)
+    return master_path, ledger_paths
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(*[int(value) for value in args[:3]], *args[3:4])
@@ -1,16 +1,39 @@
 import os
 from openpyxl import load_workbook
+from openpyxl.styles import Border, Side
+
+from print_layout import apply_print_profile
+from sd_logging import get_logger, setup_logging
+from xlsx_patcher import patch_workbook
+
+logger = get_logger(__name__)
 
 # Use path relative to this script so it works on Windows too
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 TARGET_DIR = os.path.join(SCRIPT_DIR, "Security_Refund_Sheets_2025_20250903_033335")
 
+def scan_column_a(ws):
+    """Find the certificate start row and last column-A row in one pass
+    
+    Only rows up to the sheet's max_row are read, so the sheet does not grow
+    (blank cells created on the way are not written back).
+    """
+    cert_start = None
+    last_row = 0
+    for row, (value,) in enumerate(ws.iter_rows(min_col=1, max_col=1, values_only=True), 1):
+        if value is None:
+            continue
+        last_row = row
+        if cert_start is None and isinstance(value, str) and value.strip().startswith("Certified That:-"):
+            cert_start = row
+    return cert_start, last_row
+
+
 def fix_workbook(path):
     wb = load_workbook(path)
+    thin = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
     for ws in wb.worksheets:
         # 1) Apply thin borders for A20:B26
-        from openpyxl.styles import Border, Side
-        thin = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
         for row_idx in range(20, 27):
             for col in ("A", "B"):
                 ws[f"{col}{row_idx}"].border = thin
@@ -19,50 +42,54 @@ def fix_workbook(path):
         ws.row_dimensions[32].height = 40
 
         # 3) Remove borders in certificate section (heuristic: lines after a row that equals "Certified That:-" until signatures)
-        # Find certificate start
-        cert_start = None
-        for r in range(1, ws.max_row + 1):
-            val = ws[f"A{r}"].value
-            if isinstance(val, str) and val.strip().startswith("Certified That:-"):
-                cert_start = r
-                break
+        cert_start, last_row = scan_column_a(ws)
         if cert_start:
             # Clear borders for a reasonable range (up to next 10 lines) until blank then stop
             for r in range(cert_start, min(cert_start + 12, ws.max_row + 1)):
                 for c in ("A", "B", "C", "D", "E"):
                     ws[f"{c}{r}"].border = Border()
 
-        # 4) Ensure no border at A4
-        if ws["A4"].border is not None:
-            ws["A4"].border = Border()
-
-        # 5) Print: A4 portrait one page
-        # Set print area to cover A1:E(last row with content)
-        last_row = 0
-        for r in range(1, ws.max_row + 1):
-            if ws[f"A{r}"].value is not None:
-                last_row = r
-        if last_row:
-            ws.print_area = f"A1:E{last_row+2}"
-        ws.page_setup.paperSize = 9
-        ws.page_setup.orientation = 'portrait'
-        ws.page_margins.left = 0.5
-        ws.page_margins.right = 0.5
-        ws.page_margins.top = 0.5
-        ws.page_margins.bottom = 0.5
-        ws.page_margins.header = 0.2
-        ws.page_margins.footer = 0.2
-        ws.page_setup.fitToWidth = 1
-        ws.page_setup.fitToHeight = 1
-        ws.print_options.horizontalCentered = True
+        # 4) Ensure no border at A4, including the rest of a merged A4 range
+        #    (openpyxl copies A4's borders onto the range's edge cells on load)
+        a4_cells = [ws["A4"]]
+        for merged in ws.merged_cells.ranges:
+            if "A4" in merged:
+                a4_cells = [cell for row in ws[merged.coord] for cell in row]
+        for cell in a4_cells:
+            cell.border = Border()
+
+        # 5) Print: A4 portrait one page, print area from the last column-A row
+        apply_print_profile(ws, last_row, header_text=None, footer_text=None)
 
     wb.save(path)
 
+def repair_workbook(path, engine='xml'):
+    """Repair one workbook in place
+
+    engine='xml' edits the sheet XML directly (fast; the other parts keep their
+    content, though not their compressed bytes); workbooks it cannot parse fall
+    back to the openpyxl path.
+    """
+    name = os.path.basename(path)
+    if engine == 'xml':
+        try:
+            patch_workbook(path)
+            logger.debug("Patched: %s", name)
+            return
+        except Exception as e:
+            logger.warning("XML patch failed for %s (%s); using openpyxl", name, e)
+    fix_workbook(path)
+    logger.debug("Repaired with openpyxl: %s", name)
 
-def main():
-    for name in os.listdir(TARGET_DIR):
-        if name.endswith('.xlsx') and not name.startswith('~$'):
-            fix_workbook(os.path.join(TARGET_DIR, name))
+def main(target_dir=TARGET_DIR, engine='xml', paths=None):
+    """Repair every workbook in target_dir (or only the given paths, e.g. from a layout audit)"""
+    setup_logging()
+    if paths is None:
+        paths = [os.path.join(target_dir, name) for name in os.listdir(target_dir)
+                 if name.endswith('.xlsx') and not name.startswith('~$')]
+    for path in paths:
+        repair_workbook(path, engine)
+    logger.info("Repaired %d workbooks in '%s'", len(paths), target_dir)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,210 @@
+"""
+Watch work_order_master.xlsx and deductions.xlsx and regenerate affected refund sheets
+Saves are debounced until the file has stopped changing and Excel has released
+it; the new rows are diffed against the previous snapshot and only works whose
+master row or deduction lines changed are rendered again, in the background.
+Forms are laid out once by form_export and written in every requested format
+that can be produced here (xlsx and PDF by default), replacing the separate
+PDF batch runs.
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from sd_logging import get_logger, setup_logging
+from work_orders import find_duplicate_work_orders, normalize_agreement_numbers, normalize_columns
+
+logger = get_logger(__name__)
+
+SNAPSHOT_FILENAME = ".sd_watch_snapshot.json"
+DEFAULT_OUTPUT_DIR = os.path.join("Output_Record", "Auto_Updates")
+DEFAULT_FORMATS = ('xlsx', 'pdf')
+
+
+def file_state(path):
+    """(mtime, size) of a file, or None while it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def excel_lock_present(path):
+    """Excel keeps a ~$name lock file next to a workbook while it is open for saving"""
+    folder, name = os.path.split(path)
+    return os.path.exists(os.path.join(folder, '~$' + name))
+
+
+def row_hashes(df):
+    """One stable hash string per row (content only, not position)"""
+    return pd.util.hash_pandas_object(df.astype(str), index=False).astype(str)
+
+
+def load_snapshot(path):
+    """Previous row hashes per watched file"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_snapshot(path, snapshot):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(snapshot, file)
+    os.replace(temp_path, path)
+
+
+class InputWatcher:
+    """Polls the master and ledger files and regenerates sheets for changed works"""
+
+    def __init__(self, master_file='work_order_master.xlsx', ledger_files=('deductions.xlsx',),
+                 output_dir=DEFAULT_OUTPUT_DIR, poll_interval=2.0, settle_seconds=5.0, formats=DEFAULT_FORMATS):
+        self.master_file = master_file
+        self.formats = list(formats)
+        self.ledger_files = list(ledger_files)
+        self.output_dir = output_dir
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.snapshot_path = os.path.join(output_dir, SNAPSHOT_FILENAME)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.seen_states = {}
+        self.pending = {}
+
+    @property
+    def watched_files(self):
+        return [self.master_file] + self.ledger_files
+
+    def poll(self):
+        """Return the files whose latest save has settled since the last poll"""
+        settled = []
+        now = time.monotonic()
+        for path in self.watched_files:
+            state = file_state(path)
+            if state is None or state == self.seen_states.get(path):
+                self.pending.pop(path, None)
+                continue
+            # Debounce: restart the clock on every new (mtime, size)
+            first_seen, pending_state = self.pending.get(path, (now, None))
+            if pending_state != state:
+                self.pending[path] = (now, state)
+                continue
+            if now - first_seen >= self.settle_seconds and not excel_lock_present(path):
+                self.seen_states[path] = state
+                self.pending.pop(path, None)
+                settled.append(path)
+        return settled
+
+    def read_master(self):
+        from security_refund_generator import read_excel_data
+        df = read_excel_data(self.master_file, 'Work Orders')
+        return normalize_columns(df) if df is not None else None
+
+    def changed_agreements(self, path, df, snapshot):
+        """Agreement keys of rows in df that were not in the previous snapshot"""
+        hashes = row_hashes(df)
+        previous = set(snapshot.get(path, []))
+        snapshot[path] = hashes.tolist()
+        if 'Agreement No.' not in df.columns:
+            logger.warning("'%s' has no agreement number column; skipping diff", path)
+            return set()
+        new_rows = ~hashes.isin(previous)
+        return set(normalize_agreement_numbers(df.loc[new_rows.values, 'Agreement No.']))
+
+    def process(self, changed_paths):
+        """Diff changed inputs and regenerate sheets for the affected works"""
+        master = self.read_master()
+        if master is None:
+            logger.error("Master could not be read; will retry on next save.")
+            return
+
+        snapshot = load_snapshot(self.snapshot_path)
+        first_run = self.master_file not in snapshot
+        affected = set()
+
+        if self.master_file in changed_paths or first_run:
+            affected |= self.changed_agreements(self.master_file, master, snapshot)
+        for path in self.ledger_files:
+            if path in changed_paths and os.path.exists(path):
+                ledger = normalize_columns(pd.read_excel(path))
+                affected |= self.changed_agreements(path, ledger, snapshot)
+
+        if first_run:
+            save_snapshot(self.snapshot_path, snapshot)
+            logger.info("Snapshot of %d works taken; watching for changes.", len(master))
+            return
+        if not affected:
+            save_snapshot(self.snapshot_path, snapshot)
+            logger.info("No work orders changed.")
+            return
+
+        # Duplicates are judged against the whole master, not just the changed rows
+        keep, _ = find_duplicate_work_orders(master)
+        works = master[(keep & normalize_agreement_numbers(master['Agreement No.']).isin(affected)).values]
+        if works.empty:
+            save_snapshot(self.snapshot_path, snapshot)
+            logger.info("%d changed agreements are not in the master; nothing to regenerate.", len(affected))
+            return
+        # The new rows only enter the snapshot once their sheets are written
+        future = self.executor.submit(self.regenerate, works)
+        future.add_done_callback(lambda done: self.finish(done, snapshot))
+
+    def finish(self, future, snapshot):
+        """Done-callback of a regeneration: record the snapshot, or report the failure"""
+        error = future.exception()
+        if error is not None:
+            logger.error("Regeneration failed; the changes stay pending until the next save: %s", error,
+                         exc_info=error)
+            return
+        save_snapshot(self.snapshot_path, snapshot)
+
+    def regenerate(self, works):
+        """Render refund forms for just the changed works, with their SD totals from the ledgers"""
+        from amounts import read_sd_amounts
+        from form_export import export_forms
+        from security_refund_generator import split_data_into_batches
+        ledgers = [path for path in self.ledger_files if os.path.exists(path)]
+        if ledgers:
+            works, _ = read_sd_amounts(works, ledgers)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        for batch_data, batch_number in split_data_into_batches(works, 25):
+            output_base = os.path.join(self.output_dir, f"Security_Refund_Update_{timestamp}_{batch_number:02d}")
+            written = export_forms(batch_data, self.formats, output_base)
+            logger.info("Regenerated %d works: %s", len(batch_data), ', '.join(written.values()))
+
+    def run(self):
+        """Poll until interrupted"""
+        from form_export import available_formats
+        setup_logging()
+        self.formats = available_formats(self.formats)
+        if not self.formats:
+            logger.error("None of the requested formats can be written here; not watching.")
+            return False
+        os.makedirs(self.output_dir, exist_ok=True)
+        logger.info("Watching %s (Ctrl+C to stop)", ', '.join(self.watched_files))
+        try:
+            while True:
+                changed = self.poll()
+                if changed:
+                    logger.info("Change detected: %s", ', '.join(changed))
+                    self.process(changed)
+                time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            logger.info("Stopping watcher...")
+        finally:
+            self.executor.shutdown(wait=True)
+        return True
+
+
+def main(master_file='work_order_master.xlsx', ledger_files=('deductions.xlsx',), output_dir=DEFAULT_OUTPUT_DIR,
+         formats=DEFAULT_FORMATS):
+    return InputWatcher(master_file, ledger_files, output_dir, formats=formats).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""
+Memory-mapped snapshot of the work-order master and deduction ledgers
+The snapshot step parses the Excel files once and writes every column as a
+NumPy .npy file next to the master (in .sd_snapshot). Readers open them with
+mmap_mode='r', so any number of processes share the same pages from the OS
+cache instead of each parsing the workbook into a private DataFrame. Every
+ledger is its own table, and the normalized agreement keys of each table are
+stored with it, so reconcile_sd.read_deduction_ledgers reads a fresh snapshot
+without parsing or normalizing anything.
+
+    python work_order_snapshot.py work_order_master.xlsx deductions.xlsx
+"""
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from sd_logging import get_logger, setup_logging
+from work_orders import normalize_agreement_numbers, normalize_columns
+
+SNAPSHOT_DIRNAME = ".sd_snapshot"
+MANIFEST_FILENAME = "manifest.json"
+MASTER_SHEET = "Work Orders"
+AGREEMENT_KEYS_FILENAME = "agreement_keys.npy"
+
+logger = get_logger(__name__)
+
+
+def snapshot_dir_for(master_file):
+    """Snapshots live next to the master so every tool finds the same one"""
+    return os.path.join(os.path.dirname(os.path.abspath(master_file)), SNAPSHOT_DIRNAME)
+
+
+def source_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _write_column(folder, index, series):
+    """Save one column as .npy; text columns get a null mask when they have blanks
+
+    Numeric columns with blanks are stored as float64 with NaN, as read_excel
+    returns them, so amounts stay numbers. Text columns that also hold dates
+    (a date column typed partly as text in Excel) keep those cells in a
+    datetime64 array beside the text, NaT elsewhere, so frame() gives back the
+    same datetime objects as read_excel.
+    """
+    spec = {'name': str(series.name), 'file': f"col{index}.npy", 'nulls': None, 'dates': None}
+    if pd.api.types.is_bool_dtype(series) and not series.isna().any():
+        spec['kind'] = 'number'
+        values = series.to_numpy(dtype=bool)
+    elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        spec['kind'] = 'number'
+        values = series.to_numpy(dtype='float64', na_value=np.nan) if series.isna().any() else series.to_numpy()
+    elif pd.api.types.is_datetime64_any_dtype(series):
+        spec['kind'] = 'datetime'
+        values = series.to_numpy(dtype='datetime64[ns]')
+    else:
+        spec['kind'] = 'text'
+        nulls = series.isna().to_numpy()
+        values = np.array(series.astype(object).where(~nulls, '').map(str).tolist(), dtype=str)
+        if nulls.any():
+            spec['nulls'] = f"col{index}.nulls.npy"
+            np.save(os.path.join(folder, spec['nulls']), nulls)
+        dates = series.map(lambda value: isinstance(value, datetime)).to_numpy(dtype=bool)
+        if dates.any():
+            spec['dates'] = f"col{index}.dates.npy"
+            stamps = np.full(len(series), np.datetime64('NaT'), dtype='datetime64[ns]')
+            stamps[dates] = pd.to_datetime(series[dates].tolist()).to_numpy(dtype='datetime64[ns]')
+            np.save(os.path.join(folder, spec['dates']), stamps)
+    np.save(os.path.join(folder, spec['file']), values)
+    return spec
+
+
+def _write_table(folder, name, df):
+    """Columns plus the normalized agreement keys of one table"""
+    table_dir = os.path.join(folder, name)
+    os.makedirs(table_dir)
+    columns = [_write_column(table_dir, i, df[column]) for i, column in enumerate(df.columns)]
+    table = {'rows': len(df), 'columns': columns, 'index': None}
+    if 'Agreement No.' in df.columns:
+        keys = normalize_agreement_numbers(df['Agreement No.'])
+        np.save(os.path.join(table_dir, AGREEMENT_KEYS_FILENAME), np.array(keys.tolist(), dtype=str))
+        table['index'] = 'Agreement No.'
+    return table
+
+
+def build_snapshot(master_file='work_order_master.xlsx', ledger_files=(), sheet_name=MASTER_SHEET,
+                   snapshot_dir=None):
+    """Parse the master (and each ledger) and write a new snapshot version
+
+    Each build goes to its own version folder and the manifest is swapped in
+    last. The previous version is kept until the next build, so readers and
+    workers still using it are not disturbed; older versions are removed.
+    """
+    snapshot_dir = snapshot_dir or snapshot_dir_for(master_file)
+    version = time.strftime("v%Y%m%d_%H%M%S") + f"_{os.getpid()}"
+    folder = os.path.join(snapshot_dir, version)
+    os.makedirs(folder)
+
+    sources = {os.path.abspath(master_file): source_stamp(master_file)}
+    tables = {'master': _write_table(folder, 'master',
+                                     normalize_columns(pd.read_excel(master_file, sheet_name=sheet_name)))}
+    ledgers = {}
+    for number, path in enumerate(ledger_files, 1):
+        table = f"ledger{number}"
+        tables[table] = _write_table(folder, table, normalize_columns(pd.read_excel(path)))
+        sources[os.path.abspath(path)] = source_stamp(path)
+        ledgers[os.path.abspath(path)] = table
+
+    manifest = {'version': version, 'sheet_name': sheet_name, 'sources': sources, 'tables': tables,
+                'ledgers': ledgers}
+    with open(os.path.join(folder, MANIFEST_FILENAME), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2)
+    previous = WorkOrderSnapshot.open(snapshot_dir)
+    temp_path = os.path.join(snapshot_dir, MANIFEST_FILENAME + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temp_path, os.path.join(snapshot_dir, MANIFEST_FILENAME))
+
+    # The version the manifest pointed to until now stays: workers may still be
+    # handed SnapshotRows for it. Anything older goes (Windows refuses while mapped).
+    keep = {version, previous.version if previous else None}
+    for name in os.listdir(snapshot_dir):
+        if name.startswith('v') and name not in keep:
+            shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+    return WorkOrderSnapshot(snapshot_dir, manifest)
+
+
+class SnapshotRows(NamedTuple):
+    """Picklable reference to rows of a snapshot table, resolved inside the worker"""
+    snapshot_dir: str
+    version: str
+    table: str
+    positions: np.ndarray
+
+    def load(self):
+        return open_snapshot_version(self.snapshot_dir, self.version).frame(self.table, self.positions)
+
+
+class WorkOrderSnapshot:
+    """Read-only view over one snapshot version; columns are memory-mapped on first use"""
+
+    def __init__(self, snapshot_dir, manifest):
+        self.snapshot_dir = snapshot_dir
+        self.manifest = manifest
+        self.folder = os.path.join(snapshot_dir, manifest['version'])
+        self._arrays = {}
+
+    @classmethod
+    def open(cls, snapshot_dir):
+        """Current snapshot in snapshot_dir, or None when there is none"""
+        path = os.path.join(snapshot_dir, MANIFEST_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as file:
+            return cls(snapshot_dir, json.load(file))
+
+    @property
+    def version(self):
+        return self.manifest['version']
+
+    def is_fresh(self):
+        """True while every source file still has the size and mtime it was read with"""
+        try:
+            return all(source_stamp(path) == stamp for path, stamp in self.manifest['sources'].items())
+        except OSError:
+            return False
+
+    def covers(self, path, sheet_name=MASTER_SHEET):
+        return os.path.abspath(path) in self.manifest['sources'] and sheet_name == self.manifest['sheet_name']
+
+    def _array(self, table, filename):
+        key = (table, filename)
+        if key not in self._arrays:
+            self._arrays[key] = np.load(os.path.join(self.folder, table, filename), mmap_mode='r')
+        return self._arrays[key]
+
+    def columns(self, table='master'):
+        return [spec['name'] for spec in self.manifest['tables'][table]['columns']]
+
+    def column(self, name, table='master'):
+        """Zero-copy memory-mapped array of one column"""
+        spec = next(spec for spec in self.manifest['tables'][table]['columns'] if spec['name'] == name)
+        return self._array(table, spec['file'])
+
+    def frame(self, table='master', positions=None):
+        """DataFrame of a table (or of the rows at positions); only those rows are copied"""
+        rows = np.arange(self.manifest['tables'][table]['rows']) if positions is None else np.asarray(positions)
+        data = {}
+        for spec in self.manifest['tables'][table]['columns']:
+            values = self._array(table, spec['file'])[rows]
+            if spec['kind'] == 'text':
+                values = values.astype(object)
+                if spec['nulls']:
+                    values[self._array(table, spec['nulls'])[rows]] = np.nan
+                if spec.get('dates'):
+                    stamps = self._array(table, spec['dates'])[rows]
+                    dates = ~np.isnat(stamps)
+                    values[dates] = pd.DatetimeIndex(stamps[dates]).to_pydatetime()
+                data[spec['name']] = pd.Series(values, index=rows, dtype=object)
+            else:
+                data[spec['name']] = pd.Series(values, index=rows)
+        return pd.DataFrame(data, index=rows)
+
+    def agreement_keys(self, table='master'):
+        """Normalized agreement keys of a table, as normalize_agreement_numbers returns them"""
+        return pd.Series(self._array(table, AGREEMENT_KEYS_FILENAME).tolist(), dtype=str)
+
+    def rows_ref(self, positions, table='master'):
+        return SnapshotRows(self.snapshot_dir, self.version, table, np.asarray(positions))
+
+
+@lru_cache(maxsize=4)
+def open_snapshot_version(snapshot_dir, version):
+    """Per-process cache so a worker maps each snapshot version once"""
+    with open(os.path.join(snapshot_dir, version, MANIFEST_FILENAME), 'r', encoding='utf-8') as file:
+        return WorkOrderSnapshot(snapshot_dir, json.load(file))
+
+
+def load_fresh_snapshot(master_file, sheet_name=MASTER_SHEET):
+    """The master's snapshot if it is up to date with the Excel file, else None"""
+    snapshot = WorkOrderSnapshot.open(snapshot_dir_for(master_file))
+    if snapshot is None or not snapshot.covers(master_file, sheet_name) or not snapshot.is_fresh():
+        return None
+    return snapshot
+
+
+def load_fresh_ledger(ledger_file):
+    """(snapshot, table) holding a deduction ledger if that snapshot is up to date, else None
+
+    Looks in the snapshot next to the ledger, i.e. ledgers kept in the
+    master's folder and passed to the snapshot step.
+    """
+    snapshot = WorkOrderSnapshot.open(snapshot_dir_for(ledger_file))
+    if snapshot is None or not snapshot.is_fresh():
+        return None
+    table = snapshot.manifest.get('ledgers', {}).get(os.path.abspath(ledger_file))
+    return (snapshot, table) if table else None
+
+
+def main(master_file='work_order_master.xlsx', ledger_files=()):
+    setup_logging()
+    snapshot = build_snapshot(master_file, ledger_files)
+    tables = snapshot.manifest['tables']
+    logger.info("Snapshot %s written to '%s': %s", snapshot.version, snapshot.snapshot_dir,
+                ", ".join(f"{name} {table['rows']} rows" for name, table in tables.items()))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2], ledger_files=sys.argv[2:])
@@ -0,0 +1,323 @@
+"""
+Compact work-order records shared by all security refund generators
+Columns are resolved once per DataFrame and rows are built from column arrays,
+so generators never walk the master with iterrows()
+"""
+import difflib
+import re
+from typing import NamedTuple
+
+import pandas as pd
+
+
+class WorkOrder(NamedTuple):
+    """One work order row from the master (tuple-backed, no per-row dict)"""
+    contractor: object = ''
+    name_of_work: object = ''
+    agreement_no: object = ''
+    date_of_commencement: object = ''
+    stipulated_completion: object = ''
+    actual_completion: object = ''
+    sd_amount: object = ''
+
+
+# Record field -> column name in work_order_master.xlsx
+WORK_ORDER_COLUMNS = {
+    'contractor': 'Name of Contractor',
+    'name_of_work': 'Name of Work',
+    'agreement_no': 'Agreement No.',
+    'date_of_commencement': 'Date of Commencement',
+    'stipulated_completion': 'Stipulated date of Completion',
+    'actual_completion': 'Actual Date of Completion',
+    'sd_amount': 'SD Amount',
+}
+
+
+# Canonical column -> other spellings seen in masters, ledgers and 355.txt exports
+COLUMN_ALIASES = {
+    'Name of Contractor': ('Vendor', 'Contractor Name', 'Contractor'),
+    'Name of Work': ('WorkOrder Name', 'Name Of work', 'Work Name'),
+    'Agreement No.': ('Agreement No', 'Agreement Number', 'Agmt No'),
+    'Date of Commencement': ('Start Date',),
+    'Stipulated date of Completion': ('Comp Date',),
+    'Actual Date of Completion': ('Actual date of completion ACD', 'ACD'),
+    'SD Amount': ('Amount of Deposit', 'SD Total'),
+}
+
+REQUIRED_COLUMNS = ('Name of Contractor', 'Agreement No.')
+DATE_COLUMNS = ('Date of Commencement', 'Stipulated date of Completion', 'Actual Date of Completion')
+
+# e.g. "104/2020-21", "71014/2022-23", "35 of 2024-25"
+AGREEMENT_PATTERN = r'^\s*\d+\s*(?:/|of)\s*\d{4}-\d{2,4}\s*$'
+
+
+def _column_key(name):
+    """Spelling-insensitive key for a column header"""
+    return re.sub(r'[^a-z0-9]', '', str(name).casefold())
+
+
+_ALIAS_INDEX = {}
+for _canonical, _aliases in COLUMN_ALIASES.items():
+    for _alias in (_canonical,) + _aliases:
+        _ALIAS_INDEX[_column_key(_alias)] = _canonical
+
+
+def canonical_column_map(columns):
+    """Map input column headers to canonical names (first match wins)"""
+    mapping = {}
+    for column in columns:
+        canonical = _ALIAS_INDEX.get(_column_key(column))
+        if canonical and canonical not in mapping.values():
+            mapping[column] = canonical
+    return mapping
+
+
+def normalize_columns(df):
+    """Rename aliased columns to the canonical schema"""
+    mapping = {column: canonical for column, canonical in canonical_column_map(df.columns).items()
+               if column != canonical}
+    return df.rename(columns=mapping) if mapping else df
+
+
+def _blank_mask(series):
+    """True where a cell is missing or only whitespace"""
+    return series.isna() | series.astype(str).str.strip().eq('')
+
+
+def validate_work_orders(df):
+    """Check a work-order frame against the canonical schema, column by column
+    
+    Returns (normalized_df, missing_columns, issues) where issues is a
+    DataFrame with one line per bad cell: Row (Excel row number), Column,
+    Severity ('error' or 'warning'), Problem and Value.
+    """
+    df = normalize_columns(df)
+    missing_columns = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    excel_rows = pd.Series(range(2, len(df) + 2), index=df.index)  # header is row 1
+    found = []
+    
+    def report(mask, column, severity, problem):
+        if mask.any():
+            found.append(pd.DataFrame({
+                'Row': excel_rows[mask].values,
+                'Column': column,
+                'Severity': severity,
+                'Problem': problem,
+                'Value': df.loc[mask, column].astype(str).values,
+            }))
+    
+    for column in REQUIRED_COLUMNS:
+        if column in df.columns:
+            report(_blank_mask(df[column]), column, 'error', 'missing value')
+    
+    if 'Agreement No.' in df.columns:
+        agreements = df['Agreement No.']
+        bad_format = ~_blank_mask(agreements) & ~agreements.astype(str).str.match(AGREEMENT_PATTERN)
+        report(bad_format, 'Agreement No.', 'warning', 'unrecognized agreement number format')
+    
+    for column in DATE_COLUMNS:
+        if column in df.columns:
+            parsed = pd.to_datetime(df[column], format='%d/%m/%Y', errors='coerce')
+            report(parsed.isna() & ~_blank_mask(df[column]), column, 'warning', 'not a dd/mm/yyyy date')
+    
+    columns = ['Row', 'Column', 'Severity', 'Problem', 'Value']
+    issues = pd.concat(found, ignore_index=True).sort_values('Row', kind='stable') if found \
+        else pd.DataFrame(columns=columns)
+    return df, missing_columns, issues
+
+
+def extract_fiscal_years(agreements):
+    """Derive the fiscal year of every agreement number, vectorized
+    
+    "104/2020-21" -> "2020-21", "56/2020/21" -> "2020-21",
+    "12/023-24" -> "2023-24" (short start year that precedes the end year),
+    "72014/2022-23" -> "2022-23" (digits of the serial are never a year).
+    "104-21" is a serial and a suffix, not a fiscal year.
+    Unrecognized values become "Unknown".
+    """
+    text = agreements.fillna('').astype(str)
+    
+    # The start year must open the text or follow "/", "of" or a space (never a
+    # serial digit, as in "72014/2022-23"), and the end year must not be followed
+    # by another year part (the serial "2019" in "2019/2021-22")
+    full = text.str.extract(r'(?:^|(?<=/)|(?<=of)|(?<=\s))(?P<start>(?:19|20)\d{2})\s*[-/]\s*(?P<end>\d{2,4})\b'
+                            r'(?!\s*[-/]\s*\d)')
+    full_years = full['start'] + '-' + full['end'].str[-2:]
+    
+    # Typos such as "023-24" or "20221-22": accept a short year only when its last
+    # two start digits are the year before the end ("104-21" is a serial and a
+    # suffix, not a year); starts from 50 on are read as 19xx
+    short = text.str.extract(r'(?P<start>\d{2})\s*-\s*(?P<end>\d{2})\s*$')
+    start, end = pd.to_numeric(short['start']), pd.to_numeric(short['end'])
+    start_year = (start + 2000).where(start < 50, start + 1900)
+    short_years = start_year.astype('Int64').astype(str) + '-' + short['end']
+    short_years = short_years.where((start + 1) % 100 == end)
+    
+    return full_years.fillna(short_years).fillna('Unknown')
+
+
+def normalize_agreement_numbers(agreements):
+    """Comparable agreement keys: "104 / 2020-21", "104 of 2020-21" -> "104/2020-21"
+    
+    Leading zeros of the serial are dropped and the fiscal year is written
+    in its short form, so "0104/2020-2021" matches too.
+    """
+    text = agreements.fillna('').astype(str).str.strip().str.casefold()
+    serial = text.str.extract(r'^(\d+)', expand=False).str.lstrip('0').replace('', '0')
+    fiscal_years = extract_fiscal_years(agreements)
+    keys = serial + '/' + fiscal_years
+    # Fall back to the squeezed text when either part is missing
+    fallback = text.str.replace(r'\s+', '', regex=True)
+    return keys.where(serial.notna() & (fiscal_years != 'Unknown'), fallback)
+
+
+def normalize_contractor_names(names):
+    """Comparable contractor keys: drop the M/s prefix, case and extra spacing"""
+    text = names.fillna('').astype(str).str.strip()
+    text = text.str.replace(r'^m/s\.?\s*', '', case=False, regex=True)
+    return text.str.split().str.join(' ').str.casefold()
+
+
+def normalize_work_names(names):
+    """Comparable name-of-work keys: case, punctuation and spacing ignored"""
+    text = names.fillna('').astype(str).str.casefold()
+    return text.str.replace(r'[^a-z0-9]+', ' ', regex=True).str.strip()
+
+
+# Words dropped from the loose (near-duplicate) keys
+CONTRACTOR_NOISE_WORDS = r'\b(?:shri|sh|smt|pvt|private|ltd|limited|co|company|and|firm)\b'
+WORK_NOISE_WORDS = frozenset(('of', 'in', 'at', 'the', 'for', 'and', 'to', 'work', 'works'))
+RECOGNIZED_AGREEMENT_KEY = r'^\d+/\d{4}-\d{2}$'
+NEAR_DUPLICATE_RATIO = 0.85  # difflib similarity of two loose name-of-work keys
+
+DUPLICATE_REPORT_COLUMNS = ['Row', 'First Row', 'Kind', 'Action', 'Agreement No.', 'Name of Contractor',
+                            'Name of Work']
+
+
+def loose_contractor_keys(names):
+    """Contractor keys that also ignore titles, Pvt/Ltd, '&' and all punctuation"""
+    text = normalize_contractor_names(names).str.replace(CONTRACTOR_NOISE_WORDS, ' ', regex=True)
+    return text.str.replace(r'[^a-z0-9]+', '', regex=True)
+
+
+def loose_work_keys(names):
+    """Name-of-work keys that also ignore filler words and word order"""
+    return normalize_work_names(names).str.split().map(
+        lambda words: ' '.join(sorted(set(words) - WORK_NOISE_WORDS)))
+
+
+def _near_duplicates(bucket_keys, texts, candidates, excel_rows):
+    """Rows whose text is NEAR_DUPLICATE_RATIO-similar to an earlier row of the same bucket
+    
+    Only rows sharing a bucket key are compared and buckets hold a handful of
+    rows (one agreement of one contractor), so this stays linear in practice.
+    Returns (mask, first_rows).
+    """
+    near = pd.Series(False, index=texts.index)
+    first = pd.Series(0, index=texts.index)
+    keys = bucket_keys[candidates]
+    for positions in keys.groupby(keys.values, sort=False).indices.values():
+        if len(positions) < 2:
+            continue
+        labels = keys.index[positions]
+        kept = [labels[0]]
+        for label in labels[1:]:
+            match = next((earlier for earlier in kept if difflib.SequenceMatcher(
+                None, texts[earlier], texts[label]).ratio() >= NEAR_DUPLICATE_RATIO), None)
+            if match is None:
+                kept.append(label)
+            else:
+                near[label] = True
+                first[label] = excel_rows[match]
+    return near, first
+
+
+def find_duplicate_work_orders(df):
+    """Hash-index the work orders on (agreement no., contractor, name of work)
+    
+    Finds, in one pass per key:
+      exact duplicate     - same normalized agreement, contractor and work (dropped)
+      near duplicate      - same agreement and contractor (ignoring titles,
+                            Pvt/Ltd and punctuation) with a name of work that
+                            differs only by typos or word order (dropped)
+      agreement conflict  - one agreement number on different contractors or works (kept)
+      repeated work       - same contractor and work under another agreement number (kept)
+    
+    Returns (keep, conflicts): keep is a boolean Series, False for the later
+    rows of each duplicate group; conflicts has one line per reported row
+    with the Excel row it repeats or clashes with (First Row).
+    """
+    blank = pd.Series('', index=df.index)
+    agreements = df['Agreement No.'] if 'Agreement No.' in df.columns else blank
+    contractors = df['Name of Contractor'] if 'Name of Contractor' in df.columns else blank
+    works = df['Name of Work'] if 'Name of Work' in df.columns else blank
+    excel_rows = pd.Series(range(2, len(df) + 2), index=df.index)  # header is row 1
+    
+    def first_rows(keys):
+        return excel_rows.groupby(keys.values, sort=False).transform('first')
+    
+    agreement_keys = normalize_agreement_numbers(agreements)
+    exact_keys = agreement_keys + '|' + normalize_contractor_names(contractors) + '|' + normalize_work_names(works)
+    exact = exact_keys.duplicated()
+    
+    contractor_keys = loose_contractor_keys(contractors)
+    work_keys = loose_work_keys(works)
+    bucket_keys = agreement_keys + '|' + contractor_keys
+    near, near_first = _near_duplicates(bucket_keys, work_keys, ~exact & (agreement_keys != ''), excel_rows)
+    keep = ~(exact | near)
+    found = [
+        (exact, first_rows(exact_keys), 'exact duplicate', 'dropped'),
+        (near, near_first, 'near duplicate', 'dropped'),
+    ]
+    
+    # Among the rows that stay: agreement numbers shared by different works, and
+    # the same work under several agreement numbers
+    recognized = keep & agreement_keys.str.match(RECOGNIZED_AGREEMENT_KEY)
+    shared = agreement_keys.where(recognized)
+    clash = recognized & shared.duplicated() & shared.notna()
+    found.append((clash, first_rows(shared), 'agreement conflict', 'kept'))
+    
+    identified = keep & (work_keys != '') & (contractor_keys != '')
+    work_identity = (contractor_keys + '|' + work_keys).where(identified)
+    repeated = identified & work_identity.duplicated() & ~clash
+    found.append((repeated, first_rows(work_identity), 'repeated work', 'kept'))
+    
+    reports = [pd.DataFrame({
+        'Row': excel_rows[mask].values,
+        'First Row': first[mask].astype(int).values,
+        'Kind': kind,
+        'Action': action,
+        'Agreement No.': agreements[mask].astype(str).values,
+        'Name of Contractor': contractors[mask].astype(str).values,
+        'Name of Work': works[mask].astype(str).values,
+    }) for mask, first, kind, action in found if mask.any()]
+    conflicts = pd.concat(reports, ignore_index=True).sort_values('Row', kind='stable') if reports \
+        else pd.DataFrame(columns=DUPLICATE_REPORT_COLUMNS)
+    return keep, conflicts
+
+
+def parse_amounts(values):
+    """Rupee amounts as floats: "29,280\xa0", "₹ 9038" and 9038 all parse; blanks become 0"""
+    text = values.astype(str).str.replace(r'[^0-9.\-]', '', regex=True)
+    return pd.to_numeric(text, errors='coerce').fillna(0.0)
+
+
+def resolve_columns(df):
+    """Map each WorkOrder field to its DataFrame column (None when missing)"""
+    mapping = {canonical: column for column, canonical in canonical_column_map(df.columns).items()}
+    return {field: mapping.get(canonical) for field, canonical in WORK_ORDER_COLUMNS.items()}
+
+
+def _column_values(df, column):
+    """Column as a plain list with missing values replaced by ''"""
+    series = df[column]
+    return series.astype(object).where(series.notna(), '').tolist()
+
+
+def iter_work_orders(df, columns=None):
+    """Yield one WorkOrder per DataFrame row, in row order"""
+    columns = columns or resolve_columns(df)
+    row_count = len(df)
+    arrays = [_column_values(df, columns[field]) if columns[field] else [''] * row_count
+              for field in WorkOrder._fields]
+    return map(WorkOrder._make, zip(*arrays))
@@ -0,0 +1,192 @@
+"""
+Size-optimized refund workbooks
+openpyxl writes every text cell as an inline string, so a 25-sheet batch
+carries 25 copies of each label and certification line, and the layout code
+leaves row and column records past the printed form. compact_package rewrites
+a finished xlsx so that:
+
+- every text cell points into one shared string table (each distinct text is
+  stored once per workbook),
+- empty rows and column widths beyond both the cells and the print area are
+  dropped, and
+- the package is deflated at the highest compression level.
+
+Cell values, styles, merges and print setup are unchanged.
+
+    python xlsx_compact.py [DIR]    # compact every workbook in DIR in place
+"""
+import io
+import os
+import re
+import zipfile
+
+from parallel_workbook import print_areas
+from xlsx_patcher import CELL_RE, ROW_RE, column_index, get_attr, set_attr, sheet_parts, split_ref
+from sd_logging import get_logger, setup_logging
+
+logger = get_logger(__name__)
+
+COMPRESS_LEVEL = 9
+SHARED_STRINGS_PART = 'xl/sharedStrings.xml'
+SHARED_STRINGS_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"
+SHARED_STRINGS_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+
+INLINE_TEXT_RE = re.compile(r'<is>(.*?)</is>', re.S)
+COL_RE = re.compile(r'<col\b[^>]*?/>')
+
+
+class SharedStrings:
+    """Shared string table under construction; items are the raw <si> contents"""
+
+    def __init__(self):
+        self.index = {}
+        self.count = 0
+
+    def add(self, item_xml):
+        self.count += 1
+        return self.index.setdefault(item_xml, len(self.index))
+
+    def render(self):
+        items = ''.join(f'<si>{item}</si>' for item in self.index)
+        return (f'<sst xmlns="{MAIN_NS}" count="{self.count}" uniqueCount="{len(self.index)}">'
+                f'{items}</sst>')
+
+
+def read_string_items(archive):
+    """Raw <si> contents of an existing shared string table (empty when there is none)"""
+    try:
+        xml = archive.read(SHARED_STRINGS_PART).decode('utf-8')
+    except KeyError:
+        return []
+    return re.findall(r'<si>(.*?)</si>', xml, re.S)
+
+
+def share_cell(cell_xml, strings, old_items):
+    """Cell rewritten against the new table; '' drops an empty, unstyled cell"""
+    cell_type = get_attr(cell_xml, 't')
+    head = cell_xml.split('>', 1)[0].rstrip('/').rstrip()
+    if cell_type == 'inlineStr':
+        text = INLINE_TEXT_RE.search(cell_xml)
+        if text is None or not re.search(r'<t\b[^>]*>[^<]', text.group(1)):
+            # openpyxl writes '' as an inline string with no text: keep only the style
+            head = re.sub(r'\st="inlineStr"', '', head)
+            return f'{head}/>' if get_attr(cell_xml, 's') else ''
+        index = strings.add(text.group(1))
+    elif cell_type == 's':
+        value = re.search(r'<v>(\d+)</v>', cell_xml)
+        if value is None:
+            return cell_xml
+        index = strings.add(old_items[int(value.group(1))])
+    else:
+        return cell_xml
+    return f'{set_attr(head + ">", "t", "s")}<v>{index}</v></c>'
+
+
+def compact_sheet_xml(xml, strings, old_items, area=None):
+    """Share the strings of one worksheet and trim its trailing row / column records"""
+    last_row, last_column = 0, 0
+    if area:
+        column, row = split_ref(area.split(':')[-1].replace('$', ''))
+        last_row, last_column = row, column_index(column)
+
+    def compact_row(match):
+        nonlocal last_row, last_column
+        cells = ''.join(share_cell(cell, strings, old_items) for cell in CELL_RE.findall(match.group(0)))
+        for ref in re.findall(r'<c\b[^>]*?\sr="([A-Z]+\d+)"', cells):
+            column, row = split_ref(ref)
+            last_row, last_column = max(last_row, row), max(last_column, column_index(column))
+        head = match.group(0).split('>', 1)[0].rstrip('/').rstrip()
+        return (f'{head}>{cells}</row>' if cells else f'{head}/>'), cells
+
+    sheet_data = re.search(r'<sheetData>(.*?)</sheetData>', xml, re.S)
+    if sheet_data is None:
+        return xml
+    rows = [compact_row(match) for match in ROW_RE.finditer(sheet_data.group(1))]
+    # Rows past the last cell and the print area only carry a height
+    rows = [row_xml for row_xml, cells in rows if cells or int(get_attr(row_xml, 'r')) <= last_row]
+    xml = xml[:sheet_data.start(1)] + ''.join(rows) + xml[sheet_data.end(1):]
+
+    def trim_col(match):
+        col = match.group(0)
+        if int(get_attr(col, 'min')) > last_column:
+            return ''
+        if int(get_attr(col, 'max')) > last_column:
+            return set_attr(col, 'max', str(last_column))
+        return col
+
+    if last_column:
+        xml = COL_RE.sub(trim_col, xml)
+        xml = re.sub(r'<cols>\s*</cols>', '', xml)
+    return xml
+
+
+def compact_package(data):
+    """Size-optimized copy of an xlsx package (bytes in, bytes out)"""
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        old_items = read_string_items(archive)
+        workbook = archive.read('xl/workbook.xml').decode('utf-8')
+        areas = print_areas(workbook)
+        strings = SharedStrings()
+        members = {info.filename: archive.read(info.filename) for info in archive.infolist()}
+        for local_id, (_, part) in enumerate(sheet_parts(archive)):
+            members[part] = compact_sheet_xml(members[part].decode('utf-8'), strings, old_items,
+                                              areas.get(str(local_id))).encode('utf-8')
+
+    if strings.index or SHARED_STRINGS_PART in members:
+        rels = members['xl/_rels/workbook.xml.rels'].decode('utf-8')
+        if SHARED_STRINGS_TYPE not in rels:
+            ids = [int(n) for n in re.findall(r'\sId="rId(\d+)"', rels)]
+            relationship = (f'<Relationship Type="{SHARED_STRINGS_TYPE}" Target="sharedStrings.xml" '
+                            f'Id="rId{max(ids, default=0) + 1}"/>')
+            members['xl/_rels/workbook.xml.rels'] = rels.replace(
+                '</Relationships>', relationship + '</Relationships>').encode('utf-8')
+        types = members['[Content_Types].xml'].decode('utf-8')
+        if SHARED_STRINGS_CONTENT_TYPE not in types:
+            override = (f'<Override PartName="/{SHARED_STRINGS_PART}" '
+                        f'ContentType="{SHARED_STRINGS_CONTENT_TYPE}"/>')
+            members['[Content_Types].xml'] = types.replace('</Types>', override + '</Types>').encode('utf-8')
+        members[SHARED_STRINGS_PART] = strings.render().encode('utf-8')
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as package:
+        for name, member in members.items():
+            package.writestr(name, member)
+    # A single-sheet workbook has little to share; never hand back a larger file
+    return buffer.getvalue() if buffer.tell() < len(data) else data
+
+
+def save_compact(workbook, path):
+    """Save an openpyxl Workbook or AssembledWorkbook to path in the compact form"""
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    with open(path, 'wb') as file:
+        file.write(compact_package(buffer.getvalue()))
+
+
+def compact_workbook(path):
+    """Compact one existing xlsx in place (via a temp file); returns (bytes before, bytes after)"""
+    with open(path, 'rb') as file:
+        data = file.read()
+    compacted = compact_package(data)
+    with open(path + '.tmp', 'wb') as file:
+        file.write(compacted)
+    os.replace(path + '.tmp', path)
+    return len(data), len(compacted)
+
+
+def main(target_dir):
+    setup_logging()
+    count, before, after = 0, 0, 0
+    for folder, _, names in os.walk(target_dir):
+        for name in sorted(names):
+            if name.endswith('.xlsx') and not name.startswith('~$'):
+                old_size, new_size = compact_workbook(os.path.join(folder, name))
+                logger.debug("Compacted: %s (%d -> %d bytes)", name, old_size, new_size)
+                count, before, after = count + 1, before + old_size, after + new_size
+    logger.info("Compacted %d workbooks in '%s': %.1f KB -> %.1f KB", count, target_dir, before / 1024, after / 1024)
+
+
+if __name__ == '__main__':
+    import sys
+    main(sys.argv[1] if len(sys.argv) > 1 else '.')
@@ -0,0 +1,367 @@
+"""
+Patch refund workbooks in place at the XML level
+Applies the same fixed layout repairs as update_existing_workbooks.fix_workbook
+(A20:B26 borders, row 32 height, no borders in the certificate block or at A4,
+A4 one-page print setup) by editing only the worksheet parts, styles.xml and
+workbook.xml inside the xlsx zip. Every other member keeps its content (it is
+decompressed and compressed again, so the zip itself is not byte-identical),
+and nothing the openpyxl object model does not understand is lost.
+"""
+import os
+import re
+import zipfile
+from xml.sax.saxutils import escape, unescape
+
+from print_layout import PAGE_SETUP, PRINT_AREA_PADDING, PRINT_LAST_COLUMN, PRINT_MARGINS
+from sd_logging import get_logger, setup_logging
+
+logger = get_logger(__name__)
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+THIN_BORDER_XML = ('<border><left style="thin"/><right style="thin"/><top style="thin"/>'
+                   '<bottom style="thin"/><diagonal/></border>')
+EMPTY_BORDER_XML = '<border><left/><right/><top/><bottom/><diagonal/></border>'
+
+TABLE_BORDER_CELLS = [f"{col}{row}" for row in range(20, 27) for col in ("A", "B")]
+CERT_COLUMNS = ("A", "B", "C", "D", "E")
+CERT_MARKER = "Certified That:-"
+TALL_ROW, TALL_ROW_HEIGHT = 32, 40
+
+# Worksheet child elements in schema order; new elements are inserted before
+# the first existing element that must follow them
+WORKSHEET_ORDER = (
+    'sheetPr', 'dimension', 'sheetViews', 'sheetFormatPr', 'cols', 'sheetData', 'sheetCalcPr',
+    'sheetProtection', 'protectedRanges', 'scenarios', 'autoFilter', 'sortState', 'dataConsolidate',
+    'customSheetViews', 'mergeCells', 'phoneticPr', 'conditionalFormatting', 'dataValidations',
+    'hyperlinks', 'printOptions', 'pageMargins', 'pageSetup', 'headerFooter', 'rowBreaks', 'colBreaks',
+    'customProperties', 'cellWatches', 'ignoredErrors', 'smartTags', 'drawing', 'legacyDrawing',
+    'legacyDrawingHF', 'picture', 'oleObjects', 'controls', 'webPublishItems', 'tableParts', 'extLst',
+)
+
+ROW_RE = re.compile(r'<row\b[^>]*?(?:/>|>.*?</row>)', re.S)
+CELL_RE = re.compile(r'<c\b[^>]*?(?:/>|>.*?</c>)', re.S)
+XF_RE = re.compile(r'<xf\b[^>]*?(?:/>|>.*?</xf>)', re.S)
+BORDER_RE = re.compile(r'<border\b[^>]*?(?:/>|>.*?</border>)', re.S)
+
+
+# --- small XML string helpers -------------------------------------------------
+
+def get_attr(tag_xml, name):
+    match = re.search(r'\s%s="([^"]*)"' % re.escape(name), tag_xml.split('>', 1)[0])
+    return match.group(1) if match else None
+
+
+def set_attr(tag_xml, name, value):
+    """Set an attribute on the opening tag of tag_xml"""
+    head, sep, rest = tag_xml.partition('>')
+    pattern = r'(\s%s=")[^"]*(")' % re.escape(name)
+    if re.search(pattern, head):
+        head = re.sub(pattern, lambda m: m.group(1) + value + m.group(2), head, count=1)
+    else:
+        closing = '/' if head.endswith('/') else ''
+        head = head[:-1] if closing else head
+        head = f'{head.rstrip()} {name}="{value}"{closing}'
+    return head + sep + rest
+
+
+def column_index(letters):
+    index = 0
+    for char in letters:
+        index = index * 26 + ord(char) - 64
+    return index
+
+
+def split_ref(ref):
+    match = re.match(r'([A-Z]+)(\d+)$', ref)
+    return match.group(1), int(match.group(2))
+
+
+def insert_element(xml, tag, element_xml):
+    """Insert a worksheet child element at its schema position"""
+    following = WORKSHEET_ORDER[WORKSHEET_ORDER.index(tag) + 1:]
+    positions = [m.start() for name in following for m in [re.search(r'<%s\b' % name, xml)] if m]
+    position = min(positions) if positions else xml.rindex('</worksheet>')
+    return xml[:position] + element_xml + xml[position:]
+
+
+def replace_or_insert(xml, tag, element_xml):
+    pattern = re.compile(r'<%s\b[^>]*?(?:/>|>.*?</%s>)' % (tag, tag), re.S)
+    if pattern.search(xml):
+        return pattern.sub(lambda m: element_xml, xml, count=1)
+    return insert_element(xml, tag, element_xml)
+
+
+# --- styles.xml -----------------------------------------------------------------
+
+class StylePatcher:
+    """Adds border styles once and derives cell formats that differ only in border"""
+
+    def __init__(self, styles_xml):
+        self.xml = styles_xml
+        self.borders = BORDER_RE.findall(self._section('borders'))
+        self.xfs = XF_RE.findall(self._section('cellXfs'))
+        self.new_borders = []
+        self.new_xfs = []
+        self.derived = {}
+
+    def _section(self, name):
+        match = re.search(r'<%s\b[^>]*>(.*?)</%s>' % (name, name), self.xml, re.S)
+        return match.group(1) if match else ''
+
+    @staticmethod
+    def _border_key(border_xml):
+        """Comparable form: self-closing tags tightened and an empty diagonal dropped"""
+        return re.sub(r'<diagonal/>', '', re.sub(r'\s+/>', '/>', border_xml))
+
+    def border_id(self, border_xml):
+        """Index of an equivalent border, appending it once if missing"""
+        wanted = self._border_key(border_xml)
+        for index, existing in enumerate(self.borders + self.new_borders):
+            if self._border_key(existing) == wanted:
+                return index
+        self.new_borders.append(border_xml)
+        return len(self.borders) + len(self.new_borders) - 1
+
+    def with_border(self, style_index, border_id):
+        """Cell format index equal to style_index except for its border"""
+        key = (style_index, border_id)
+        if key not in self.derived:
+            base = (self.xfs + self.new_xfs)[style_index]
+            if get_attr(base, 'borderId') == str(border_id):
+                self.derived[key] = style_index
+            else:
+                xf = set_attr(set_attr(base, 'borderId', str(border_id)), 'applyBorder', '1')
+                self.new_xfs.append(xf)
+                self.derived[key] = len(self.xfs) + len(self.new_xfs) - 1
+        return self.derived[key]
+
+    def render(self):
+        xml = self.xml
+        for section, items, added in (('borders', self.borders, self.new_borders),
+                                      ('cellXfs', self.xfs, self.new_xfs)):
+            if not added:
+                continue
+            pattern = re.compile(r'(<%s\b[^>]*>)(.*?)(</%s>)' % (section, section), re.S)
+            xml = pattern.sub(lambda m: set_attr(m.group(1), 'count', str(len(items) + len(added)))
+                              + m.group(2) + ''.join(added) + m.group(3), xml, count=1)
+        return xml
+
+
+# --- worksheet parts ----------------------------------------------------------------
+
+def read_shared_strings(archive):
+    """Shared string table as a list of plain strings"""
+    try:
+        xml = archive.read('xl/sharedStrings.xml').decode('utf-8')
+    except KeyError:
+        return []
+    return [unescape(''.join(re.findall(r'<t\b[^>]*>(.*?)</t>', si, re.S)))
+            for si in re.findall(r'<si>(.*?)</si>', xml, re.S)]
+
+
+def cell_text(cell_xml, shared_strings):
+    """Text of a string cell (shared or inline), else None"""
+    cell_type = get_attr(cell_xml, 't')
+    if cell_type == 's':
+        value = re.search(r'<v>(\d+)</v>', cell_xml)
+        return shared_strings[int(value.group(1))] if value else None
+    if cell_type == 'inlineStr':
+        return unescape(''.join(re.findall(r'<t\b[^>]*>(.*?)</t>', cell_xml, re.S)))
+    return None
+
+
+def cell_has_value(cell_xml):
+    return '<v>' in cell_xml or '<v ' in cell_xml or '<is>' in cell_xml or '<f>' in cell_xml
+
+
+class SheetPatcher:
+    """Row/cell view over one worksheet part that can restyle cells and rows"""
+
+    def __init__(self, xml, shared_strings):
+        self.xml = xml
+        self.shared_strings = shared_strings
+        data = re.search(r'<sheetData\s*/>|<sheetData\b[^>]*>(.*?)</sheetData>', xml, re.S)
+        self.data_span = data.span()
+        self.rows = {}
+        for row_xml in ROW_RE.findall(data.group(1) or ''):
+            number = int(get_attr(row_xml, 'r'))
+            cells = {get_attr(c, 'r'): c for c in CELL_RE.findall(row_xml)}
+            head = re.match(r'<row\b[^>]*?/?>', row_xml).group(0)
+            self.rows[number] = [head.replace('/>', '>') if head.endswith('/>') else head, cells]
+
+    def scan(self):
+        """(certificate start row, last row with a value in column A, max row)"""
+        cert_start, last_row = None, 0
+        for number in sorted(self.rows):
+            cell = self.rows[number][1].get(f'A{number}')
+            if cell is None or not cell_has_value(cell):
+                continue
+            last_row = number
+            text = cell_text(cell, self.shared_strings)
+            if cert_start is None and text and text.strip().startswith(CERT_MARKER):
+                cert_start = number
+        return cert_start, last_row, max(self.rows, default=0)
+
+    def restyle(self, ref, styles, border_id, create=True):
+        column, number = split_ref(ref)
+        row = self.rows.get(number)
+        if row is None:
+            if not create:
+                return
+            row = self.rows[number] = [f'<row r="{number}">', {}]
+        cell = row[1].get(ref)
+        if cell is None:
+            if not create:
+                return
+            cell = f'<c r="{ref}"/>'
+        style = int(get_attr(cell, 's') or 0)
+        row[1][ref] = set_attr(cell, 's', str(styles.with_border(style, border_id)))
+
+    def set_row_height(self, number, height):
+        row = self.rows.setdefault(number, [f'<row r="{number}">', {}])
+        row[0] = set_attr(set_attr(row[0], 'ht', str(height)), 'customHeight', '1')
+
+    def render(self):
+        parts = []
+        for number in sorted(self.rows):
+            head, cells = self.rows[number]
+            ordered = sorted(cells.values(), key=lambda c: column_index(split_ref(get_attr(c, 'r'))[0]))
+            parts.append(head + ''.join(ordered) + '</row>' if ordered else head[:-1] + '/>')
+        start, end = self.data_span
+        return self.xml[:start] + '<sheetData>' + ''.join(parts) + '</sheetData>' + self.xml[end:]
+
+
+def apply_page_settings(xml):
+    """A4 portrait, fit to one page, centred, with the shared margins"""
+    margins = PRINT_MARGINS
+    xml = replace_or_insert(xml, 'pageMargins', (
+        f'<pageMargins left="{margins.left}" right="{margins.right}" top="{margins.top}" '
+        f'bottom="{margins.bottom}" header="{margins.header}" footer="{margins.footer}"/>'))
+
+    options = re.search(r'<printOptions\b[^>]*/?>', xml)
+    if options:
+        xml = xml.replace(options.group(0), set_attr(options.group(0), 'horizontalCentered', '1'), 1)
+    else:
+        xml = insert_element(xml, 'printOptions', '<printOptions horizontalCentered="1"/>')
+
+    setup = re.search(r'<pageSetup\b[^>]*/?>', xml)
+    setup_tag = setup.group(0) if setup else '<pageSetup/>'
+    for name, value in PAGE_SETUP.items():
+        setup_tag = set_attr(setup_tag, name, str(value))
+    xml = xml.replace(setup.group(0), setup_tag, 1) if setup else insert_element(xml, 'pageSetup', setup_tag)
+
+    # Fit-to-page switch lives in sheetPr/pageSetUpPr (last child of sheetPr)
+    sheet_pr = re.search(r'<sheetPr\b[^>]*?(?:/>|>.*?</sheetPr>)', xml, re.S)
+    if not sheet_pr:
+        return insert_element(xml, 'sheetPr', '<sheetPr><pageSetUpPr fitToPage="1"/></sheetPr>')
+    block = sheet_pr.group(0)
+    page_pr = re.search(r'<pageSetUpPr\b[^>]*/>', block)
+    if page_pr:
+        new_block = block.replace(page_pr.group(0), set_attr(page_pr.group(0), 'fitToPage', '1'))
+    elif block.endswith('/>'):
+        new_block = block[:-2].rstrip() + '><pageSetUpPr fitToPage="1"/></sheetPr>'
+    else:
+        new_block = block[:-len('</sheetPr>')] + '<pageSetUpPr fitToPage="1"/></sheetPr>'
+    return xml.replace(block, new_block, 1)
+
+
+def patch_sheet_xml(xml, styles, shared_strings):
+    """Apply the layout repairs to one worksheet part; returns (xml, last column-A row)"""
+    sheet = SheetPatcher(xml, shared_strings)
+    thin_id = styles.border_id(THIN_BORDER_XML)
+    empty_id = styles.border_id(EMPTY_BORDER_XML)
+
+    # 1) Thin borders for A20:B26
+    for ref in TABLE_BORDER_CELLS:
+        sheet.restyle(ref, styles, thin_id)
+
+    # 2) Tall row 32
+    sheet.set_row_height(TALL_ROW, TALL_ROW_HEIGHT)
+
+    # 3) No borders in the certificate block; 4) none at A4
+    cert_start, last_row, max_row = sheet.scan()
+    if cert_start:
+        for number in range(cert_start, min(cert_start + 12, max_row + 1)):
+            for column in CERT_COLUMNS:
+                sheet.restyle(f'{column}{number}', styles, empty_id, create=False)
+    sheet.restyle('A4', styles, empty_id, create=False)
+
+    # 5) Print settings
+    return apply_page_settings(sheet.render()), last_row
+
+
+# --- workbook ------------------------------------------------------------------
+
+def sheet_parts(archive):
+    """[(sheet name, part path)] in workbook order"""
+    workbook = archive.read('xl/workbook.xml').decode('utf-8')
+    rels = archive.read('xl/_rels/workbook.xml.rels').decode('utf-8')
+    targets = {get_attr(rel, 'Id'): get_attr(rel, 'Target') for rel in re.findall(r'<Relationship\b[^>]*>', rels)}
+    parts = []
+    for sheet in re.findall(r'<sheet\b[^>]*>', workbook):
+        target = targets[get_attr(sheet, 'r:id')]
+        path = target.lstrip('/') if target.startswith('/') else 'xl/' + target
+        parts.append((unescape(get_attr(sheet, 'name'), {'&quot;': '"'}), path))
+    return parts
+
+
+def set_print_areas(workbook_xml, print_areas):
+    """Replace the _xlnm.Print_Area defined name of each patched sheet"""
+    names = re.search(r'<definedNames>(.*?)</definedNames>|<definedNames\s*/>', workbook_xml, re.S)
+    existing = re.findall(r'<definedName\b[^>]*>.*?</definedName>', names.group(1) or '', re.S) if names else []
+    kept = [d for d in existing
+            if not (get_attr(d, 'name') == '_xlnm.Print_Area' and get_attr(d, 'localSheetId') in print_areas)]
+    for sheet_id, (sheet_name, area) in sorted(print_areas.items(), key=lambda item: int(item[0])):
+        quoted = "'%s'" % sheet_name.replace("'", "''")
+        kept.append(f'<definedName name="_xlnm.Print_Area" localSheetId="{sheet_id}">'
+                    f'{escape(quoted)}!{area}</definedName>')
+    block = '<definedNames>' + ''.join(kept) + '</definedNames>'
+    if names:
+        return workbook_xml[:names.start()] + block + workbook_xml[names.end():]
+    return workbook_xml.replace('</sheets>', '</sheets>' + block, 1)
+
+
+def patch_workbook(path, output_path=None):
+    """Patch one xlsx; writes to output_path (default: in place via a temp file)
+
+    Members other than the sheets, styles.xml and workbook.xml are rewritten
+    with the same content and compression method.
+    """
+    output_path = output_path or path
+    temp_path = output_path + '.tmp'
+    with zipfile.ZipFile(path) as archive:
+        shared_strings = read_shared_strings(archive)
+        styles = StylePatcher(archive.read('xl/styles.xml').decode('utf-8'))
+        patched = {}
+        print_areas = {}
+        for sheet_id, (sheet_name, part) in enumerate(sheet_parts(archive)):
+            xml, last_row = patch_sheet_xml(archive.read(part).decode('utf-8'), styles, shared_strings)
+            patched[part] = xml.encode('utf-8')
+            if last_row:
+                area = f'$A$1:${PRINT_LAST_COLUMN}${last_row + PRINT_AREA_PADDING}'
+                print_areas[str(sheet_id)] = (sheet_name, area)
+        patched['xl/styles.xml'] = styles.render().encode('utf-8')
+        patched['xl/workbook.xml'] = set_print_areas(archive.read('xl/workbook.xml').decode('utf-8'),
+                                                     print_areas).encode('utf-8')
+
+        with zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_DEFLATED) as target:
+            for info in archive.infolist():
+                data = patched.get(info.filename)
+                target.writestr(info, data if data is not None else archive.read(info.filename))
+    os.replace(temp_path, output_path)
+
+
+def main(target_dir):
+    setup_logging()
+    count = 0
+    for name in sorted(os.listdir(target_dir)):
+        if name.endswith('.xlsx') and not name.startswith('~$'):
+            patch_workbook(os.path.join(target_dir, name))
+            logger.debug("Patched: %s", name)
+            count += 1
+    logger.info("Patched %d workbooks in '%s'", count, target_dir)
+
+
+if __name__ == '__main__':
+    import sys
+    main(sys.argv[1] if len(sys.argv) > 1 else '.')